@@ -1,23 +1,35 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import requests
+import os
+import sys
+
+# Relay address and connection handling come from the shared client (relay/config.json)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "encryption"))
+from relay_client import relay
 
-RELAY_SERVER = "https://192.168.0.26:5000"
 ADMIN_AUTH = ("admin", "admin123")  # Replace for production use
 
 
-def fetch_logs():
+def fetch_logs(user=None, cursor=None):
+    """Fetch one newest-first page of logs. Returns (logs, next_cursor)."""
+    params = {}
+    if user:
+        params["user"] = user
+    if cursor:
+        params["cursor"] = cursor
     try:
-        r = requests.get(f"{RELAY_SERVER}/admin/logs", auth=ADMIN_AUTH, verify=False)
-        return r.json() if r.status_code == 200 else []
+        r = relay.get("/admin/logs", params=params, auth=ADMIN_AUTH)
+        if r.status_code != 200:
+            return [], None
+        return r.json(), r.headers.get("X-Next-Cursor")
     except Exception as e:
         messagebox.showerror("Error", f"Could not fetch logs: {e}")
-        return []
+        return [], None
 
 
 def fetch_users():
     try:
-        r = requests.get(f"{RELAY_SERVER}/admin/users", auth=ADMIN_AUTH, verify=False)
+        r = relay.get("/admin/users", auth=ADMIN_AUTH)
         return r.json() if r.status_code == 200 else []
     except Exception as e:
         messagebox.showerror("Error", f"Could not fetch users: {e}")
@@ -26,13 +38,29 @@ def fetch_users():
 
 def fetch_sessions():
     try:
-        r = requests.get(f"{RELAY_SERVER}/admin/active_sessions", auth=ADMIN_AUTH, verify=False)
+        r = relay.get("/admin/active_sessions", auth=ADMIN_AUTH)
         return r.json() if r.status_code == 200 else []
     except Exception as e:
         messagebox.showerror("Error", f"Could not fetch sessions: {e}")
         return []
 
 
+def fetch_usage():
+    try:
+        r = relay.get("/admin/usage", auth=ADMIN_AUTH)
+        return r.json() if r.status_code == 200 else None
+    except Exception as e:
+        messagebox.showerror("Error", f"Could not fetch storage usage: {e}")
+        return None
+
+
+def format_size(num_bytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if num_bytes < 1024 or unit == "GB":
+            return f"{num_bytes:.0f} {unit}" if unit == "B" else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+
+
 def launch_admin_gui():
     root = tk.Tk()
     root.title("🛠 Admin Dashboard - Secure File Transfer")
@@ -51,19 +79,41 @@ def launch_admin_gui():
 
     # === LOGS TAB ===
     logs_tab = tk.Frame(notebook, padx=10, pady=10)
-    logs_text = tk.Text(logs_tab, wrap="word", height=20)
+
+    filter_frame = tk.Frame(logs_tab)
+    filter_frame.pack(fill='x', pady=(0, 5))
+    tk.Label(filter_frame, text="User:").pack(side='left')
+    log_user = tk.StringVar()
+    tk.Entry(filter_frame, textvariable=log_user, width=25).pack(side='left', padx=5)
+
+    logs_text = tk.Text(logs_tab, wrap="word", height=18)
     logs_text.pack(fill='both', expand=True, pady=(0, 10))
+    log_cursor = {"next": None}
+
+    def show_logs(logs):
+        for log in logs:
+            logs_text.insert(tk.END, f"[{log['timestamp']}] {log['from']} → {log['to']}: {log['filename']} ({log['chunk_count']} chunks)\n")
 
     def load_logs():
         logs_text.delete("1.0", tk.END)
-        logs = fetch_logs()
+        logs, log_cursor["next"] = fetch_logs(log_user.get().strip())
         if logs:
-            for log in logs:
-                logs_text.insert(tk.END, f"[{log['timestamp']}] {log['from']} → {log['to']}: {log['filename']} ({log['chunk_count']} chunks)\n")
+            show_logs(logs)
         else:
             logs_text.insert(tk.END, "No transfer logs found.")
+        older_button.config(state="normal" if log_cursor["next"] else "disabled")
+
+    def load_older_logs():
+        logs, log_cursor["next"] = fetch_logs(log_user.get().strip(), log_cursor["next"])
+        show_logs(logs)
+        older_button.config(state="normal" if log_cursor["next"] else "disabled")
 
-    ttk.Button(logs_tab, text="🔄 Refresh Logs", command=load_logs).pack()
+    ttk.Button(filter_frame, text="🔍 Filter", command=load_logs).pack(side='left')
+    button_frame = tk.Frame(logs_tab)
+    button_frame.pack()
+    ttk.Button(button_frame, text="🔄 Refresh Logs", command=load_logs).pack(side='left', padx=5)
+    older_button = ttk.Button(button_frame, text="⏬ Load Older", command=load_older_logs, state="disabled")
+    older_button.pack(side='left', padx=5)
 
     # === USERS TAB ===
     users_tab = tk.Frame(notebook, padx=10, pady=10)
@@ -94,21 +144,59 @@ def launch_admin_gui():
         sessions = fetch_sessions()
         if sessions:
             for session in sessions:
-                session_listbox.insert(tk.END, f"{session['admission_id']} - Last Active: {session['last_active']}")
+                session_listbox.insert(
+                    tk.END,
+                    f"{session['admission_id']} - Online since: {session.get('started', '?')} - Last Active: {session['last_active']}"
+                )
         else:
-            session_listbox.insert(tk.END, "No active sessions found.")
+            session_listbox.insert(tk.END, "No users online.")
 
     ttk.Button(sessions_tab, text="🔄 Refresh Sessions", command=load_sessions).pack()
 
+    # === STORAGE TAB ===
+    storage_tab = tk.Frame(notebook, padx=10, pady=10)
+    usage_listbox = tk.Listbox(storage_tab, width=80, height=18)
+    usage_listbox.pack(pady=(0, 5))
+    usage_summary = tk.Label(storage_tab, text="", anchor="w")
+    usage_summary.pack(fill="x", pady=(0, 5))
+
+    def load_usage():
+        usage_listbox.delete(0, tk.END)
+        usage = fetch_usage()
+        if usage is None:
+            usage_summary.config(text="Storage usage unavailable.")
+            return
+        quota = usage["inbox_quota_bytes"]
+        for user in usage["users"]:
+            inbox = f"inbox {user['inbox_transfers']} files, {format_size(user['inbox_bytes'])}"
+            if quota:
+                inbox += f" ({user['inbox_bytes'] * 100 // quota}% of quota)"
+            usage_listbox.insert(
+                tk.END,
+                f"{user['admission_id']} - {inbox} - sent {user['sent_transfers']} files, "
+                f"{format_size(user['sent_bytes'])}"
+            )
+        if not usage["users"]:
+            usage_listbox.insert(tk.END, "No transfers waiting.")
+        usage_summary.config(
+            text=f"Pending: {usage['pending_transfers']} transfers, {format_size(usage['pending_bytes'])} · "
+                 f"On disk: {usage['stored_blobs']} blobs, {format_size(usage['stored_bytes'])} · "
+                 f"Inbox quota: {format_size(quota) if quota else 'none'}"
+        )
+
+    ttk.Button(storage_tab, text="🔄 Refresh Storage", command=load_usage).pack()
+
     # Add tabs
     notebook.add(logs_tab, text="📜 Transfer Logs")
     notebook.add(users_tab, text="👥 Registered Users")
     notebook.add(sessions_tab, text="🟢 Active Sessions")
+    notebook.add(storage_tab, text="💾 Storage")
 
     # Initial load
     load_logs()
     load_users()
     load_sessions()
+    load_usage()
 
     root.mainloop()
 
@@ -0,0 +1,150 @@
+import os
+import json
+import threading
+
+# === Append-only Transfer Log ===
+#
+# <log_dir>/segment-000001.jsonl, segment-000002.jsonl, ...
+#
+# One JSON object per line, appended with a single O_APPEND write, so a
+# write costs the same however long the log is and concurrent writers
+# (threads or relay worker processes) never overwrite each other's entries.
+# When the newest segment passes max_segment_bytes a new one is started and
+# only the newest max_segments are kept.
+#
+# Entries are in append order, so a segment covers the time from its first
+# entry up to the first entry of the next segment; time-filtered queries
+# skip whole segments using only their first line.
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".jsonl"
+DEFAULT_SEGMENT_BYTES = 4 * 1024 * 1024
+DEFAULT_MAX_SEGMENTS = 64
+
+
+class TransferLog:
+    def __init__(self, log_dir, max_segment_bytes=DEFAULT_SEGMENT_BYTES, max_segments=DEFAULT_MAX_SEGMENTS):
+        self.log_dir = log_dir
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segments = max_segments
+        self._lock = threading.Lock()
+        os.makedirs(log_dir, exist_ok=True)
+
+    # === Segments ===
+    def _segment_path(self, number):
+        return os.path.join(self.log_dir, f"{SEGMENT_PREFIX}{number:06d}{SEGMENT_SUFFIX}")
+
+    def segments(self):
+        """Segment numbers, oldest first."""
+        numbers = []
+        for fname in os.listdir(self.log_dir):
+            if fname.startswith(SEGMENT_PREFIX) and fname.endswith(SEGMENT_SUFFIX):
+                try:
+                    numbers.append(int(fname[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+                except ValueError:
+                    continue
+        return sorted(numbers)
+
+    def _read_segment(self, number):
+        try:
+            f = open(self._segment_path(number), "rb")
+        except FileNotFoundError:
+            return []  # Rotated away since it was listed
+        entries = []
+        with f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # A write still in progress
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+        return entries
+
+    def _first_timestamp(self, number):
+        try:
+            with open(self._segment_path(number), "rb") as f:
+                line = f.readline()
+            return json.loads(line).get("timestamp")
+        except (FileNotFoundError, ValueError):
+            return None
+
+    # === Writing ===
+    def _append_lines(self, lines):
+        with self._lock:
+            segments = self.segments()
+            number = segments[-1] if segments else 1
+            path = self._segment_path(number)
+            if os.path.exists(path) and os.path.getsize(path) >= self.max_segment_bytes:
+                number += 1
+                path = self._segment_path(number)
+                for old in (segments + [number])[:-self.max_segments]:
+                    try:
+                        os.remove(self._segment_path(old))
+                    except FileNotFoundError:
+                        pass
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(fd, b"".join(lines))
+            finally:
+                os.close(fd)
+
+    def append(self, entry):
+        self._append_lines([json.dumps(entry, separators=(",", ":")).encode() + b"\n"])
+
+    def import_legacy(self, legacy_path):
+        """
+        Append the entries of an old whole-file JSON log (a single array) and
+        remove it. Returns the number of entries imported.
+        """
+        if not os.path.exists(legacy_path):
+            return 0
+        with open(legacy_path, "r") as f:
+            entries = json.load(f)
+        if entries:
+            self._append_lines([json.dumps(e, separators=(",", ":")).encode() + b"\n" for e in entries])
+        os.remove(legacy_path)
+        return len(entries)
+
+    # === Reading ===
+    def query(self, since=None, until=None, user=None, cursor=None, limit=100):
+        """
+        Newest-first page of log entries.
+
+        `since` / `until` are ISO timestamps (both exclusive), `user` matches
+        the sender or recipient, and `cursor` is the next_cursor returned by
+        the previous page. Returns (entries, next_cursor) where next_cursor
+        is None on the last page. Raises ValueError for a malformed cursor.
+        """
+        start_segment = start_line = None
+        if cursor:
+            segment_part, _, line_part = cursor.partition(":")
+            start_segment, start_line = int(segment_part), int(line_part)
+
+        page = []
+        next_first = None  # First timestamp of the segment after the current one
+        for number in reversed(self.segments()):
+            if since and next_first is not None and next_first <= since:
+                break  # This and every older segment predates `since`
+            first = self._first_timestamp(number) if since or until else None
+            next_first = first
+            if start_segment is not None and number > start_segment:
+                continue
+            if until and first is not None and first >= until:
+                continue
+
+            entries = self._read_segment(number)
+            end = start_line if number == start_segment else len(entries)
+            for line in range(min(end, len(entries)) - 1, -1, -1):
+                entry = entries[line]
+                timestamp = entry.get("timestamp", "")
+                if since and timestamp <= since:
+                    continue
+                if until and timestamp >= until:
+                    continue
+                if user and user not in (entry.get("from"), entry.get("to")):
+                    continue
+                page.append(entry)
+                if len(page) == limit:
+                    return page, f"{number}:{line}"
+        return page, None
@@ -0,0 +1,81 @@
+import queue
+import threading
+from urllib.parse import quote
+
+import requests
+
+from relay_client import RelayClient, RELAY_SERVER
+
+# === Inbox Watcher ===
+#
+# Long-polls /transfers/<id>/events on a background thread: the relay holds
+# each request until a new transfer arrives or WAIT_SECONDS pass, so new
+# files are seen at once while an idle inbox costs one request per wait.
+# Like TransferManager, the thread never touches widgets; new transfers are
+# queued and handed to the window from root.after on the Tk thread.
+#
+# The watcher has its own relay client without automatic retries: a 503
+# means the relay has no slot for another waiting receiver, and retrying
+# it at once would only add load. The watcher waits the Retry-After delay
+# itself and polls again.
+
+WAIT_SECONDS = 25
+RETRY_DELAY = 5  # Seconds before polling again after an error (or the relay's Retry-After)
+POLL_INTERVAL_MS = 250
+
+
+def retry_delay(response):
+    try:
+        return max(float(response.headers.get("Retry-After", RETRY_DELAY)), 0)
+    except ValueError:
+        return RETRY_DELAY
+
+
+class InboxWatcher:
+    def __init__(self, admission_id, wait=WAIT_SECONDS):
+        self.admission_id = admission_id
+        self.wait = wait
+        self.after = 0
+        self._events = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+        self._client = RelayClient(RELAY_SERVER, retries=0, pool_size=1)
+
+    def start(self, after=0):
+        """Watch for transfers indexed after sequence number `after` (0 for all). Idempotent."""
+        if self._thread is not None:
+            return
+        self.after = after
+        self._thread = threading.Thread(target=self._run, name="inbox-watch", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        path = f"/transfers/{quote(self.admission_id)}/events"
+        while not self._stop.is_set():
+            try:
+                response = self._client.get(path, params={"after": self.after, "timeout": self.wait})
+            except requests.exceptions.RequestException:
+                self._stop.wait(RETRY_DELAY)
+                continue
+            if response.status_code != 200:
+                self._stop.wait(retry_delay(response))
+                continue
+            body = response.json()
+            if body["transfers"] and not self._stop.is_set():
+                self._events.put(body["transfers"])
+            self.after = body["cursor"]
+
+    def poll(self, root, on_new, interval=POLL_INTERVAL_MS):
+        """Hand newly arrived transfers (oldest first) to on_new(transfers) on the Tk thread, now and every `interval` ms."""
+        while True:
+            try:
+                transfers = self._events.get_nowait()
+            except queue.Empty:
+                break
+            on_new(transfers)
+        root.after(interval, self.poll, root, on_new, interval)
+
+    def stop(self):
+        """Stop after the request in flight returns (the thread is a daemon, so it never blocks exit)."""
+        self._stop.set()
+        self._client.close()
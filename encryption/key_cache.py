@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import uuid
+import threading
+
+from crypto_utils import public_key_fingerprint
+
+# === Sender-side Public Key Cache ===
+#
+# Recipients' public keys rarely change, so the sender keeps the last key it
+# fetched for each admission ID together with its fingerprint and the
+# relay's ETag. Within `ttl` seconds the cached key is used without asking
+# the relay at all; after that it is revalidated with a conditional request
+# and only downloaded again if it changed. A changed key is recorded with
+# the fingerprint it replaced.
+#
+# Several sends may use the cache at once: changes are merged into a fresh
+# read of the file under a lock, and written through a unique temp file.
+
+PUBLIC_KEY_TTL_SECONDS = 60 * 60
+
+
+class PublicKeyCache:
+    def __init__(self, path, ttl=PUBLIC_KEY_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r") as f:
+            return json.load(f)
+
+    def _save(self, entries):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        partial = f"{self.path}.{uuid.uuid4().hex}.part"
+        with open(partial, "w") as f:
+            json.dump(entries, f)
+        os.replace(partial, self.path)
+
+    def _update(self, changes, removed=()):
+        """Apply {admission_id: entry} and removals to the current file contents."""
+        with self._lock:
+            entries = self._load()
+            entries.update(changes)
+            for admission_id in removed:
+                entries.pop(admission_id, None)
+            self._save(entries)
+
+    def get(self, admission_id, fetch):
+        """
+        Return the public key PEM for `admission_id`.
+
+        `fetch(admission_id, etag)` is called when the cached key is missing
+        or stale and must return (public_key_pem, etag), with a None PEM
+        when the relay answered 304 Not Modified.
+        """
+        entries = self._load()
+        entry = entries.get(admission_id)
+        now = time.time()
+        if entry and now - entry["checked"] < self.ttl:
+            return entry["public_key"]
+
+        public_key_pem, etag = fetch(admission_id, entry["etag"] if entry else None)
+        if public_key_pem is None and entry:
+            entry["checked"] = now
+        elif public_key_pem is None:
+            raise RuntimeError(f"No public key available for {admission_id}.")
+        else:
+            entry = self._new_entry(public_key_pem, etag, now, entry)
+        self._update({admission_id: entry})
+        return entry["public_key"]
+
+    def get_many(self, admission_ids, fetch_many):
+        """
+        Return {admission_id: public_key_pem} for several users, asking the
+        relay at most once for all missing or stale keys.
+
+        `fetch_many({admission_id: etag or None})` must return
+        ({admission_id: (public_key_pem, etag)}, unchanged_ids); users it
+        mentions in neither are unknown to the relay.
+        """
+        entries = self._load()
+        now = time.time()
+        stale = {
+            admission_id: entries[admission_id]["etag"] if admission_id in entries else None
+            for admission_id in admission_ids
+            if admission_id not in entries or now - entries[admission_id]["checked"] >= self.ttl
+        }
+        if stale:
+            fetched, unchanged = fetch_many(stale)
+            changes, removed = {}, []
+            for admission_id in stale:
+                if admission_id in fetched:
+                    public_key_pem, etag = fetched[admission_id]
+                    changes[admission_id] = self._new_entry(public_key_pem, etag, now, entries.get(admission_id))
+                elif admission_id in unchanged and admission_id in entries:
+                    changes[admission_id] = dict(entries[admission_id], checked=now)
+                else:
+                    removed.append(admission_id)
+            self._update(changes, removed)
+            entries.update(changes)
+            for admission_id in removed:
+                entries.pop(admission_id, None)
+
+        missing = [a for a in admission_ids if a not in entries]
+        if missing:
+            raise RuntimeError(f"No public key available for {', '.join(missing)}.")
+        return {a: entries[a]["public_key"] for a in admission_ids}
+
+    @staticmethod
+    def _new_entry(public_key_pem, etag, now, previous_entry):
+        fingerprint = public_key_fingerprint(public_key_pem)
+        previous = previous_entry["fingerprint"] if previous_entry else None
+        entry = {
+            "public_key": public_key_pem,
+            "fingerprint": fingerprint,
+            "etag": etag,
+            "checked": now
+        }
+        if previous and previous != fingerprint:
+            entry["replaced_fingerprint"] = previous
+        return entry
+
+    def fingerprint(self, admission_id):
+        entry = self._load().get(admission_id)
+        return entry["fingerprint"] if entry else None
+
+    def forget(self, admission_id):
+        self._update({}, [admission_id])
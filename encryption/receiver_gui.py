@@ -1,10 +1,13 @@
 import tkinter as tk
 from tkinter import messagebox, filedialog
 import os
-import requests
-import base64
-import json
 import sys
+import tempfile
+import requests
+from collections import deque
+from itertools import accumulate
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
 
 from cryptography.hazmat.primitives import serialization
 
@@ -14,28 +17,21 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from crypto_utils import (
     decrypt_aes_key_with_rsa,
-    decrypt_chunk_with_aes,
-    compute_sha256
+    open_transfer_receipt,
+    decrypt_chunk_stream,
+    compute_sha256,
+    verify_manifest,
+    verify_merkle_root_mac,
+    CIPHER_CBC
 )
+from archive import extract_archive, ARCHIVE_TAR
+from relay_client import relay
+from transfer_manager import TransferManager, TransferPanel, DONE
+from inbox_watcher import InboxWatcher
 
 # === CONFIG ===
-# Load server config from relay/config.json
-config_path = os.path.join(os.path.dirname(__file__), "..", "relay", "config.json")
-
-if not os.path.exists(config_path):
-    raise FileNotFoundError("Missing config.json file in relay/ directory.")
-
-with open(config_path, "r") as f:
-    config = json.load(f)
-
-relay_host = config.get("relay_host", "127.0.0.1")
-relay_port = config.get("relay_port", 5000)
-
-# Construct the full server URL
-RELAY_SERVER = f"https://{relay_host}:{relay_port}"
 WINDOW_WIDTH = 520
-WINDOW_HEIGHT = 400
-requests.packages.urllib3.disable_warnings()
+WINDOW_HEIGHT = 620
 
 def load_private_key(admission_id):
     private_key_path = f"private_key_{admission_id}.pem"
@@ -46,6 +42,137 @@ def load_private_key(admission_id):
         return serialization.load_pem_private_key(key_file.read(), password=None)
 
 
+# === Parallel Chunk Download ===
+DOWNLOAD_WORKERS = 4
+
+
+def fetch_chunk(transfer_path, chunk):
+    response = relay.get(f"{transfer_path}/chunks/{chunk['index']}")
+    if response.status_code != 200:
+        raise RuntimeError(f"Failed to download chunk {chunk['index']}. Code: {response.status_code}")
+    # Check the chunk against its Merkle leaf as soon as it arrives
+    if compute_sha256(response.content) != chunk["hash"]:
+        raise ValueError(f"Hash mismatch in chunk {chunk['index']}")
+    return response.content
+
+
+def iter_chunks_parallel(transfer_path, chunks, workers=DOWNLOAD_WORKERS):
+    """
+    Download chunks over several connections and yield (chunk, data) in index
+    order. At most 2 * workers chunks are in flight or waiting to be consumed.
+    """
+    chunk_iter = iter(sorted(chunks, key=lambda c: c["index"]))
+    pool = ThreadPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for chunk in chunk_iter:
+            pending.append((chunk, pool.submit(fetch_chunk, transfer_path, chunk)))
+            if len(pending) >= workers * 2:
+                break
+
+        while pending:
+            chunk, future = pending.popleft()
+            data = future.result()
+            next_chunk = next(chunk_iter, None)
+            if next_chunk is not None:
+                pending.append((next_chunk, pool.submit(fetch_chunk, transfer_path, next_chunk)))
+            yield chunk, data
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+# === Streaming Save ===
+def save_chunks_atomically(plaintext_chunks, save_path, on_progress=None):
+    """
+    Write plaintext chunks to a temp file beside `save_path` as they arrive,
+    then rename it into place. A failed or interrupted download never leaves
+    a truncated file at `save_path`. Returns the number of bytes written.
+    """
+    directory = os.path.dirname(os.path.abspath(save_path))
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(save_path)}.", suffix=".part", dir=directory)
+    written = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for count, part in enumerate(plaintext_chunks, start=1):
+                f.write(part)
+                written += len(part)
+                if on_progress:
+                    on_progress(count, written)
+        os.replace(temp_path, save_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return written
+
+
+# === Receiving ===
+def receive_transfer(admission_id, transfer, save_path, private_key, extract_to=None, on_progress=None):
+    """
+    Download, verify and decrypt one inbox transfer into `save_path`. A batch
+    is then unpacked under `extract_to` and the archive removed. Once saved,
+    the transfer is acknowledged with its receipt so the relay can delete it. Returns the
+    number of files extracted, or None for a single file.
+    """
+    transfer_path = f"/transfers/{quote(admission_id)}/{transfer['id']}"
+    response = relay.get(f"{transfer_path}/manifest")
+    if response.status_code != 200:
+        raise RuntimeError(f"Failed to download transfer. Code: {response.status_code}")
+
+    manifest = response.json()
+    chunks = sorted(manifest["chunks"], key=lambda c: c["index"])
+    if not verify_manifest({"leaves": [c["hash"] for c in chunks], "root": manifest["merkle_root"]}):
+        raise ValueError("Transfer manifest does not match its Merkle root")
+    aes_key = decrypt_aes_key_with_rsa(manifest["encrypted_key"], private_key)
+    cipher = manifest.get("cipher", CIPHER_CBC)
+    # The root must be the sender's, or the relay could drop or swap chunks
+    # and serve a manifest that still adds up. Legacy CBC transfers predate
+    # the MAC and are only checked against their own manifest
+    if cipher != CIPHER_CBC and not verify_merkle_root_mac(aes_key, manifest["merkle_root"], manifest.get("root_mac")):
+        raise ValueError("Transfer manifest is not authenticated by the sender")
+
+    # Progress counts stored (encrypted) bytes of the chunks written so far
+    total_bytes = sum(c["size"] for c in chunks)
+    done_after = list(accumulate(c["size"] for c in chunks))
+
+    def report_progress(count, written):
+        on_progress(done_after[count - 1], total_bytes)
+
+    if on_progress:
+        on_progress(0, total_bytes)
+
+    # Chunks are fetched concurrently, then verified and decrypted on all
+    # cores; results still come back in index order and are written out one
+    # by one, so memory use stays constant
+    downloaded = iter_chunks_parallel(transfer_path, chunks)
+    save_chunks_atomically(decrypt_chunk_stream(downloaded, aes_key, cipher), save_path,
+                           report_progress if on_progress else None)
+
+    extracted = None
+    if extract_to is not None:
+        try:
+            extracted = extract_archive(save_path, extract_to)
+        finally:
+            os.remove(save_path)
+
+    # Acknowledge with the receipt token so the relay can delete the transfer.
+    # Unacknowledged transfers (and ones sent without a receipt) still expire
+    # on the relay, so a failed acknowledgement does not fail the download
+    if manifest.get("receipt_key"):
+        try:
+            token = open_transfer_receipt(manifest["receipt_key"], private_key)
+            relay.delete(transfer_path, headers={"X-Receipt-Token": token})
+        except (ValueError, requests.exceptions.RequestException):
+            pass
+    return extracted
+
+
+def format_size(num_bytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if num_bytes < 1024 or unit == "GB":
+            return f"{num_bytes:.0f} {unit}" if unit == "B" else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+
+
 def launch_receive_gui(admission_id, private_key_pem=None):
     root = tk.Tk()
     root.title(f"📥 Inbox - {admission_id}")
@@ -64,7 +191,7 @@ def launch_receive_gui(admission_id, private_key_pem=None):
     list_frame = tk.Frame(root)
     list_frame.pack(padx=10, pady=5, fill="both", expand=True)
 
-    file_listbox = tk.Listbox(list_frame, width=60, height=10)
+    file_listbox = tk.Listbox(list_frame, width=60, height=10, selectmode=tk.EXTENDED)
     file_listbox.pack()
 
     transfer_map = {}
@@ -74,67 +201,117 @@ def launch_receive_gui(admission_id, private_key_pem=None):
         transfer_map.clear()
 
         try:
-            response = requests.get(f"{RELAY_SERVER}/transfers/{admission_id}", verify=False)
-            if response.status_code == 200:
-                transfers = response.json()
-                if not transfers:
-                    file_listbox.insert(tk.END, "No files available.")
+            transfers = []
+            params = {}
+            # The relay pages the inbox newest-first; follow cursors to the end
+            while True:
+                response = relay.get(f"/transfers/{quote(admission_id)}", params=params)
+                if response.status_code != 200:
+                    messagebox.showerror("Error", f"Failed to fetch transfers. Code: {response.status_code}")
                     return
+                transfers.extend(response.json())
+                next_cursor = response.headers.get("X-Next-Cursor")
+                if not next_cursor:
+                    break
+                params = {"cursor": next_cursor}
+
+            if not transfers:
+                file_listbox.insert(tk.END, "No files available.")
+                return
 
-                for transfer in transfers:
-                    display = f'{transfer["filename"]} (from {transfer["from"]})'
-                    file_listbox.insert(tk.END, display)
-                    transfer_map[display] = transfer
-            else:
-                messagebox.showerror("Error", f"Failed to fetch transfers. Code: {response.status_code}")
+            for transfer in transfers:
+                display = describe_transfer(transfer)
+                file_listbox.insert(tk.END, display)
+                transfer_map[display] = transfer
         except Exception as e:
             messagebox.showerror("Connection Error", str(e))
 
+    def describe_transfer(transfer):
+        # Batch transfers (packed folders) are marked so they can be told apart
+        prefix = "📦 " if transfer.get("archive") else ""
+        return (f'{prefix}{transfer["filename"]} (from {transfer["from"]}, '
+                f'{format_size(transfer["size"])}, {transfer["created"][:16].replace("T", " ")})')
+
+    def show_new_transfers(transfers):
+        # Pushed by the inbox watcher, oldest first; each goes on top like a refresh would list it
+        known = {t["id"] for t in transfer_map.values()}
+        if not transfer_map:
+            file_listbox.delete(0, tk.END)  # "No files available."
+        for transfer in transfers:
+            if transfer["id"] in known:
+                continue
+            display = describe_transfer(transfer)
+            file_listbox.insert(0, display)
+            transfer_map[display] = transfer
+
     def download_and_decrypt():
         selected = file_listbox.curselection()
-        if not selected:
+        transfers = [transfer_map[file_listbox.get(i)] for i in selected if file_listbox.get(i) in transfer_map]
+        if not transfers:
             messagebox.showwarning("No File", "Please select a file.")
             return
 
-        selected_text = file_listbox.get(selected[0])
-        transfer = transfer_map.get(selected_text)
-        if not transfer:
-            messagebox.showerror("Error", "Metadata not found for selected file.")
-            return
-
         try:
-            encrypted_key = transfer["encrypted_key"]
-            chunks = transfer["chunks"]
-            original_filename = transfer["filename"]
-
-            if private_key_pem is None:
-                private_key_obj = load_private_key(admission_id)
-            else:
-                private_key_obj = private_key_pem
-
-            aes_key = decrypt_aes_key_with_rsa(encrypted_key, private_key_obj)
-
-            decrypted_chunks = []
-            for chunk in sorted(chunks, key=lambda x: x["index"]):
-                chunk_bytes = base64.b64decode(chunk["data"])
-                if compute_sha256(chunk_bytes) != chunk["hash"]:
-                    raise ValueError(f"Hash mismatch in chunk {chunk['index']}")
-                decrypted_chunks.append(decrypt_chunk_with_aes(chunk_bytes, aes_key))
+            private_key = private_key_pem if private_key_pem is not None else load_private_key(admission_id)
+        except Exception as e:
+            messagebox.showerror("Decryption Failed", str(e))
+            return
 
-            save_path = filedialog.asksaveasfilename(initialfile=original_filename)
-            if not save_path:
+        # Ask where to save first, so chunks can go straight to disk. Several
+        # files go into one chosen folder; a batch is unpacked into the folder
+        if len(transfers) > 1:
+            destination = filedialog.askdirectory(title="Save selected files into folder")
+            if not destination:
                 return
-
-            with open(save_path, "wb") as f:
-                for part in decrypted_chunks:
-                    f.write(part)
-
-            messagebox.showinfo("Success", f"✅ File saved to: {save_path}")
-
-        except Exception as e:
-            messagebox.showerror("Decryption Failed", f"{str(e)}")
+        for transfer in transfers:
+            if transfer.get("archive") == ARCHIVE_TAR:
+                if len(transfers) == 1:
+                    destination = filedialog.askdirectory(title="Extract batch into folder")
+                    if not destination:
+                        return
+                save_path = os.path.join(destination, f".{transfer['filename']}.download")
+                extract_to = destination
+            else:
+                if len(transfers) == 1:
+                    save_path = filedialog.asksaveasfilename(initialfile=transfer["filename"])
+                    if not save_path:
+                        return
+                else:
+                    save_path = os.path.join(destination, transfer["filename"])
+                extract_to = None
+
+            job = manager.submit(f"📥 {transfer['filename']}", receive_transfer, admission_id, transfer,
+                                 save_path, private_key, extract_to)
+            destinations[job.id] = (extract_to or save_path, transfer["id"])
+
+    def remove_transfer(transfer_id):
+        for index in range(file_listbox.size()):
+            display = file_listbox.get(index)
+            if transfer_map.get(display, {}).get("id") == transfer_id:
+                file_listbox.delete(index)
+                del transfer_map[display]
+                break
+        if file_listbox.size() == 0:
+            file_listbox.insert(tk.END, "No files available.")
+
+    def on_finished(job):
+        destination, transfer_id = destinations.pop(job.id, (None, None))
+        if job.state != DONE:
+            return
+        if job.result is None:
+            panel.set_status(job, f"✅ Saved to {destination}")
+        else:
+            panel.set_status(job, f"✅ Extracted {job.result} files into {destination}")
+        # The relay has dropped the saved transfer; take it off the list here
+        # rather than fetching the whole inbox again on the Tk thread
+        remove_transfer(transfer_id)
 
     def go_back():
+        if manager.active() and not messagebox.askyesno(
+                "Transfers Running", "Cancel the downloads still running and leave?"):
+            return
+        manager.shutdown()
+        watcher.stop()
         root.destroy()
         from user.dashboard import launch_dashboard  # ✅ Fix circular import
         launch_dashboard(admission_id, display_name="You")
@@ -147,5 +324,28 @@ def launch_receive_gui(admission_id, private_key_pem=None):
     tk.Button(button_frame, text="⬇️ Download & Decrypt", width=20, command=download_and_decrypt).pack(pady=5)
     tk.Button(button_frame, text="🔙 Back to Dashboard", width=20, command=go_back).pack(pady=5)
 
+    # === Downloads ===
+    # Downloads run in the background, several at a time
+    manager = TransferManager()
+    destinations = {}
+    panel = TransferPanel(root, manager, on_finished=on_finished)
+    panel.pack(padx=10, pady=(0, 10), fill="both", expand=True)
+
+    def close_window():
+        if manager.active() and not messagebox.askyesno(
+                "Transfers Running", "Cancel the downloads still running and close?"):
+            return
+        manager.shutdown()
+        watcher.stop()
+        root.destroy()
+
+    root.protocol("WM_DELETE_WINDOW", close_window)
+
     refresh_file_list()
+
+    # New transfers are pushed by the relay, so the list stays current
+    # without pressing Refresh; the watch starts after the last indexed one listed
+    watcher = InboxWatcher(admission_id)
+    watcher.start(max((t["seq"] for t in transfer_map.values()), default=0))
+    watcher.poll(root, show_new_transfers)
     root.mainloop()
@@ -0,0 +1,92 @@
+import os
+import json
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# === Shared Relay Client ===
+#
+# Every window talks to the relay through the one RelayClient below: a
+# requests.Session whose keep-alive connection pool is reused across calls
+# (one TLS handshake per connection instead of per request), with default
+# timeouts and retry with exponential backoff. Connection failures are
+# retried for every method since the request never reached the relay;
+# timeouts and 502/503/504 answers only for idempotent methods, so a POST
+# is never sent twice.
+#
+# relay/config.json is read once per process here; other modules take
+# RELAY_SERVER or `relay` from this module instead of parsing it again.
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "relay", "config.json")
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 60
+RETRIES = 3
+BACKOFF_FACTOR = 0.5  # 0.5s, 1s, 2s between attempts
+POOL_SIZE = 16  # Chunk uploads/downloads of several background transfers at once
+
+# Self-signed relay certificates are the norm on a LAN deployment
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+
+def load_relay_config(path=CONFIG_PATH):
+    if not os.path.exists(path):
+        raise FileNotFoundError("Missing config.json file in relay/ directory.")
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+class RelayClient:
+    def __init__(self, base_url, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), retries=RETRIES,
+                 backoff_factor=BACKOFF_FACTOR, pool_size=POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.verify = False
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def url(self, path):
+        return f"{self.base_url}{path}"
+
+    def request(self, method, path, **kwargs):
+        """Send a request for `path` (e.g. "/users") on the shared session."""
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, self.url(path), **kwargs)
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request("PUT", path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request("DELETE", path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+config = load_relay_config()
+relay_host = config.get("relay_host", "127.0.0.1")
+relay_port = config.get("relay_port", 5000)
+
+# Construct the full server URL
+RELAY_SERVER = f"https://{relay_host}:{relay_port}"
+relay = RelayClient(RELAY_SERVER)
@@ -5,35 +5,351 @@ import os
 import requests
 import base64
 import sys
+import shutil
+import hashlib
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from crypto_utils import (
     generate_aes_key,
     encrypt_aes_key_with_rsa,
-    split_file_into_chunks,
-    encrypt_chunk_with_aes,
-    compute_sha256
+    new_transfer_receipt,
+    encrypt_file_stream,
+    build_chunk_plan,
+    build_manifest,
+    merkle_root_mac,
+    CIPHER_GCM,
+    CHUNKING_FIXED,
+    CHUNKING_CDC
 )
+from transfer_format import CONTENT_TYPE, encode_frame, codec_flags
+from signature_cache import ChunkSignatureCache
+from key_cache import PublicKeyCache
+from archive import build_directory_archive, ARCHIVE_TAR
+from relay_client import relay
+from transfer_manager import TransferManager, TransferPanel, DONE, FAILED
 
-# Load server config from relay/config.json
-config_path = os.path.join(os.path.dirname(__file__), "..", "relay", "config.json")
+WINDOW_WIDTH = 480
+WINDOW_HEIGHT = 520
+UPLOAD_WORKERS = 4  # Chunk PUTs in flight at once
 
-if not os.path.exists(config_path):
-    raise FileNotFoundError("Missing config.json file in relay/ directory.")
+# === Resumable Upload State ===
+# Each pending upload remembers its relay upload_id and the AES key its
+# chunks were encrypted with, so a retry can send only the missing chunks.
+# The file is keyed by recipient + path + size + mtime: editing the file
+# starts a fresh upload instead of mixing old and new chunks. Several sends
+# run at once, so every change re-reads the file under a lock and writes it
+# back whole through a temp file.
+STATE_DIR = os.path.join(os.path.expanduser("~"), ".secure_file_transfer")
+PENDING_UPLOADS_FILE = os.path.join(STATE_DIR, "pending_uploads.json")
 
-with open(config_path, "r") as f:
-    config = json.load(f)
 
-relay_host = config.get("relay_host", "127.0.0.1")
-relay_port = config.get("relay_port", 5000)
+def upload_state_key(file_path, recipient_id):
+    stat = os.stat(file_path)
+    return f"{recipient_id}|{os.path.abspath(file_path)}|{stat.st_size}|{int(stat.st_mtime)}"
 
-# Construct the full server URL
-RELAY_SERVER = f"https://{relay_host}:{relay_port}"
-WINDOW_WIDTH = 480
-WINDOW_HEIGHT = 300
 
-def launch_send_gui(sender_id, recipient_id):
+def load_pending_uploads():
+    if not os.path.exists(PENDING_UPLOADS_FILE):
+        return {}
+    with open(PENDING_UPLOADS_FILE, "r") as f:
+        return json.load(f)
+
+
+def save_pending_uploads(pending):
+    os.makedirs(STATE_DIR, exist_ok=True)
+    # Holds raw AES keys, so keep it readable by the owner only
+    partial = f"{PENDING_UPLOADS_FILE}.{uuid.uuid4().hex}.part"
+    fd = os.open(partial, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(pending, f)
+    os.replace(partial, PENDING_UPLOADS_FILE)
+
+
+pending_uploads_lock = threading.Lock()
+
+
+def update_pending_upload(state_key, upload=None):
+    """Record the pending upload for `state_key`, or drop it when `upload` is None."""
+    with pending_uploads_lock:
+        pending = load_pending_uploads()
+        if upload is None:
+            pending.pop(state_key, None)
+        else:
+            pending[state_key] = upload
+        save_pending_uploads(pending)
+
+
+# === Recipient Public Keys ===
+public_key_cache = PublicKeyCache(os.path.join(STATE_DIR, "public_keys.json"))
+
+
+def fetch_public_key(admission_id, etag=None):
+    """Fetch a user's public key, conditionally if an ETag is known. Returns (pem or None if unchanged, etag)."""
+    headers = {"If-None-Match": f'"{etag}"'} if etag else {}
+    response = relay.get(f"/users/{admission_id}/public_key", headers=headers)
+    if response.status_code == 304:
+        return None, etag
+    if response.status_code != 200:
+        raise RuntimeError("Failed to fetch recipient public key.")
+    return response.json()['public_key'], response.json()['etag']
+
+
+def fetch_public_keys(known_etags):
+    """
+    Batch form of fetch_public_key for {admission_id: etag or None}.
+    Returns ({admission_id: (pem, etag)}, unchanged_ids).
+    """
+    response = relay.post("/users/public_keys", json={
+        "admission_ids": list(known_etags),
+        "etags": {a: etag for a, etag in known_etags.items() if etag}
+    })
+    if response.status_code != 200:
+        raise RuntimeError("Failed to fetch recipient public keys.")
+    body = response.json()
+    keys = {a: (entry["public_key"], entry["etag"]) for a, entry in body["keys"].items()}
+    return keys, body["unchanged"]
+
+
+def fetch_recipient_keys(recipient_ids):
+    """Public key PEM for every recipient, from the local cache where it is still fresh."""
+    if len(recipient_ids) == 1:
+        return {recipient_ids[0]: public_key_cache.get(recipient_ids[0], fetch_public_key)}
+    return public_key_cache.get_many(recipient_ids, fetch_public_keys)
+
+
+# === Delta Re-send ===
+signature_cache = ChunkSignatureCache(os.path.join(STATE_DIR, "chunk_signatures.json"))
+
+
+def find_reusable_chunks(recipient_ids, file_path, plan, chunking):
+    """
+    Compare the plan with the last version of this file sent to these
+    recipients. Returns (aes_key, references) where references maps chunk
+    index -> {"hash", "aad_index"} of a blob already on the relay, or
+    (None, {}) when nothing can be reused.
+    """
+    lineages = [signature_cache.lookup(r, file_path) for r in recipient_ids]
+    previous = lineages[0]
+    if not previous or previous["chunking"] != chunking:
+        return None, {}
+    # Only reuse a key every recipient already holds; otherwise a new
+    # recipient could decrypt earlier versions sent to someone else
+    if any(not lineage or lineage["aes_key"] != previous["aes_key"] for lineage in lineages):
+        return None, {}
+
+    references = {}
+    for entry in plan:
+        known = previous["chunks"].get(entry["signature"])
+        if known:
+            references[str(entry["index"])] = known
+    if not references:
+        return None, {}
+    return base64.b64decode(previous["aes_key"]), references
+
+
+def open_upload_session(sender_id, recipient_ids, file_path, chunk_count, aes_key=None, references=None,
+                        archive=None):
+    """
+    Create a new relay upload session and return its resumable state. The
+    file is encrypted once; only the AES key is wrapped per recipient.
+    """
+    aes_key = aes_key or generate_aes_key()
+
+    public_keys = fetch_recipient_keys(recipient_ids)
+    recipients = []
+    for r in recipient_ids:
+        receipt_key, receipt_hash = new_transfer_receipt(public_keys[r])
+        recipients.append({"to": r, "encrypted_key": encrypt_aes_key_with_rsa(aes_key, public_keys[r]),
+                           "receipt_key": receipt_key, "receipt_hash": receipt_hash})
+
+    result = relay.post("/uploads", json={
+        "from": sender_id,
+        "recipients": recipients,
+        "filename": os.path.basename(file_path),
+        "chunk_count": chunk_count,
+        "cipher": CIPHER_GCM,
+        "references": references or {},
+        "archive": archive
+    })
+    if result.status_code == 507:
+        raise RuntimeError(inbox_full_message(result))
+    if result.status_code != 201:
+        raise RuntimeError(f"Failed to open upload.\n{result.text}")
+
+    return {
+        "upload_id": result.json()["upload_id"],
+        "aes_key": base64.b64encode(aes_key).decode(),
+        "cipher": CIPHER_GCM
+    }
+
+
+def inbox_full_message(result):
+    """Error text for a 507 answer: the relay refuses transfers to recipients over their storage quota."""
+    return f"Inbox full on the relay for: {', '.join(result.json().get('recipients', []))}"
+
+
+def fetch_upload_status(upload_id):
+    """Return the relay's view of an upload (received hashes, missing indices), or None if it is gone."""
+    response = relay.get(f"/uploads/{upload_id}")
+    if response.status_code != 200:
+        return None
+    return response.json()
+
+
+def put_chunk(upload_path, chunk):
+    result = relay.put(
+        f"{upload_path}/chunks/{chunk['index']}",
+        data=encode_frame(chunk["index"], chunk["data"], chunk["hash"], codec_flags(chunk["codec"])),
+        headers={"Content-Type": CONTENT_TYPE}
+    )
+    if result.status_code != 200:
+        raise RuntimeError(f"Chunk {chunk['index']} was rejected.\n{result.text}")
+
+
+def send_file_resumable(sender_id, recipient_ids, file_path, chunking=CHUNKING_FIXED, compress=False,
+                        archive=None, on_progress=None):
+    """
+    Send a file to one recipient or a list of them through a relay upload
+    session, resuming an interrupted one and reusing chunks of the previous
+    version sent to the same recipients. With `compress`, chunks that shrink
+    are zlib-compressed before encryption; `archive` marks the file as a
+    packed batch. `on_progress(done_bytes, total_bytes)` is called as chunks
+    reach the relay. Returns (chunk_count, chunks_reused).
+    """
+    if isinstance(recipient_ids, str):
+        recipient_ids = [recipient_ids]
+    # Planning reads the whole file before anything is sent; reporting no
+    # progress after each chunk still lets a cancel stop it part way
+    file_size = os.path.getsize(file_path)
+    plan = build_chunk_plan(file_path, chunking,
+                            on_chunk=(lambda entry: on_progress(0, file_size)) if on_progress else None)
+    chunk_count = len(plan)
+    if chunk_count == 0:
+        raise ValueError("Cannot send an empty file.")
+
+    state_key = upload_state_key(file_path, ",".join(sorted(recipient_ids)))
+    upload = load_pending_uploads().get(state_key)
+    if upload and (upload.get("cipher") != CIPHER_GCM or upload.get("chunking", CHUNKING_FIXED) != chunking):
+        upload = None  # Different chunk format or boundaries; chunks cannot be mixed
+
+    status = fetch_upload_status(upload["upload_id"]) if upload else None
+    if status is None:
+        aes_key, references = find_reusable_chunks(recipient_ids, file_path, plan, chunking)
+        upload = open_upload_session(sender_id, recipient_ids, file_path, chunk_count, aes_key, references,
+                                     archive)
+        upload["chunking"] = chunking
+        update_pending_upload(state_key, upload)
+        status = fetch_upload_status(upload["upload_id"])
+        if status is None:
+            raise RuntimeError("Upload session disappeared on the relay.")
+
+    upload_path = f"/uploads/{upload['upload_id']}"
+    aes_key = base64.b64decode(upload["aes_key"])
+    references = status.get("references", {})
+
+    # Merkle leaves: the relay reports hashes of chunks it already holds
+    # (uploaded earlier or referenced), the rest are filled in as chunks are
+    # encrypted
+    leaves = {int(i): h for i, h in status["received_hashes"].items()}
+    codecs = {int(i): c for i, c in status.get("codecs", {}).items()}
+
+    total_bytes = sum(entry["size"] for entry in plan)
+    sent_bytes = sum(plan[i]["size"] for i in leaves if i < chunk_count)
+    if on_progress:
+        on_progress(sent_bytes, total_bytes)
+
+    # Encryption runs ahead on the chunk engine while up to UPLOAD_WORKERS
+    # chunk PUTs are in flight, so CPU work and network round trips overlap
+    in_flight = deque()
+
+    def wait_for_oldest():
+        nonlocal sent_bytes
+        size, future = in_flight.popleft()
+        future.result()
+        sent_bytes += size
+        if on_progress:
+            on_progress(sent_bytes, total_bytes)
+
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as uploader:
+        for chunk in encrypt_file_stream(file_path, aes_key, skip=set(leaves), plan=plan, compress=compress):
+            leaves[chunk["index"]] = chunk["hash"]
+            codecs[chunk["index"]] = chunk["codec"]
+            in_flight.append((plan[chunk["index"]]["size"], uploader.submit(put_chunk, upload_path, chunk)))
+            if len(in_flight) >= UPLOAD_WORKERS:
+                wait_for_oldest()
+        while in_flight:
+            wait_for_oldest()
+
+    manifest = build_manifest(leaves[i] for i in range(chunk_count))
+    result = relay.post(f"{upload_path}/complete", json={
+        "merkle_root": manifest["root"], "root_mac": merkle_root_mac(aes_key, manifest["root"])
+    })
+    if result.status_code == 507:
+        raise RuntimeError(inbox_full_message(result))
+    if result.status_code != 200:
+        raise RuntimeError(f"Failed to send file.\n{result.text}")
+
+    update_pending_upload(state_key)
+
+    # Remember where every chunk of this version lives for the next re-send
+    signatures = {}
+    for entry in plan:
+        index = entry["index"]
+        known = references.get(str(index)) or {"hash": leaves[index], "aad_index": index}
+        if codecs.get(index):
+            known["codec"] = codecs[index]
+        signatures[entry["signature"]] = known
+    for recipient_id in recipient_ids:
+        signature_cache.remember(recipient_id, file_path, upload["aes_key"], chunking, signatures)
+
+    return chunk_count, len(references)
+
+
+# === Directory Batches ===
+# A directory tree is packed into one tar in the outbox and sent as a
+# single transfer. The archive stays until the send completes, so an
+# interrupted batch resumes from the same bytes instead of being repacked.
+OUTBOX_DIR = os.path.join(STATE_DIR, "outbox")
+
+
+def send_directory_resumable(sender_id, recipient_ids, directory, chunking=CHUNKING_FIXED, compress=True,
+                             on_progress=None):
+    """Send a whole directory tree as one batch transfer. Returns (chunk_count, chunks_reused)."""
+    if isinstance(recipient_ids, str):
+        recipient_ids = [recipient_ids]
+    directory = os.path.abspath(directory)
+    name = os.path.basename(directory.rstrip(os.sep)) or "files"
+    batch_key = f"{','.join(sorted(recipient_ids))}|{directory}"
+    batch_dir = os.path.join(OUTBOX_DIR, hashlib.sha256(batch_key.encode()).hexdigest()[:16])
+    archive_path = os.path.join(batch_dir, f"{name}.tar")
+
+    if on_progress:
+        on_progress(0, 0)  # Packing comes first; lets a cancel land before it starts
+
+    resumable = (os.path.exists(archive_path)
+                 and upload_state_key(archive_path, ",".join(sorted(recipient_ids))) in load_pending_uploads())
+    if not resumable:
+        os.makedirs(batch_dir, exist_ok=True)
+        file_count, _ = build_directory_archive(directory, archive_path)
+        if file_count == 0:
+            shutil.rmtree(batch_dir, ignore_errors=True)
+            raise ValueError("The selected folder contains no files.")
+
+    result = send_file_resumable(sender_id, recipient_ids, archive_path, chunking, compress, archive=ARCHIVE_TAR,
+                                 on_progress=on_progress)
+    shutil.rmtree(batch_dir, ignore_errors=True)
+    return result
+
+
+def launch_send_gui(sender_id, recipient_ids):
+    if isinstance(recipient_ids, str):
+        recipient_ids = [recipient_ids]
+
     root = tk.Tk()
     root.title("📤 Send File - Secure Transfer")
     root.resizable(False, False)
@@ -46,68 +362,96 @@ def launch_send_gui(sender_id, recipient_id):
     root.geometry(f"{WINDOW_WIDTH}x{WINDOW_HEIGHT}+{x}+{y}")
 
     selected_file = tk.StringVar()
+    content_defined = tk.BooleanVar(value=False)
+    compress = tk.BooleanVar(value=True)
+
+    # Sends run in the background; the same path is never sent twice at once
+    # since both would resume the same upload session
+    manager = TransferManager()
+    sending = {}
 
     def select_file():
         file_path = filedialog.askopenfilename()
         if file_path:
             selected_file.set(file_path)
 
+    def select_folder():
+        folder = filedialog.askdirectory()
+        if folder:
+            selected_file.set(folder)
+
     def send_file():
         file_path = selected_file.get()
         if not file_path:
             messagebox.showwarning("No File Selected", "Please select a file to send.")
             return
+        if file_path in sending.values():
+            messagebox.showwarning("Already Sending", "This file is already being sent.")
+            return
+
+        chunking = CHUNKING_CDC if content_defined.get() else CHUNKING_FIXED
+        label = f"📤 {os.path.basename(file_path.rstrip(os.sep))}"
+        if os.path.isdir(file_path):
+            transfer = manager.submit(label, send_directory_resumable, sender_id, recipient_ids, file_path,
+                                      chunking, compress.get())
+        else:
+            transfer = manager.submit(label, send_file_resumable, sender_id, recipient_ids, file_path,
+                                      chunking, compress.get())
+        sending[transfer.id] = file_path
+        selected_file.set("")
 
-        try:
-            aes_key = generate_aes_key()
-
-            # Fetch recipient's public key
-            response = requests.get(f"{RELAY_SERVER}/users/{recipient_id}", verify=False)
-            if response.status_code != 200:
-                messagebox.showerror("Error", "Failed to fetch recipient public key.")
-                return
-
-            recipient_data = response.json()
-            public_key_pem = recipient_data['public_key']
-
-            encrypted_aes_key = encrypt_aes_key_with_rsa(aes_key, public_key_pem)
-            chunks = split_file_into_chunks(file_path)
-
-            encrypted_chunks = []
-            for index, chunk in chunks:
-                encrypted = encrypt_chunk_with_aes(chunk, aes_key)
-                encrypted_chunks.append({
-                    "index": index,
-                    "data": base64.b64encode(encrypted).decode(),
-                    "hash": compute_sha256(encrypted)
-                })
-
-            payload = {
-                "from": sender_id,
-                "to": recipient_id,
-                "encrypted_key": encrypted_aes_key,
-                "filename": os.path.basename(file_path),
-                "chunks": encrypted_chunks
-            }
-
-            result = requests.post(f"{RELAY_SERVER}/transfer", json=payload, verify=False)
-            if result.status_code == 200:
-                messagebox.showinfo("Success", "✅ File sent successfully!")
-                root.destroy()
-            else:
-                messagebox.showerror("Server Error", f"Failed to send file.\n{result.text}")
-
-        except Exception as e:
-            messagebox.showerror("Send Error", str(e))
+    def on_finished(transfer):
+        sending.pop(transfer.id, None)
+        if transfer.state == DONE:
+            chunk_count, reused = transfer.result
+            message = "✅ Sent"
+            if len(recipient_ids) > 1:
+                message = f"✅ Sent to {len(recipient_ids)} recipients (uploaded once)"
+            if reused:
+                message += f", {reused} of {chunk_count} chunks unchanged"
+            panel.set_status(transfer, message)
+        elif transfer.state == FAILED and isinstance(transfer.error, requests.exceptions.ConnectionError):
+            panel.set_status(transfer, "❌ Connection lost. Send the same file again to resume.")
+
+    def close_window():
+        if manager.active() and not messagebox.askyesno(
+                "Transfers Running", "Cancel the transfers still running and close?"):
+            return
+        manager.shutdown()
+        root.destroy()
 
     # === UI Layout ===
-    tk.Label(root, text=f"Recipient: {recipient_id}", font=("Arial", 12, "bold")).pack(pady=(20, 10))
+    if len(recipient_ids) == 1:
+        recipient_text = f"Recipient: {recipient_ids[0]}"
+    elif len(recipient_ids) <= 3:
+        recipient_text = f"Recipients: {', '.join(recipient_ids)}"
+    else:
+        recipient_text = f"Recipients: {', '.join(recipient_ids[:3])} and {len(recipient_ids) - 3} more"
+    tk.Label(root, text=recipient_text, font=("Arial", 12, "bold")).pack(pady=(20, 10))
 
     entry_frame = tk.Frame(root)
     entry_frame.pack(pady=5)
-    tk.Entry(entry_frame, textvariable=selected_file, width=40, state='readonly').grid(row=0, column=0, padx=5)
+    tk.Entry(entry_frame, textvariable=selected_file, width=32, state='readonly').grid(row=0, column=0, padx=5)
     tk.Button(entry_frame, text="📁 Browse", command=select_file).grid(row=0, column=1, padx=5)
+    tk.Button(entry_frame, text="📂 Folder", command=select_folder).grid(row=0, column=2, padx=5)
+
+    tk.Checkbutton(
+        root,
+        text="Content-defined chunking (best for re-sending edited files)",
+        variable=content_defined
+    ).pack(pady=(10, 0))
+
+    tk.Checkbutton(
+        root,
+        text="Compress before encrypting (skipped for data that won't shrink)",
+        variable=compress
+    ).pack()
+
+    tk.Button(root, text="🚀 Send File", width=25, command=send_file).pack(pady=(15, 10))
+
+    panel = TransferPanel(root, manager, on_finished=on_finished)
+    panel.pack(padx=10, pady=(0, 10), fill="both", expand=True)
 
-    tk.Button(root, text="🚀 Send File", width=25, command=send_file).pack(pady=25)
+    root.protocol("WM_DELETE_WINDOW", close_window)
 
     root.mainloop()
@@ -0,0 +1,74 @@
+import os
+import json
+import uuid
+import threading
+from datetime import datetime
+
+# === Sender-side Chunk Signature Cache ===
+#
+# For every (recipient, filename) the sender remembers the last version it
+# sent: the AES key, the chunking mode, and for each plaintext chunk
+# signature the relay blob that holds it plus the index it was encrypted
+# under (its GCM associated data). When a new version of the same file goes
+# to the same recipient, chunks with a known signature are sent as
+# references to those blobs instead of being encrypted and uploaded again.
+#
+# Reusing the key is what lets the recipient decrypt the referenced blobs
+# with the key wrapped in the new transfer; each GCM chunk still gets a
+# fresh random nonce. The cache holds raw AES keys, so it is written
+# owner-only, like the pending-upload state.
+
+MAX_LINEAGES = 200
+
+
+class ChunkSignatureCache:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()  # Concurrent sends each re-read before changing the file
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r") as f:
+            return json.load(f)
+
+    def _save(self, entries):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        partial = f"{self.path}.{uuid.uuid4().hex}.part"
+        fd = os.open(partial, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(entries, f)
+        os.replace(partial, self.path)
+
+    @staticmethod
+    def _key(recipient_id, filename):
+        return f"{recipient_id}|{os.path.basename(filename)}"
+
+    def lookup(self, recipient_id, filename):
+        """Return the last version sent, as {"aes_key", "chunking", "chunks"}, or None."""
+        return self._load().get(self._key(recipient_id, filename))
+
+    def remember(self, recipient_id, filename, aes_key_b64, chunking, chunks):
+        """
+        Replace the lineage for (recipient, filename). `chunks` maps plaintext
+        signature -> {"hash", "aad_index"} plus "codec" for compressed chunks.
+        """
+        with self._lock:
+            entries = self._load()
+            entries[self._key(recipient_id, filename)] = {
+                "aes_key": aes_key_b64,
+                "chunking": chunking,
+                "chunks": chunks,
+                "updated": datetime.now().isoformat()
+            }
+            # Only the newest lineages are worth keeping
+            if len(entries) > MAX_LINEAGES:
+                newest = sorted(entries.items(), key=lambda item: item[1]["updated"], reverse=True)
+                entries = dict(newest[:MAX_LINEAGES])
+            self._save(entries)
+
+    def forget(self, recipient_id, filename):
+        with self._lock:
+            entries = self._load()
+            if entries.pop(self._key(recipient_id, filename), None) is not None:
+                self._save(entries)
@@ -0,0 +1,153 @@
+import json
+import struct
+
+# === SFT BINARY TRANSFER FORMAT ===
+#
+# [ MAGIC | version:u8 | header_len:u32 | header JSON ]
+# [ index:u32 | flags:u8 | length:u32 | sha256:32 bytes | ciphertext ] * n
+# [ END_OF_FRAMES frame (index 0xFFFFFFFF, length 0) ]
+#
+# The header carries from / to / encrypted_key / filename and, when the
+# writer already knows it, a "chunks" table of {"index", "size", "hash"}.
+# A streaming sender cannot know chunk hashes up front, so it leaves the
+# table out and every frame describes itself; the relay fills the table in
+# when it serves a stored transfer back to a receiver.
+# All integers are big-endian. The frame "flags" byte carries per-chunk
+# options: bit 0 marks a chunk whose plaintext was zlib-compressed before
+# encryption (the "codec" of the chunk in metadata); other bits must be 0.
+# An all-zero sha256 field means the writer supplied no digest (AEAD
+# chunks authenticate themselves); readers then get None as the hash.
+
+MAGIC = b"SFTX"
+FORMAT_VERSION = 1
+CONTENT_TYPE = "application/x-sft-transfer"
+
+END_OF_FRAMES = 0xFFFFFFFF
+MAX_HEADER_SIZE = 16 * 1024 * 1024
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+STREAM_PIECE_SIZE = 256 * 1024  # Read size when copying a frame body without holding it
+
+FLAG_ZLIB = 0x01
+CODEC_FLAGS = {"zlib": FLAG_ZLIB}
+
+_PREAMBLE = struct.Struct(">4sBI")
+_FRAME = struct.Struct(">IBI32s")
+_NO_DIGEST = bytes(32)
+FRAME_HEADER_SIZE = _FRAME.size
+
+
+class TransferFormatError(ValueError):
+    pass
+
+
+def codec_flags(codec):
+    """Frame flags for a chunk codec (None means uncompressed)."""
+    if codec is None:
+        return 0
+    if codec not in CODEC_FLAGS:
+        raise TransferFormatError(f"Unsupported chunk codec: {codec!r}")
+    return CODEC_FLAGS[codec]
+
+
+def flags_codec(flags):
+    """Chunk codec named by frame flags, or None for an uncompressed chunk."""
+    if flags == 0:
+        return None
+    for codec, flag in CODEC_FLAGS.items():
+        if flags == flag:
+            return codec
+    raise TransferFormatError(f"Unsupported frame flags: {flags:#04x}")
+
+
+# === WRITING ===
+def encode_header(header):
+    body = json.dumps(header, separators=(",", ":")).encode()
+    return _PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(body)) + body
+
+
+def encode_frame(index, data, digest=None, flags=0):
+    if digest is None:
+        digest = _NO_DIGEST
+    elif isinstance(digest, str):
+        digest = bytes.fromhex(digest)
+    return _FRAME.pack(index, flags, len(data), digest) + data
+
+
+def encode_end():
+    return _FRAME.pack(END_OF_FRAMES, 0, 0, _NO_DIGEST)
+
+
+def iter_transfer_stream(header, encrypted_chunks):
+    """Yield a complete transfer as bytes, one frame per encrypted chunk record."""
+    yield encode_header(header)
+    for chunk in encrypted_chunks:
+        yield encode_frame(chunk["index"], chunk["data"], chunk["hash"], codec_flags(chunk.get("codec")))
+    yield encode_end()
+
+
+# === READING ===
+def read_exact(stream, size):
+    parts = []
+    remaining = size
+    while remaining:
+        part = stream.read(remaining)
+        if not part:
+            raise TransferFormatError("Unexpected end of transfer stream")
+        parts.append(part)
+        remaining -= len(part)
+    return b"".join(parts)
+
+
+def iter_exact(stream, size, piece_size=STREAM_PIECE_SIZE):
+    """Yield exactly `size` bytes from `stream` in pieces of at most `piece_size`."""
+    remaining = size
+    while remaining:
+        part = stream.read(min(remaining, piece_size))
+        if not part:
+            raise TransferFormatError("Unexpected end of transfer stream")
+        remaining -= len(part)
+        yield part
+
+
+def read_header(stream, max_size=MAX_HEADER_SIZE):
+    magic, version, header_len = _PREAMBLE.unpack(read_exact(stream, _PREAMBLE.size))
+    if magic != MAGIC:
+        raise TransferFormatError("Not an SFT transfer stream")
+    if version != FORMAT_VERSION:
+        raise TransferFormatError(f"Unsupported transfer format version: {version}")
+    if header_len > max_size:
+        raise TransferFormatError("Transfer header too large")
+    return json.loads(read_exact(stream, header_len))
+
+
+def read_frame_header(stream):
+    """
+    Return (index, flags, hash_hex_or_None, length) of the next frame, or None
+    at the end-of-frames marker. The caller then reads exactly `length` bytes
+    of ciphertext, e.g. with iter_exact() to avoid holding the frame in memory.
+    """
+    index, flags, length, digest = _FRAME.unpack(read_exact(stream, _FRAME.size))
+    if index == END_OF_FRAMES:
+        return None
+    if length > MAX_FRAME_SIZE:
+        raise TransferFormatError(f"Frame {index} exceeds maximum size")
+    hash_hex = None if digest == _NO_DIGEST else digest.hex()
+    return index, flags, hash_hex, length
+
+
+def read_frame(stream):
+    """Return (index, flags, hash_hex_or_None, data), or None at the end-of-frames marker."""
+    frame = read_frame_header(stream)
+    if frame is None:
+        return None
+    index, flags, hash_hex, length = frame
+    return index, flags, hash_hex, read_exact(stream, length)
+
+
+def iter_frames(stream):
+    """Yield (index, flags, hash_hex_or_None, data) until the end-of-frames marker."""
+    while True:
+        frame = read_frame(stream)
+        if frame is None:
+            return
+        yield frame
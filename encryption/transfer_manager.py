@@ -0,0 +1,241 @@
+import time
+import queue
+import threading
+import tkinter as tk
+from tkinter import ttk
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# === Background Transfers ===
+#
+# Sends and downloads run on a small worker pool instead of the Tk main
+# thread, so windows stay responsive and several transfers run at once.
+# Workers never touch widgets: each Transfer posts its state changes to the
+# manager's event queue, and the window drains that queue every
+# POLL_INTERVAL_MS with root.after and updates the progress panel.
+#
+# A transfer function takes an `on_progress(done_bytes, total_bytes)`
+# callback and calls it as work completes. Cancelling a transfer makes the next
+# progress call raise TransferCancelled, which unwinds the function like any
+# other error (resumable uploads keep their state, downloads remove their
+# partial file).
+
+MAX_ACTIVE_TRANSFERS = 3
+POLL_INTERVAL_MS = 100
+PROGRESS_INTERVAL = 0.2  # Seconds between progress events per transfer
+RATE_WINDOW = 5.0  # Seconds of samples behind the throughput figure
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class TransferCancelled(Exception):
+    pass
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds // 3600}h {seconds // 60 % 60:02d}m"
+
+
+def format_rate(bytes_per_second):
+    for unit in ("B/s", "KB/s", "MB/s"):
+        if bytes_per_second < 1024 or unit == "MB/s":
+            return f"{bytes_per_second:.0f} {unit}" if unit == "B/s" else f"{bytes_per_second:.1f} {unit}"
+        bytes_per_second /= 1024
+
+
+class Transfer:
+    def __init__(self, transfer_id, label, events):
+        self.id = transfer_id
+        self.label = label
+        self.state = QUEUED
+        self.done = 0
+        self.total = 0
+        self.result = None
+        self.error = None
+        self._events = events
+        self._cancel = threading.Event()
+        self._samples = deque()
+        self._last_event = 0.0
+
+    def cancel(self):
+        self._cancel.set()
+        self._events.put(self)
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    @property
+    def finished(self):
+        return self.state in (DONE, FAILED, CANCELLED)
+
+    def progress(self, done, total):
+        """Progress callback handed to the transfer function (worker thread)."""
+        if self._cancel.is_set():
+            raise TransferCancelled()
+        now = time.monotonic()
+        self.done, self.total = done, total
+        self._samples.append((now, done))
+        while len(self._samples) > 2 and now - self._samples[0][0] > RATE_WINDOW:
+            self._samples.popleft()
+        if now - self._last_event >= PROGRESS_INTERVAL or done >= total:
+            self._last_event = now
+            self._events.put(self)
+
+    def rate(self):
+        """Recent throughput in bytes per second, or None before there is enough to tell."""
+        samples = list(self._samples)
+        if len(samples) < 2 or samples[-1][0] <= samples[0][0]:
+            return None
+        return (samples[-1][1] - samples[0][1]) / (samples[-1][0] - samples[0][0])
+
+    def eta(self):
+        """Seconds left at the recent rate, or None if unknown."""
+        rate = self.rate()
+        if not rate or self.total <= 0:
+            return None
+        return max(self.total - self.done, 0) / rate
+
+
+class TransferManager:
+    def __init__(self, workers=MAX_ACTIVE_TRANSFERS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="transfer")
+        self._events = queue.Queue()
+        self._next_id = 0
+        self.transfers = {}
+
+    def submit(self, label, func, *args, **kwargs):
+        """Queue func(*args, on_progress=..., **kwargs) on the worker pool. Returns its Transfer."""
+        self._next_id += 1
+        transfer = Transfer(self._next_id, label, self._events)
+        self.transfers[transfer.id] = transfer
+        self._events.put(transfer)
+        self._executor.submit(self._run, transfer, func, args, kwargs)
+        return transfer
+
+    def _run(self, transfer, func, args, kwargs):
+        if transfer.cancel_requested:
+            transfer.state = CANCELLED
+            self._events.put(transfer)
+            return
+        transfer.state = RUNNING
+        self._events.put(transfer)
+        try:
+            transfer.result = func(*args, on_progress=transfer.progress, **kwargs)
+            transfer.state = DONE
+        except TransferCancelled:
+            transfer.state = CANCELLED
+        except Exception as e:
+            transfer.error = e
+            transfer.state = FAILED
+        self._events.put(transfer)
+
+    def active(self):
+        return [t for t in self.transfers.values() if not t.finished]
+
+    def poll(self, root, on_update, interval=POLL_INTERVAL_MS):
+        """Deliver queued updates to on_update(transfer) on the Tk thread, now and every `interval` ms."""
+        changed = {}
+        while True:
+            try:
+                transfer = self._events.get_nowait()
+            except queue.Empty:
+                break
+            changed[transfer.id] = transfer
+        for transfer in changed.values():
+            on_update(transfer)
+        root.after(interval, self.poll, root, on_update, interval)
+
+    def shutdown(self):
+        """Cancel everything still queued or running and let the workers wind down."""
+        for transfer in self.active():
+            transfer.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=False)
+
+
+# === Progress Panel ===
+class TransferPanel(tk.LabelFrame):
+    """Scrollable list of transfers with a progress bar, speed/ETA and a Cancel button each."""
+
+    def __init__(self, master, manager, on_finished=None, height=120, **kwargs):
+        super().__init__(master, text="Transfers", padx=5, pady=5, **kwargs)
+        self.manager = manager
+        self.on_finished = on_finished
+        self._rows = {}
+        self._finished = set()
+
+        canvas = tk.Canvas(self, height=height, highlightthickness=0)
+        scrollbar = tk.Scrollbar(self, orient="vertical", command=canvas.yview)
+        self._inner = tk.Frame(canvas)
+        self._inner.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
+        window = canvas.create_window((0, 0), window=self._inner, anchor="nw")
+        canvas.bind("<Configure>", lambda e: canvas.itemconfigure(window, width=e.width))
+        canvas.configure(yscrollcommand=scrollbar.set)
+        canvas.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+
+        manager.poll(self, self.update_transfer)
+
+    def _add_row(self, transfer):
+        row = tk.Frame(self._inner, pady=2)
+        row.pack(fill="x")
+        tk.Label(row, text=transfer.label, anchor="w", font=("Arial", 9, "bold")).grid(row=0, column=0, sticky="w")
+        bar = ttk.Progressbar(row, mode="determinate", maximum=1)
+        bar.grid(row=1, column=0, sticky="ew")
+        status = tk.Label(row, text="Queued", anchor="w", font=("Arial", 8))
+        status.grid(row=2, column=0, sticky="w")
+        button = tk.Button(row, text="✖", width=3, command=transfer.cancel)
+        button.grid(row=0, column=1, rowspan=3, padx=(5, 0))
+        row.columnconfigure(0, weight=1)
+        self._rows[transfer.id] = (bar, status, button)
+
+    def update_transfer(self, transfer):
+        if transfer.id not in self._rows:
+            self._add_row(transfer)
+        bar, status, button = self._rows[transfer.id]
+
+        if transfer.state == RUNNING:
+            if transfer.cancel_requested:
+                status.config(text="Cancelling...")
+                button.config(state="disabled")
+                return
+            bar["maximum"] = max(transfer.total, 1)
+            bar["value"] = transfer.done
+            if not transfer.total:
+                status.config(text="Preparing...")
+                return
+            parts = [f"{transfer.done * 100 // transfer.total}%"]
+            rate, eta = transfer.rate(), transfer.eta()
+            if rate is not None:
+                parts.append(format_rate(rate))
+            if eta is not None:
+                parts.append(f"{format_duration(eta)} left")
+            status.config(text=" · ".join(parts))
+            return
+
+        if not transfer.finished or transfer.id in self._finished:
+            return
+        self._finished.add(transfer.id)
+        button.config(state="disabled")
+        if transfer.state == DONE:
+            bar["value"] = bar["maximum"]
+            status.config(text="✅ Done")
+        elif transfer.state == CANCELLED:
+            status.config(text="Cancelled")
+        else:
+            status.config(text=f"❌ {transfer.error}")
+        if self.on_finished:
+            self.on_finished(transfer)
+
+    def set_status(self, transfer, text):
+        """Replace the status line of a finished transfer (e.g. with a result summary)."""
+        self._rows[transfer.id][1].config(text=text)
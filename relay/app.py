@@ -1,28 +1,178 @@
 import os
+import re
 import sys
 import json
-import sqlite3
+import math
+import uuid
+import shutil
+import base64
+import hmac
+import hashlib
 from datetime import datetime
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, send_file
+from werkzeug.exceptions import RequestEntityTooLarge
 
 # === Append project root to sys.path ===
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 # === Local imports (after fixing sys.path) ===
-from db import initialize_db, get_db_connection
+# Package-qualified so admin_utils shares this module and its connection pool
+from relay.db import (
+    initialize_db,
+    create_user,
+    all_users,
+    find_user,
+    find_public_key,
+    find_public_keys,
+    index_transfer,
+    count_indexed_transfers,
+    list_indexed_transfers,
+    list_transfers_after,
+    count_blob_refs,
+    rebuild_blob_refs,
+    inbox_usage,
+    storage_usage
+)
+from storage import TransferStore, StorageError, is_valid_name, LEGACY_CIPHER, SUPPORTED_CIPHERS
+from sessions import SessionTracker
+from retention import RetentionSweeper
+from inbox_events import InboxNotifier, TooManyWaiters
+from json_stream import iter_json_transfer, JSONStreamError, ValueTooLarge
 from admin.admin_utils import (
     require_admin_auth,
+    is_admin_request,
     load_transfer_logs,
-    load_active_sessions,
     get_all_users, SESSION_FILE
 )
+from encryption.transfer_format import (
+    CONTENT_TYPE as TRANSFER_CONTENT_TYPE,
+    TransferFormatError,
+    read_header,
+    read_frame_header,
+    iter_exact,
+    FRAME_HEADER_SIZE,
+    MAX_FRAME_SIZE,
+    encode_header,
+    encode_frame,
+    encode_end,
+    codec_flags,
+    flags_codec,
+    CODEC_FLAGS
+)
+from encryption.crypto_utils import merkle_root, merkle_proof, public_key_fingerprint
+from encryption.archive import SUPPORTED_ARCHIVES
 
 # === Initialize Flask app ===
 app = Flask(__name__)
 initialize_db()
 
 # === Paths ===
-from admin.admin_utils import TRANSFER_LOG_FILE as TRANSFER_LOG_PATH
+from admin.admin_utils import TRANSFER_LOG_FILE as LEGACY_TRANSFER_LOG_PATH, transfer_log
+LEGACY_TRANSFERS_DIR = os.path.join(os.path.dirname(__file__), "..", "transfers")
+STORAGE_DIR = os.path.join(os.path.dirname(__file__), "..", "storage")
+UPLOADS_DIR = os.path.join(os.path.dirname(__file__), "..", "uploads")
+
+# === Transfer storage (metadata records + content-addressed chunk blobs) ===
+store = TransferStore(STORAGE_DIR)
+store.migrate_legacy_transfers(LEGACY_TRANSFERS_DIR)
+if count_indexed_transfers() == 0:
+    for existing in store.iter_records():
+        index_transfer(existing)
+elif count_blob_refs() == 0:
+    # Transfers indexed before blobs were reference-counted
+    rebuild_blob_refs(store.iter_records())
+
+# === Active sessions (in memory, snapshotted to SESSION_FILE in the background) ===
+sessions = SessionTracker(SESSION_FILE)
+sessions.start()
+
+# === Transfer log (append-only segments; the old single JSON file is imported once) ===
+transfer_log.import_legacy(LEGACY_TRANSFER_LOG_PATH)
+
+INBOX_PAGE_SIZE = 50
+INBOX_MAX_PAGE_SIZE = 200
+
+# === Request Size Limits ===
+# No request body is ever held in memory beyond max_request_memory: that is
+# the cap for JSON bodies, transfer headers and single values of a legacy
+# JSON transfer. Transfer ciphertext is streamed to disk piece by piece, so
+# the streaming endpoints raise only the total body size, to
+# max_transfer_bytes (or one frame for a chunk PUT). Werkzeug refuses a
+# Content-Length over the limit before any of the body is read and stops a
+# chunked body once it passes it. Both can be set in the "limits" section
+# of config.json.
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "config.json")
+DEFAULT_REQUEST_LIMITS = {
+    "max_request_memory": 16 * 1024 * 1024,
+    "max_transfer_bytes": 8 * 1024 * 1024 * 1024
+}
+
+
+def load_config_section(section, defaults):
+    values = dict(defaults)
+    if os.path.exists(CONFIG_PATH):
+        with open(CONFIG_PATH, "r") as f:
+            values.update(json.load(f).get(section, {}))
+    return values
+
+
+REQUEST_LIMITS = load_config_section("limits", DEFAULT_REQUEST_LIMITS)
+MAX_REQUEST_MEMORY = REQUEST_LIMITS["max_request_memory"]
+MAX_TRANSFER_BYTES = REQUEST_LIMITS["max_transfer_bytes"]
+MAX_CHUNK_REQUEST_BYTES = FRAME_HEADER_SIZE + MAX_FRAME_SIZE
+app.config["MAX_CONTENT_LENGTH"] = MAX_REQUEST_MEMORY
+
+# === Retention (acknowledged / expired transfers, quotas; see retention.py) ===
+# inbox_quota_bytes caps the pending bytes waiting in one recipient's inbox;
+# 0 disables it. Transfers to a full inbox are refused with 507.
+DEFAULT_RETENTION = {
+    "transfer_ttl_days": 14,
+    "upload_ttl_hours": 72,
+    "sweep_interval_seconds": 600,
+    "inbox_quota_bytes": 10 * 1024 * 1024 * 1024
+}
+RETENTION = load_config_section("retention", DEFAULT_RETENTION)
+INBOX_QUOTA = RETENTION["inbox_quota_bytes"]
+
+retention = RetentionSweeper(store, UPLOADS_DIR, RETENTION["transfer_ttl_days"],
+                             RETENTION["upload_ttl_hours"], RETENTION["sweep_interval_seconds"])
+retention.start()
+
+
+def full_inboxes(recipient_ids, incoming_bytes=0):
+    """Recipients whose inbox is full or would go over quota with `incoming_bytes` more."""
+    if not INBOX_QUOTA:
+        return []
+    full = []
+    for recipient_id in recipient_ids:
+        _, pending = inbox_usage(recipient_id)
+        if pending >= INBOX_QUOTA or pending + incoming_bytes > INBOX_QUOTA:
+            full.append(recipient_id)
+    return full
+
+
+def inbox_full_response(recipient_ids):
+    return jsonify({"error": "Recipient inbox is full", "recipients": recipient_ids}), 507
+
+# === Inbox events (long-poll for new transfers; see inbox_events.py) ===
+DEFAULT_EVENTS = {
+    "max_wait_seconds": 25,
+    "max_waiters": 48
+}
+EVENTS = load_config_section("events", DEFAULT_EVENTS)
+EVENTS_RETRY_AFTER = 5
+
+inbox_events = InboxNotifier(EVENTS["max_waiters"])
+
+
+@app.errorhandler(StorageError)
+def handle_storage_error(e):
+    return jsonify({"error": str(e)}), 400
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def handle_request_too_large(e):
+    return jsonify({"error": "Request body too large"}), 413
 
 @app.route('/')
 def index():
@@ -39,136 +189,896 @@ def register_user():
 
     if not all([admission_id, password_hash, display_name, public_key]):
         return jsonify({"error": "Missing fields"}), 400
+    if not valid_public_key(public_key):
+        return jsonify({"error": "Invalid public key"}), 400
 
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO users (admission_id, password_hash, display_name, public_key)
-            VALUES (?, ?, ?, ?)
-        ''', (admission_id, password_hash, display_name, public_key))
-        conn.commit()
-        return jsonify({"message": "User registered successfully"}), 201
-    except sqlite3.IntegrityError:
+    if not create_user(admission_id, password_hash, display_name, public_key):
         return jsonify({"error": "Admission ID already exists"}), 409
-    finally:
-        conn.close()
+    return jsonify({"message": "User registered successfully"}), 201
 
 
-# === User Registration ===
+# === Session Heartbeats ===
 @app.route("/admin/active_sessions", methods=["POST"])
 def update_active_sessions():
-    data = request.get_json()
+    # Sent on login and then periodically by the dashboard as a heartbeat
+    data = request.get_json(silent=True) or {}
     admission_id = data.get("admission_id")
-    timestamp = datetime.now().isoformat()
+    if not admission_id:
+        return jsonify({"error": "Missing admission_id"}), 400
 
-    session_entry = {"admission_id": admission_id, "last_active": timestamp}
+    sessions.touch(admission_id)
+    return jsonify({"message": "Session updated"}), 200
 
-    try:
-        # ✅ Ensure the folder exists
-        os.makedirs(os.path.dirname(SESSION_FILE), exist_ok=True)
 
-        if os.path.exists(SESSION_FILE):
-            with open(SESSION_FILE, "r") as f:
-                sessions = json.load(f)
-        else:
-            sessions = []
-
-        sessions = [s for s in sessions if s["admission_id"] != admission_id]
-        sessions.append(session_entry)
-
-        with open(SESSION_FILE, "w") as f:
-            json.dump(sessions, f, indent=2)
-
-        return jsonify({"message": "Session updated"}), 200
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+@app.route("/admin/active_sessions/<admission_id>", methods=["DELETE"])
+def end_active_session(admission_id):
+    if not sessions.end(admission_id):
+        return jsonify({"error": "Session not found"}), 404
+    return jsonify({"message": "Session ended"}), 200
 
 # === List All Users ===
 @app.route('/users', methods=['GET'])
 def list_users():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT admission_id, display_name FROM users')
-    users = cursor.fetchall()
-    conn.close()
-    return jsonify([dict(row) for row in users])
+    return jsonify(all_users())
 
 # === Get User by ID ===
 @app.route('/users/<admission_id>', methods=['GET'])
 def get_user(admission_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE admission_id = ?', (admission_id,))
-    user = cursor.fetchone()
-    conn.close()
+    user = find_user(admission_id)
     if not user:
         return jsonify({"error": "User not found"}), 404
-    return jsonify(dict(user))
+    return jsonify(user)
+
+# === Public Keys ===
+# Senders only need a recipient's key, not the whole user row. The ETag is
+# the SHA-256 of the stored PEM, so clients holding a cached key revalidate
+# with If-None-Match and get an empty 304 while it is unchanged.
+MAX_KEY_BATCH = 500
+
+
+def public_key_etag(public_key_pem):
+    return hashlib.sha256(public_key_pem.encode()).hexdigest()
+
+
+def valid_public_key(public_key_pem):
+    """True if `public_key_pem` is a PEM public key (not a private key) senders can encrypt to."""
+    if not isinstance(public_key_pem, str):
+        return False
+    try:
+        public_key_fingerprint(public_key_pem)
+    except ValueError:
+        return False
+    return True
+
+
+def public_key_entry(admission_id, public_key_pem):
+    """The key as served to senders, or None if the stored PEM cannot be parsed."""
+    try:
+        fingerprint = public_key_fingerprint(public_key_pem)
+    except ValueError:
+        return None
+    return {
+        "admission_id": admission_id,
+        "public_key": public_key_pem,
+        "fingerprint": fingerprint,
+        "etag": public_key_etag(public_key_pem)
+    }
+
+
+@app.route('/users/<admission_id>/public_key', methods=['GET'])
+def get_public_key(admission_id):
+    public_key_pem = find_public_key(admission_id)
+    if not public_key_pem:
+        return jsonify({"error": "User not found"}), 404
+
+    etag = public_key_etag(public_key_pem)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        entry = public_key_entry(admission_id, public_key_pem)
+        if entry is None:
+            return jsonify({"error": "Stored public key is invalid"}), 422
+        response = jsonify(entry)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+# Body: {"admission_ids": [...], "etags": {admission_id: etag}}. Keys whose
+# ETag the client already holds are listed as "unchanged" instead of sent;
+# stored keys that cannot be parsed are listed as "invalid".
+@app.route('/users/public_keys', methods=['POST'])
+def get_public_keys():
+    data = request.get_json(silent=True) or {}
+    admission_ids = data.get('admission_ids')
+    known = data.get('etags') or {}
+    if (not isinstance(admission_ids, list) or not admission_ids
+            or not all(isinstance(a, str) for a in admission_ids) or not isinstance(known, dict)):
+        return jsonify({"error": "admission_ids must be a non-empty list"}), 400
+    if len(admission_ids) > MAX_KEY_BATCH:
+        return jsonify({"error": f"At most {MAX_KEY_BATCH} admission IDs per request"}), 400
+
+    found = find_public_keys(set(admission_ids))
+    keys, unchanged, invalid = {}, [], []
+    for admission_id, public_key_pem in found.items():
+        if known.get(admission_id) == public_key_etag(public_key_pem):
+            unchanged.append(admission_id)
+            continue
+        entry = public_key_entry(admission_id, public_key_pem)
+        if entry is None:
+            invalid.append(admission_id)
+        else:
+            keys[admission_id] = entry
+
+    return jsonify({
+        "keys": keys,
+        "unchanged": sorted(unchanged),
+        "missing": sorted(set(admission_ids) - set(found)),
+        "invalid": sorted(invalid)
+    })
 
 # === Receive a File Transfer ===
 @app.route('/transfer', methods=['POST'])
 def receive_transfer():
-    data = request.get_json()
-    required_fields = ['from', 'to', 'encrypted_key', 'filename', 'chunks']
+    request.max_content_length = MAX_TRANSFER_BYTES
+    # Chunks are staged next to upload sessions and only moved into the blob
+    # store once the whole body has arrived, so a failed or refused transfer
+    # leaves no unreferenced blobs behind
+    staging_dir = os.path.join(UPLOADS_DIR, f"incoming-{uuid.uuid4().hex}")
+    os.makedirs(staging_dir)
+    try:
+        if request.mimetype == TRANSFER_CONTENT_TYPE:
+            return receive_framed_transfer(staging_dir)
+        return receive_json_transfer(staging_dir)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
 
-    if not all(data.get(k) for k in required_fields):
+
+def receive_json_transfer(staging_dir):
+    # Legacy JSON body with base64 chunks (older clients), parsed one chunk
+    # at a time; each chunk is staged as soon as it has been decoded
+    data, staged = {}, []
+    try:
+        for kind, key, value in iter_json_transfer(request.stream, MAX_REQUEST_MEMORY):
+            if kind == "field":
+                data[key] = value
+                continue
+            if not isinstance(value, dict) or not isinstance(value.get('data'), str):
+                return jsonify({"error": f"Invalid chunk {key}"}), 400
+            index = value.get('index', key)
+            if not is_chunk_index(index):
+                return jsonify({"error": f"Invalid chunk {key}"}), 400
+            chunk_path = os.path.join(staging_dir, f"chunk_{len(staged)}.bin")
+            blob_hash, size = spool_parts([base64.b64decode(value['data'])], chunk_path)
+            staged.append((chunk_path, {"index": index, "size": size, "hash": blob_hash}))
+    except ValueTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except (JSONStreamError, ValueError) as e:
+        return jsonify({"error": f"Invalid transfer body: {e}"}), 400
+
+    required_fields = ['from', 'to', 'encrypted_key', 'filename']
+    if not all(data.get(k) for k in required_fields) or not staged:
+        return jsonify({"error": "Missing transfer data"}), 400
+    # Fields may follow the chunks in a JSON body, so they are checked here,
+    # while the chunks are still only staged
+    error = transfer_header_error(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    full = full_inboxes([data['to']], sum(chunk["size"] for _, chunk in staged))
+    if full:
+        return inbox_full_response(full)
+
+    record = store_staged_transfer(data, staged)
+    return jsonify({"message": "Transfer stored", "transfer_id": record["id"]}), 200
+
+
+def receive_framed_transfer(staging_dir):
+    stream = request.stream
+    try:
+        header = read_header(stream, max_size=MAX_REQUEST_MEMORY)
+    except (TransferFormatError, ValueError) as e:
+        return jsonify({"error": f"Invalid transfer header: {e}"}), 400
+    if not isinstance(header, dict):
+        return jsonify({"error": "Invalid transfer header: not a JSON object"}), 400
+
+    required_fields = ['from', 'to', 'encrypted_key', 'filename']
+    if not all(header.get(k) for k in required_fields):
+        return jsonify({"error": "Missing transfer data"}), 400
+    error = transfer_header_error(header)
+    if error:
+        return jsonify({"error": error}), 400
+
+    # Refuse before reading any ciphertext when the declared body size
+    # already cannot fit in the recipient's inbox
+    full = full_inboxes([header['to']], request.content_length or 0)
+    if full:
+        return inbox_full_response(full)
+
+    # Each frame is copied to a staged file in pieces; only the chunk table
+    # is kept in memory
+    staged = []
+    try:
+        while True:
+            frame = read_frame_header(stream)
+            if frame is None:
+                break
+            index, flags, digest, length = frame
+            # The relay always addresses blobs by its own SHA-256; a digest
+            # sent by the client is an extra end-to-end check when present
+            codec = flags_codec(flags)
+            chunk_path = os.path.join(staging_dir, f"chunk_{len(staged)}.bin")
+            blob_hash, size = spool_parts(iter_exact(stream, length), chunk_path)
+            if digest is not None and blob_hash != digest:
+                raise TransferFormatError(f"Hash mismatch in chunk {index}")
+            staged.append((chunk_path, chunk_entry(index, size, blob_hash, codec)))
+    except TransferFormatError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if not staged:
         return jsonify({"error": "Missing transfer data"}), 400
 
-    recipient_dir = os.path.join(os.path.dirname(__file__), "..", "transfers", data['to'])
-    os.makedirs(recipient_dir, exist_ok=True)
+    full = full_inboxes([header['to']], sum(chunk["size"] for _, chunk in staged))
+    if full:
+        return inbox_full_response(full)
+
+    record = store_staged_transfer(header, staged)
+    return jsonify({"message": "Transfer stored", "transfer_id": record["id"]}), 200
+
+
+def transfer_header_error(header):
+    """Why a /transfer header cannot be stored, or None. Checked before any chunk reaches the blob store."""
+    if not is_valid_name(header['to']):
+        return "Invalid recipient"
+    if not isinstance(header['filename'], str):
+        return "Invalid filename"
+    if header.get('cipher', LEGACY_CIPHER) not in SUPPORTED_CIPHERS:
+        return "Unsupported cipher"
+    if header.get('archive') is not None and header['archive'] not in SUPPORTED_ARCHIVES:
+        return "Unsupported archive format"
+    if not valid_receipt(header):
+        return "Invalid receipt"
+    if not valid_root_mac(header.get('root_mac')):
+        return "Invalid root MAC"
+    return None
+
+
+def is_chunk_index(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def spool_parts(parts, path):
+    """Write byte pieces to `path` while hashing them. Returns (sha256, size); the file is removed on failure."""
+    sha = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, "wb") as f:
+            for part in parts:
+                sha.update(part)
+                f.write(part)
+                size += len(part)
+    except BaseException:
+        os.remove(path)
+        raise
+    return sha.hexdigest(), size
+
+
+def store_staged_transfer(header, staged):
+    """Move staged (path, chunk) files into the blob store and record the transfer."""
+    # Under the retention lock, so the sweeper cannot release a blob this
+    # transfer is about to reference
+    with retention.lock:
+        added = []
+        try:
+            for chunk_path, chunk in staged:
+                if not store.has_blob(chunk["hash"]):
+                    added.append(chunk["hash"])
+                store.adopt_blob_file(chunk_path, chunk["hash"])
+            return store_transfer(header, [chunk for _, chunk in staged])
+        except BaseException:
+            # Nothing counts a reference to blobs this transfer brought in
+            for digest in added:
+                store.delete_blob(digest)
+            raise
 
-    transfer_path = os.path.join(recipient_dir, f"{data['filename']}.meta.json")
 
-    with open(transfer_path, "w") as f:
-        json.dump(data, f)
+def chunk_entry(index, size, blob_hash, codec=None, aad_index=None):
+    """A chunk table entry; optional fields are left out when they have their default."""
+    chunk = {"index": index, "size": size, "hash": blob_hash}
+    if codec:
+        chunk["codec"] = codec
+    if aad_index is not None:
+        chunk["aad_index"] = aad_index
+    return chunk
+
+
+def store_transfer(header, chunks, root=None):
+    """Save the metadata record for a transfer whose blobs are in place, and log it."""
+    if root is None:
+        root = merkle_root([c["hash"] for c in sorted(chunks, key=lambda c: c["index"])])
+    record = store.save_transfer(header['from'], header['to'], header['encrypted_key'],
+                                 header['filename'], chunks, header.get('cipher', LEGACY_CIPHER),
+                                 merkle_root=root, archive=header.get('archive'),
+                                 receipt_key=header.get('receipt_key'), receipt_hash=header.get('receipt_hash'),
+                                 root_mac=header.get('root_mac'))
+    index_transfer(record)
+    inbox_events.notify(record['to'])
 
-    # === Log transfer ===
     log_transfer({
-        "timestamp": datetime.now().isoformat(),
-        "from": data['from'],
-        "to": data['to'],
-        "filename": data['filename'],
-        "chunk_count": len(data['chunks'])
+        "timestamp": record["created"],
+        "from": record['from'],
+        "to": record['to'],
+        "filename": record['filename'],
+        "chunk_count": len(chunks)
+    })
+    return record
+
+# === Multi-recipient Fan-out ===
+# A transfer for several recipients is encrypted once under one AES key;
+# the sender wraps that key for each recipient and lists them as
+# "recipients": [{"to", "encrypted_key"}]. The chunk blobs are stored once
+# and every recipient gets a small metadata record pointing at them.
+MAX_RECIPIENTS = 500
+
+
+def transfer_recipients(data):
+    """
+    Recipients of an upload as [{"to", "encrypted_key"}] plus their receipt
+    fields when given, from either the fan-out "recipients" list or the
+    single "to" / "encrypted_key" fields. Returns None if they are missing
+    or invalid.
+    """
+    recipients = data.get('recipients')
+    if recipients is None:
+        recipients = [{k: data.get(k) for k in ('to', 'encrypted_key', 'receipt_key', 'receipt_hash')}]
+    if not isinstance(recipients, list) or not 0 < len(recipients) <= MAX_RECIPIENTS:
+        return None
+
+    normalized = []
+    for recipient in recipients:
+        if not isinstance(recipient, dict) or not recipient.get('encrypted_key'):
+            return None
+        if not is_valid_name(recipient.get('to')) or not valid_receipt(recipient):
+            return None
+        entry = {"to": recipient['to'], "encrypted_key": recipient['encrypted_key']}
+        if recipient.get('receipt_hash'):
+            entry["receipt_key"] = recipient['receipt_key']
+            entry["receipt_hash"] = recipient['receipt_hash']
+        normalized.append(entry)
+    if len({r["to"] for r in normalized}) != len(normalized):
+        return None
+    return normalized
+
+# === Resumable Upload Sessions ===
+# open -> PUT each chunk by index (one SFT frame per request) -> GET status
+# to see what is missing -> complete. Sessions live on disk under uploads/
+# so an interrupted sender can pick up where it left off, even after a
+# relay restart. A sender re-sending a changed file may list "references":
+# chunk indices satisfied by blobs already on the relay, which are then
+# never uploaded again.
+def upload_session_dir(upload_id):
+    if not re.fullmatch(r"[0-9a-f]{32}", upload_id):
+        return None
+    return os.path.join(UPLOADS_DIR, upload_id)
+
+
+def load_upload_session(upload_id):
+    session_dir = upload_session_dir(upload_id)
+    if not session_dir:
+        return None, None
+    session_path = os.path.join(session_dir, "session.json")
+    if not os.path.exists(session_path):
+        return None, None
+    with open(session_path, "r") as f:
+        return session_dir, json.load(f)
+
+
+def staged_chunk_hash(session_dir, index):
+    hash_path = os.path.join(session_dir, f"chunk_{index}.sha256")
+    if not os.path.exists(hash_path):
+        # Chunk staged before hashes were recorded alongside it
+        with open(os.path.join(session_dir, f"chunk_{index}.bin"), "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    with open(hash_path, "r") as f:
+        return f.read().strip()
+
+
+def staged_chunk_codec(session_dir, index):
+    codec_path = os.path.join(session_dir, f"chunk_{index}.codec")
+    if not os.path.exists(codec_path):
+        return None
+    with open(codec_path, "r") as f:
+        return f.read().strip()
+
+
+def session_chunk_codec(session_dir, session, index):
+    """Codec of an uploaded chunk, or of the referenced blob when none was uploaded."""
+    if os.path.exists(os.path.join(session_dir, f"chunk_{index}.bin")):
+        return staged_chunk_codec(session_dir, index)
+    return session["references"][str(index)].get("codec")
+
+
+def session_chunk_hash(session_dir, session, index):
+    """Hash of an uploaded chunk, or of the referenced blob when none was uploaded."""
+    if os.path.exists(os.path.join(session_dir, f"chunk_{index}.bin")):
+        return staged_chunk_hash(session_dir, index)
+    return session["references"][str(index)]["hash"]
+
+
+def received_chunk_indices(session_dir, session):
+    uploaded = {
+        int(fname[len("chunk_"):-len(".bin")])
+        for fname in os.listdir(session_dir)
+        if fname.startswith("chunk_") and fname.endswith(".bin")
+    }
+    return sorted(uploaded | {int(i) for i in session.get("references", {})})
+
+
+def save_upload_session(session_dir, session):
+    session_path = os.path.join(session_dir, "session.json")
+    partial = f"{session_path}.{uuid.uuid4().hex}.part"
+    with open(partial, "w") as f:
+        json.dump(session, f)
+    os.replace(partial, session_path)
+
+
+@app.route('/uploads', methods=['POST'])
+def open_upload():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Upload request must be a JSON object"}), 400
+    required_fields = ['from', 'filename', 'chunk_count']
+
+    if not all(data.get(k) for k in required_fields):
+        return jsonify({"error": "Missing transfer data"}), 400
+    if not isinstance(data['filename'], str):
+        return jsonify({"error": "Invalid filename"}), 400
+    if not isinstance(data['chunk_count'], int) or data['chunk_count'] < 1:
+        return jsonify({"error": "Invalid chunk count"}), 400
+    recipients = transfer_recipients(data)
+    if recipients is None:
+        return jsonify({"error": "Invalid recipient"}), 400
+    if data.get('cipher', LEGACY_CIPHER) not in SUPPORTED_CIPHERS:
+        return jsonify({"error": "Unsupported cipher"}), 400
+    if data.get('archive') is not None and data['archive'] not in SUPPORTED_ARCHIVES:
+        return jsonify({"error": "Unsupported archive format"}), 400
+    full = full_inboxes([r["to"] for r in recipients])
+    if full:
+        return inbox_full_response(full)
+
+    # Delta re-send: keep only references to blobs that still exist
+    if not isinstance(data.get('references') or {}, dict):
+        return jsonify({"error": "Invalid chunk references"}), 400
+    references = {}
+    for index, ref in (data.get('references') or {}).items():
+        try:
+            valid = (0 <= int(index) < data['chunk_count']
+                     and isinstance(ref.get('hash'), str) and re.fullmatch(r"[0-9a-f]{64}", ref['hash'])
+                     and isinstance(ref.get('aad_index'), int) and ref['aad_index'] >= 0
+                     and ref.get('codec') in (None, *CODEC_FLAGS))
+        except (ValueError, AttributeError):
+            valid = False
+        if not valid:
+            return jsonify({"error": f"Invalid chunk reference {index!r}"}), 400
+        if store.has_blob(ref['hash']):
+            references[str(int(index))] = {"hash": ref['hash'], "aad_index": ref['aad_index']}
+            if ref.get('codec'):
+                references[str(int(index))]["codec"] = ref['codec']
+
+    upload_id = uuid.uuid4().hex
+    session_dir = upload_session_dir(upload_id)
+    os.makedirs(session_dir)
+
+    session = {k: data[k] for k in required_fields}
+    session["recipients"] = recipients
+    session["cipher"] = data.get('cipher', LEGACY_CIPHER)
+    if data.get('archive'):
+        session["archive"] = data['archive']
+    session["references"] = references
+    session["upload_id"] = upload_id
+    session["created"] = datetime.now().isoformat()
+    save_upload_session(session_dir, session)
+
+    return jsonify({
+        "upload_id": upload_id,
+        "accepted_references": sorted(int(i) for i in references)
+    }), 201
+
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def get_upload_status(upload_id):
+    session_dir, session = load_upload_session(upload_id)
+    if not session:
+        return jsonify({"error": "Upload not found"}), 404
+
+    received = received_chunk_indices(session_dir, session)
+    missing = sorted(set(range(session["chunk_count"])) - set(received))
+    codecs = {i: session_chunk_codec(session_dir, session, i) for i in received}
+    return jsonify({
+        "upload_id": upload_id,
+        "chunk_count": session["chunk_count"],
+        "received": received,
+        "received_hashes": {str(i): session_chunk_hash(session_dir, session, i) for i in received},
+        "codecs": {str(i): codec for i, codec in codecs.items() if codec},
+        "references": session.get("references", {}),
+        "missing": missing
     })
 
-    return jsonify({"message": "Transfer stored"}), 200
+
+@app.route('/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def upload_chunk(upload_id, index):
+    session_dir, session = load_upload_session(upload_id)
+    if not session:
+        return jsonify({"error": "Upload not found"}), 404
+    if index >= session["chunk_count"]:
+        return jsonify({"error": "Chunk index out of range"}), 400
+
+    request.max_content_length = MAX_CHUNK_REQUEST_BYTES
+    try:
+        frame = read_frame_header(request.stream)
+        if frame is None or frame[0] != index:
+            return jsonify({"error": "Frame does not match chunk index"}), 400
+        _, flags, digest, length = frame
+        codec = flags_codec(flags)
+    except TransferFormatError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # The chunk is hashed while it is spooled to a temp file (a unique name,
+    # so a retried PUT racing the original on another worker thread never
+    # writes into the file being renamed) and checked against its Merkle
+    # leaf, so a bad chunk is rejected immediately instead of failing the
+    # whole transfer
+    chunk_path = os.path.join(session_dir, f"chunk_{index}.bin")
+    partial = f"{chunk_path}.{uuid.uuid4().hex}.part"
+    try:
+        leaf, _ = spool_parts(iter_exact(request.stream, length), partial)
+    except TransferFormatError as e:
+        return jsonify({"error": str(e)}), 400
+    if digest is not None and leaf != digest:
+        os.remove(partial)
+        return jsonify({"error": f"Hash mismatch in chunk {index}"}), 400
+
+    # Hash and codec first, then rename the data into place, so a chunk is
+    # either fully present (with its metadata) or missing
+    codec_path = os.path.join(session_dir, f"chunk_{index}.codec")
+    with open(os.path.join(session_dir, f"chunk_{index}.sha256"), "w") as f:
+        f.write(leaf)
+    if codec:
+        with open(codec_path, "w") as f:
+            f.write(codec)
+    elif os.path.exists(codec_path):
+        os.remove(codec_path)
+    os.replace(partial, chunk_path)
+
+    return jsonify({"message": "Chunk stored", "index": index}), 200
+
+
+@app.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    session_dir, session = load_upload_session(upload_id)
+    if not session:
+        return jsonify({"error": "Upload not found"}), 404
+
+    # Held until the transfer is recorded: the sweeper releases blobs under
+    # the same lock, so a referenced blob found here cannot vanish before
+    # the new records count it
+    with retention.lock:
+        # The sweeper discards idle sessions under the same lock
+        if not os.path.isdir(session_dir):
+            return jsonify({"error": "Upload not found"}), 404
+
+        # A referenced blob may have been removed since the session was opened;
+        # drop such references so the sender uploads those chunks instead
+        references = session.get("references", {})
+        gone = [i for i, ref in references.items()
+                if not os.path.exists(os.path.join(session_dir, f"chunk_{i}.bin")) and not store.has_blob(ref["hash"])]
+        if gone:
+            for i in gone:
+                del references[i]
+            save_upload_session(session_dir, session)
+
+        received = received_chunk_indices(session_dir, session)
+        missing = sorted(set(range(session["chunk_count"])) - set(received))
+        if missing:
+            return jsonify({"error": "Upload incomplete", "missing": missing}), 409
+
+        # Leaves were recorded on upload, so confirming the whole transfer is one
+        # root comparison and no ciphertext is re-read
+        leaves = [session_chunk_hash(session_dir, session, i) for i in range(session["chunk_count"])]
+        root = merkle_root(leaves)
+        data = request.get_json(silent=True) or {}
+        if data.get("merkle_root") and data["merkle_root"] != root:
+            return jsonify({"error": "Merkle root mismatch", "merkle_root": root}), 409
+        if not valid_root_mac(data.get("root_mac")):
+            return jsonify({"error": "Invalid root MAC"}), 400
+
+        # Referenced chunks point at their existing blob and keep the index
+        # they were originally encrypted under
+        chunks, uploaded = [], []
+        for index, leaf in enumerate(leaves):
+            codec = session_chunk_codec(session_dir, session, index)
+            chunk_path = os.path.join(session_dir, f"chunk_{index}.bin")
+            if os.path.exists(chunk_path):
+                chunks.append(chunk_entry(index, os.path.getsize(chunk_path), leaf, codec))
+                uploaded.append((chunk_path, leaf))
+            else:
+                chunks.append(chunk_entry(index, os.path.getsize(store.blob_path(leaf)), leaf, codec,
+                                          references[str(index)]["aad_index"]))
+
+        recipients = transfer_recipients(session)
+        full = full_inboxes([r["to"] for r in recipients], sum(c["size"] for c in chunks))
+        if full:
+            return inbox_full_response(full)
+
+        # Staged chunks are renamed into the blob store rather than copied
+        for chunk_path, leaf in uploaded:
+            store.adopt_blob_file(chunk_path, leaf)
+
+        # One metadata record per recipient, all pointing at the same blobs
+        records = [
+            store_transfer(dict(session, root_mac=data.get("root_mac"), **r), chunks, root)
+            for r in recipients
+        ]
+    shutil.rmtree(session_dir, ignore_errors=True)
+
+    return jsonify({
+        "message": "Transfer stored",
+        "transfer_id": records[0]["id"],
+        "transfer_ids": {record["to"]: record["id"] for record in records},
+        "merkle_root": root
+    }), 200
 
 # === Inbox Fetch ===
+# Lightweight, newest-first listing served from the SQLite index. Pass
+# ?cursor=<X-Next-Cursor of previous page> for the next page, or
+# ?since=<ISO timestamp> to get only newer transfers.
 @app.route('/transfers/<admission_id>', methods=['GET'])
 def get_transfers_for_user(admission_id):
-    user_dir = os.path.join(os.path.dirname(__file__), "..", "transfers", admission_id)
-    if not os.path.exists(user_dir):
-        return jsonify([])
+    try:
+        limit = min(int(request.args.get('limit', INBOX_PAGE_SIZE)), INBOX_MAX_PAGE_SIZE)
+        cursor = request.args.get('cursor', type=int)
+    except ValueError:
+        return jsonify({"error": "Invalid pagination parameters"}), 400
+    if limit < 1:
+        return jsonify({"error": "Invalid pagination parameters"}), 400
 
-    transfers = []
-    for fname in os.listdir(user_dir):
-        if fname.endswith(".meta.json"):
-            with open(os.path.join(user_dir, fname), "r") as f:
-                metadata = json.load(f)
-                transfers.append(metadata)
+    transfers, next_cursor = list_indexed_transfers(
+        admission_id, cursor=cursor, since=request.args.get('since'), limit=limit
+    )
+    response = jsonify(transfers)
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+    return response
 
-    return jsonify(transfers)
+# === New Transfer Events ===
+# Long-poll: ?after=<cursor of the previous answer, or the highest "seq"
+# the client has seen> returns transfers indexed after it at once, oldest
+# first, or waits up to ?timeout seconds (0 to max_wait_seconds) for one to
+# arrive. seq grows with every indexed transfer, so a transfer whose record
+# was created earlier but indexed later is still after the cursor. The
+# answer's cursor is passed as after on the next call; when more than a
+# page is waiting the next call returns the rest at once.
+@app.route('/transfers/<admission_id>/events', methods=['GET'])
+def get_transfer_events(admission_id):
+    try:
+        after = int(request.args.get('after', 0))
+        timeout = float(request.args.get('timeout', EVENTS["max_wait_seconds"]))
+    except ValueError:
+        return jsonify({"error": "Invalid event query parameters"}), 400
+    if after < 0 or not math.isfinite(timeout):
+        return jsonify({"error": "Invalid event query parameters"}), 400
+    timeout = max(0, min(timeout, EVENTS["max_wait_seconds"]))
 
-# === Helper: Log transfers for admin ===
-def log_transfer(entry):
-    os.makedirs(os.path.dirname(TRANSFER_LOG_PATH), exist_ok=True)
-    if os.path.exists(TRANSFER_LOG_PATH):
-        with open(TRANSFER_LOG_PATH, "r") as f:
-            logs = json.load(f)
-    else:
-        logs = []
+    # An open inbox polls at least every max_wait_seconds, so its polls
+    # count as the heartbeat the dashboard sends while it is open
+    sessions.touch(admission_id)
+    version = inbox_events.version(admission_id)
+    transfers = list_transfers_after(admission_id, after, limit=INBOX_MAX_PAGE_SIZE)
+    if not transfers and timeout > 0:
+        try:
+            changed = inbox_events.wait(admission_id, version, timeout)
+        except TooManyWaiters:
+            response = jsonify({"error": "Too many clients waiting for events"})
+            response.headers['Retry-After'] = str(EVENTS_RETRY_AFTER)
+            return response, 503
+        if changed:
+            transfers = list_transfers_after(admission_id, after, limit=INBOX_MAX_PAGE_SIZE)
+
+    return jsonify({
+        "transfers": transfers,
+        "cursor": transfers[-1]["seq"] if transfers else after
+    })
+
+# === Binary Download ===
+@app.route('/transfers/<admission_id>/<transfer_id>', methods=['GET'])
+def download_transfer(admission_id, transfer_id):
+    record = store.load_transfer(admission_id, transfer_id)
+    if not record:
+        return jsonify({"error": "Transfer not found"}), 404
+
+    return Response(iter_stored_transfer(record), mimetype=TRANSFER_CONTENT_TYPE)
+
+
+# Receivers acknowledge a saved transfer by deleting it, proving they are
+# the recipient with the receipt token unwrapped from the transfer's
+# receipt_key (X-Receipt-Token, base64); admins may delete any transfer.
+# Its blobs go once no other transfer refers to them.
+@app.route('/transfers/<admission_id>/<transfer_id>', methods=['DELETE'])
+def acknowledge_transfer(admission_id, transfer_id):
+    record = store.load_transfer(admission_id, transfer_id)
+    if not record:
+        return jsonify({"error": "Transfer not found"}), 404
+    if not is_admin_request() and not receipt_matches(record, request.headers.get('X-Receipt-Token')):
+        return jsonify({"error": "Invalid receipt"}), 403
+    if not retention.delete_transfer(admission_id, transfer_id):
+        return jsonify({"error": "Transfer not found"}), 404
+    return jsonify({"message": "Transfer deleted"}), 200
+
+
+def valid_receipt(entry):
+    """True if `entry` has no receipt, or a wrapped key with a SHA-256 hex hash."""
+    if entry.get('receipt_hash') is None and entry.get('receipt_key') is None:
+        return True
+    return (isinstance(entry.get('receipt_key'), str) and entry['receipt_key'] != ""
+            and isinstance(entry.get('receipt_hash'), str)
+            and re.fullmatch(r"[0-9a-f]{64}", entry['receipt_hash']) is not None)
+
+
+def valid_root_mac(mac):
+    """True if `mac` is absent or an HMAC-SHA256 hex digest (the relay cannot check it; receivers do)."""
+    return mac is None or (isinstance(mac, str) and re.fullmatch(r"[0-9a-f]{64}", mac) is not None)
+
+
+def receipt_matches(record, token):
+    """True if `token` (base64) is the receipt token of `record`. Transfers without one only expire."""
+    if not record.get("receipt_hash") or not token:
+        return False
+    try:
+        raw = base64.b64decode(token, validate=True)
+    except ValueError:
+        return False
+    return hmac.compare_digest(hashlib.sha256(raw).hexdigest(), record["receipt_hash"])
+
+
+def iter_stored_transfer(record):
+    """Serve a stored transfer as an SFT stream, reading one chunk blob at a time."""
+    header = {k: record[k] for k in ('from', 'to', 'encrypted_key', 'filename', 'cipher', 'chunks')}
+    header["merkle_root"] = record.get("merkle_root") or merkle_root([c["hash"] for c in record["chunks"]])
+    if record.get("root_mac"):
+        header["root_mac"] = record["root_mac"]
+    yield encode_header(header)
+    for chunk in record["chunks"]:
+        yield encode_frame(chunk["index"], store.read_blob(chunk["hash"]), chunk["hash"],
+                           codec_flags(chunk.get("codec")))
+    yield encode_end()
+
+# === Manifest, Single-Chunk and Ranged Downloads ===
+# Receivers fetch the manifest (metadata only), then pull chunks over several
+# connections at once. /data exposes the stored ciphertext as one contiguous
+# byte range for clients that prefer HTTP Range requests.
+STREAM_BLOCK_SIZE = 64 * 1024
 
-    logs.append(entry)
 
-    with open(TRANSFER_LOG_PATH, "w") as f:
-        json.dump(logs, f, indent=2)
+@app.route('/transfers/<admission_id>/<transfer_id>/manifest', methods=['GET'])
+def get_transfer_manifest(admission_id, transfer_id):
+    record = store.load_transfer(admission_id, transfer_id)
+    if not record:
+        return jsonify({"error": "Transfer not found"}), 404
+    record.setdefault("merkle_root", merkle_root([c["hash"] for c in record["chunks"]]))
+    return jsonify(record)
+
+
+@app.route('/transfers/<admission_id>/<transfer_id>/proof/<int:index>', methods=['GET'])
+def get_chunk_proof(admission_id, transfer_id, index):
+    """Merkle path for one chunk, for clients that verify a subset without the full leaf list."""
+    record = store.load_transfer(admission_id, transfer_id)
+    if not record:
+        return jsonify({"error": "Transfer not found"}), 404
+    if not 0 <= index < len(record["chunks"]):
+        return jsonify({"error": "Chunk not found"}), 404
+
+    leaves = [c["hash"] for c in record["chunks"]]
+    return jsonify({
+        "index": index,
+        "hash": leaves[index],
+        "proof": merkle_proof(leaves, index),
+        "merkle_root": record.get("merkle_root") or merkle_root(leaves)
+    })
+
+
+@app.route('/transfers/<admission_id>/<transfer_id>/chunks/<int:index>', methods=['GET'])
+def download_chunk(admission_id, transfer_id, index):
+    record = store.load_transfer(admission_id, transfer_id)
+    if not record:
+        return jsonify({"error": "Transfer not found"}), 404
+
+    chunk = next((c for c in record["chunks"] if c["index"] == index), None)
+    if chunk is None:
+        return jsonify({"error": "Chunk not found"}), 404
+
+    # Blobs are immutable and content-addressed, so their hash is a strong ETag
+    response = send_file(store.blob_path(chunk["hash"]), mimetype="application/octet-stream",
+                         conditional=True, etag=chunk["hash"], max_age=86400)
+    response.headers['X-Chunk-Hash'] = chunk["hash"]
+    if chunk.get("codec"):
+        response.headers['X-Chunk-Codec'] = chunk["codec"]
+    return response
+
+
+@app.route('/transfers/<admission_id>/<transfer_id>/data', methods=['GET'])
+def download_ciphertext_range(admission_id, transfer_id):
+    record = store.load_transfer(admission_id, transfer_id)
+    if not record:
+        return jsonify({"error": "Transfer not found"}), 404
+
+    total = record["size"]
+    start, stop, status = 0, total, 200
+    if request.range is not None:
+        byte_range = request.range.range_for_length(total)
+        if byte_range is None:
+            return Response(status=416, headers={'Content-Range': f'bytes */{total}'})
+        start, stop = byte_range
+        status = 206
+
+    response = Response(iter_ciphertext_range(record, start, stop), status=status,
+                        mimetype="application/octet-stream")
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Content-Length'] = str(stop - start)
+    if status == 206:
+        response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{total}'
+    return response
+
+
+def iter_ciphertext_range(record, start, stop):
+    """Yield bytes [start, stop) of the transfer's concatenated chunk ciphertext."""
+    chunk_start = 0
+    for chunk in record["chunks"]:
+        chunk_stop = chunk_start + chunk["size"]
+        if chunk_stop > start and chunk_start < stop:
+            with store.open_blob(chunk["hash"]) as f:
+                f.seek(max(start - chunk_start, 0))
+                remaining = min(stop, chunk_stop) - max(start, chunk_start)
+                while remaining > 0:
+                    data = f.read(min(remaining, STREAM_BLOCK_SIZE))
+                    if not data:
+                        break
+                    remaining -= len(data)
+                    yield data
+        if chunk_stop >= stop:
+            break
+        chunk_start = chunk_stop
+
+# === Helper: Log transfers for admin ===
+def log_transfer(entry):
+    # One appended line per transfer; the log never has to be read to write
+    transfer_log.append(entry)
 
 # === ADMIN ROUTES ===
+ADMIN_LOG_PAGE_SIZE = 100
+ADMIN_LOG_MAX_PAGE_SIZE = 1000
+
+# Newest-first; filter with ?since / ?until (ISO timestamps) and ?user, and
+# pass ?cursor=<X-Next-Cursor of previous page> for older entries
 @app.route("/admin/logs", methods=["GET"])
 @require_admin_auth
 def get_logs():
-    return jsonify(load_transfer_logs())
+    since, until = request.args.get('since'), request.args.get('until')
+    try:
+        limit = min(int(request.args.get('limit', ADMIN_LOG_PAGE_SIZE)), ADMIN_LOG_MAX_PAGE_SIZE)
+        for timestamp in (since, until):
+            if timestamp:
+                datetime.fromisoformat(timestamp)
+        if limit < 1:
+            raise ValueError("limit")
+        logs, next_cursor = load_transfer_logs(since=since, until=until, user=request.args.get('user'),
+                                               cursor=request.args.get('cursor'), limit=limit)
+    except ValueError:
+        return jsonify({"error": "Invalid log query parameters"}), 400
+
+    response = jsonify(logs)
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
 
 @app.route("/admin/users", methods=["GET"])
 @require_admin_auth
@@ -178,7 +1088,14 @@ def get_all_users_route():
 @app.route("/admin/active_sessions", methods=["GET"])
 @require_admin_auth
 def get_active_sessions_route():
-    return jsonify(load_active_sessions())
+    return jsonify(sessions.active())
+
+@app.route("/admin/usage", methods=["GET"])
+@require_admin_auth
+def get_storage_usage_route():
+    usage = storage_usage()
+    usage["inbox_quota_bytes"] = INBOX_QUOTA
+    return jsonify(usage)
 
 # === Launch HTTPS server ===
 if __name__ == "__main__":
@@ -190,6 +1107,7 @@ if __name__ == "__main__":
     with open(config_path, "r") as f:
         cfg = json.load(f)
 
+    # Development server; use serve.py for a multi-threaded production relay
     app.run(
         host=cfg.get("relay_host", "127.0.0.1"),
         port=cfg.get("relay_port", 5000),
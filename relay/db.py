@@ -1,22 +1,103 @@
 import sqlite3
 import os
+import json
+import threading
+from contextlib import contextmanager
 
 # Define path to the SQLite DB
 DB_PATH = os.path.join(os.path.dirname(__file__), '../database/users.db')
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+# === Connection Pool ===
+# Connections are opened once and reused: each `with connection()` block gets
+# a connection to itself (nested blocks on the same thread share it), and
+# hands it back to the pool afterwards. sqlite3 caches compiled statements
+# per connection by SQL text, so the constant queries below are prepared
+# once per pooled connection rather than once per request.
+#
+# WAL lets readers keep reading while a writer commits, so a burst of
+# registrations no longer blocks inbox listings; synchronous=NORMAL is
+# crash-safe in WAL mode and avoids an fsync on every commit.
+POOL_SIZE = 8
+STATEMENT_CACHE_SIZE = 128
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -8192",  # 8MB page cache per connection
+)
+
+
+class ConnectionPool:
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pid = os.getpid()
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked worker: connections must not be shared with the parent
+                self._idle, self._pid = [], os.getpid()
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._open()
+
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            if conn.in_transaction:
+                conn.rollback()
+            with self._lock:
+                if len(self._idle) < self.size:
+                    self._idle.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+pool = ConnectionPool(DB_PATH)
 
-def initialize_db():
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def connection():
+    """Borrow a pooled connection: `with connection() as conn: ...`"""
+    return pool.connection()
 
-    # Create updated users table
-    cursor.execute('''
+# === Schema Migrations ===
+# Applied in order; PRAGMA user_version records how many have run. Each
+# migration runs in its own IMMEDIATE transaction, so concurrent relay
+# workers starting together apply it exactly once. Databases created before
+# migrations existed are at version 0 and the IF NOT EXISTS statements
+# adopt their tables unchanged.
+MIGRATIONS = [
+    # 1: users
+    (
+        '''
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             admission_id TEXT UNIQUE NOT NULL,
@@ -24,7 +105,272 @@ def initialize_db():
             display_name TEXT NOT NULL,
             public_key TEXT NOT NULL
         )
-    ''')
+        ''',
+    ),
+    # 2: inbox index, one small row per stored transfer so listings never
+    # touch metadata files or chunk blobs. seq doubles as the pagination cursor.
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS transfers (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT UNIQUE NOT NULL,
+            recipient TEXT NOT NULL,
+            sender TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            chunk_count INTEGER NOT NULL,
+            created TEXT NOT NULL
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_transfers_recipient_seq
+        ON transfers (recipient, seq)
+        ''',
+    ),
+    # 3: batch transfers (a directory packed into one archive)
+    (
+        'ALTER TABLE transfers ADD COLUMN archive TEXT',
+    ),
+    # 4: retention. Chunk blobs are shared between fan-out recipients and
+    # delta re-sends, so each blob counts the indexed chunks pointing at it
+    # and is deleted with its last reference. Expiry scans by creation time.
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            refs INTEGER NOT NULL
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_transfers_created
+        ON transfers (created)
+        ''',
+    ),
+]
+
+
+def migrate(conn):
+    """Bring the schema up to date. Returns the resulting schema version."""
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= len(MIGRATIONS):
+                conn.rollback()
+                return version
+            for statement in MIGRATIONS[version]:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+
+def initialize_db():
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    with connection() as conn:
+        migrate(conn)
+
+# === Users ===
+def create_user(admission_id, password_hash, display_name, public_key):
+    """Insert a user. Returns False if the admission ID is already taken."""
+    with connection() as conn:
+        try:
+            conn.execute('''
+                INSERT INTO users (admission_id, password_hash, display_name, public_key)
+                VALUES (?, ?, ?, ?)
+            ''', (admission_id, password_hash, display_name, public_key))
+            conn.commit()
+        except sqlite3.IntegrityError:
+            return False
+    return True
+
+def all_users():
+    with connection() as conn:
+        rows = conn.execute('SELECT admission_id, display_name FROM users').fetchall()
+    return [dict(row) for row in rows]
+
+def find_user(admission_id):
+    with connection() as conn:
+        row = conn.execute('SELECT * FROM users WHERE admission_id = ?', (admission_id,)).fetchone()
+    return dict(row) if row else None
+
+def find_public_key(admission_id):
+    with connection() as conn:
+        row = conn.execute('SELECT public_key FROM users WHERE admission_id = ?', (admission_id,)).fetchone()
+    return row["public_key"] if row else None
+
+def find_public_keys(admission_ids):
+    """Map admission ID -> public key PEM for the IDs that exist."""
+    # The ID list travels as one JSON parameter, so this is a single
+    # statement text (prepared once) whatever the number of IDs
+    with connection() as conn:
+        rows = conn.execute('''
+            SELECT admission_id, public_key FROM users
+            WHERE admission_id IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(list(admission_ids)),)).fetchall()
+    return {row["admission_id"]: row["public_key"] for row in rows}
+
+# === Transfer Index ===
+_ADD_BLOB_REF = '''
+    INSERT INTO blobs (hash, size, refs) VALUES (?, ?, 1)
+    ON CONFLICT (hash) DO UPDATE SET refs = refs + 1
+'''
+
+def index_transfer(record):
+    """Index a stored transfer and count a reference to each of its chunk blobs."""
+    with connection() as conn:
+        inserted = conn.execute('''
+            INSERT OR IGNORE INTO transfers (id, recipient, sender, filename, size, chunk_count, created, archive)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (record["id"], record["to"], record["from"], record["filename"],
+              record["size"], len(record["chunks"]), record["created"], record.get("archive"))).rowcount
+        if inserted:
+            conn.executemany(_ADD_BLOB_REF, [(c["hash"], c["size"]) for c in record["chunks"]])
+        conn.commit()
+
+def unindex_transfer(transfer_id, chunks):
+    """
+    Remove a transfer from the index and drop its chunks' blob references.
+    Returns the hashes of blobs nothing refers to any more (to be deleted),
+    or None if the transfer was not indexed.
+    """
+    hashes = json.dumps(sorted({c["hash"] for c in chunks}))
+    with connection() as conn:
+        if not conn.execute('DELETE FROM transfers WHERE id = ?', (transfer_id,)).rowcount:
+            conn.rollback()
+            return None
+        conn.executemany('UPDATE blobs SET refs = refs - 1 WHERE hash = ?', [(c["hash"],) for c in chunks])
+        rows = conn.execute('''
+            SELECT hash FROM blobs WHERE refs <= 0 AND hash IN (SELECT value FROM json_each(?))
+        ''', (hashes,)).fetchall()
+        conn.execute('''
+            DELETE FROM blobs WHERE refs <= 0 AND hash IN (SELECT value FROM json_each(?))
+        ''', (hashes,))
+        conn.commit()
+    return [row["hash"] for row in rows]
+
+def count_blob_refs():
+    with connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM blobs').fetchone()[0]
+
+def rebuild_blob_refs(records):
+    """Recount blob references from scratch, e.g. for transfers indexed before refcounting."""
+    with connection() as conn:
+        conn.execute('DELETE FROM blobs')
+        for record in records:
+            conn.executemany(_ADD_BLOB_REF, [(c["hash"], c["size"]) for c in record["chunks"]])
+        conn.commit()
+
+def count_indexed_transfers():
+    with connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM transfers').fetchone()[0]
+
+def list_expired_transfers(created_before, limit=500):
+    """Oldest-first (recipient, transfer_id) pairs of transfers created before an ISO timestamp."""
+    with connection() as conn:
+        rows = conn.execute('''
+            SELECT recipient, id FROM transfers WHERE created < ? ORDER BY created LIMIT ?
+        ''', (created_before, limit)).fetchall()
+    return [(row["recipient"], row["id"]) for row in rows]
+
+# === Storage Usage ===
+def inbox_usage(recipient):
+    """(pending transfer count, pending bytes) of a recipient's inbox."""
+    with connection() as conn:
+        row = conn.execute('''
+            SELECT COUNT(*), COALESCE(SUM(size), 0) FROM transfers WHERE recipient = ?
+        ''', (recipient,)).fetchone()
+    return row[0], row[1]
+
+def storage_usage():
+    """
+    Pending transfers per user (as recipient and as sender) plus totals.
+    Logical bytes count every recipient's copy; stored bytes count each
+    shared blob once.
+    """
+    users = {}
+
+    def entry(admission_id):
+        return users.setdefault(admission_id, {
+            "admission_id": admission_id,
+            "inbox_transfers": 0, "inbox_bytes": 0,
+            "sent_transfers": 0, "sent_bytes": 0
+        })
+
+    with connection() as conn:
+        for row in conn.execute('''
+            SELECT recipient, COUNT(*), SUM(size) FROM transfers GROUP BY recipient
+        '''):
+            entry(row[0]).update(inbox_transfers=row[1], inbox_bytes=row[2])
+        for row in conn.execute('''
+            SELECT sender, COUNT(*), SUM(size) FROM transfers GROUP BY sender
+        '''):
+            entry(row[0]).update(sent_transfers=row[1], sent_bytes=row[2])
+        blobs = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs').fetchone()
+
+    return {
+        "users": sorted(users.values(), key=lambda u: u["inbox_bytes"], reverse=True),
+        "pending_transfers": sum(u["inbox_transfers"] for u in users.values()),
+        "pending_bytes": sum(u["inbox_bytes"] for u in users.values()),
+        "stored_blobs": blobs[0],
+        "stored_bytes": blobs[1]
+    }
+
+def list_indexed_transfers(recipient, cursor=None, since=None, limit=50):
+    """
+    Newest-first page of a recipient's inbox.
+
+    `cursor` is the value returned as next_cursor by the previous page;
+    `since` limits the page to transfers created after an ISO timestamp.
+    Returns (rows, next_cursor) where next_cursor is None on the last page.
+    """
+    query = '''
+        SELECT seq, id, sender, filename, size, chunk_count, created, archive
+        FROM transfers WHERE recipient = ?
+    '''
+    params = [recipient]
+    if cursor is not None:
+        query += ' AND seq < ?'
+        params.append(cursor)
+    if since:
+        query += ' AND created > ?'
+        params.append(since)
+    query += ' ORDER BY seq DESC LIMIT ?'
+    params.append(limit)
+
+    with connection() as conn:
+        rows = conn.execute(query, params).fetchall()
+
+    next_cursor = rows[-1]["seq"] if len(rows) == limit else None
+    return [_inbox_entry(row) for row in rows], next_cursor
+
+def list_transfers_after(recipient, after, limit=50):
+    '''
+    Oldest-first transfers of a recipient indexed after sequence number
+    `after`. seq is assigned when the index row is committed, so a transfer
+    indexed later always gets a higher seq than the ones already seen.
+    '''
+    with connection() as conn:
+        rows = conn.execute('''
+            SELECT seq, id, sender, filename, size, chunk_count, created, archive
+            FROM transfers WHERE recipient = ? AND seq > ?
+            ORDER BY seq LIMIT ?
+        ''', (recipient, after, limit)).fetchall()
+    return [_inbox_entry(row) for row in rows]
 
-    conn.commit()
-    conn.close()
+def _inbox_entry(row):
+    transfer = {
+        "seq": row["seq"],
+        "id": row["id"],
+        "from": row["sender"],
+        "filename": row["filename"],
+        "size": row["size"],
+        "chunk_count": row["chunk_count"],
+        "created": row["created"]
+    }
+    if row["archive"]:
+        transfer["archive"] = row["archive"]
+    return transfer
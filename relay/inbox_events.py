@@ -0,0 +1,67 @@
+import threading
+
+# === New-Transfer Notifications ===
+#
+# Receivers long-poll GET /transfers/<id>/events: when nothing new is in the
+# inbox the request is parked here until a transfer for that recipient is
+# stored (or `max_wait_seconds` pass), so new files show up at once while
+# an idle receiver costs one request per wait period.
+#
+# Each inbox has a version counter bumped by notify(). A request reads the
+# version before querying the index and waits for it to change, so a
+# transfer stored between the query and the wait is never missed.
+#
+# A parked request holds a server worker thread, so at most `max_waiters`
+# may wait at once; beyond that the relay answers 503 and the client backs
+# off. Size it (and the server's threads) for the receivers expected to
+# have their inbox open at the same time. Like SessionTracker this lives
+# in process memory (one relay process).
+
+MAX_WAIT_SECONDS = 25
+MAX_WAITERS = 48
+
+
+class TooManyWaiters(RuntimeError):
+    pass
+
+
+class InboxNotifier:
+    def __init__(self, max_waiters=MAX_WAITERS):
+        self.max_waiters = max_waiters
+        self._versions = {}
+        self._waiters = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def version(self, recipient):
+        with self._cond:
+            return self._versions.get(recipient, 0)
+
+    def notify(self, recipient):
+        """Wake requests waiting on `recipient`'s inbox."""
+        with self._cond:
+            self._versions[recipient] = self._versions.get(recipient, 0) + 1
+            self._cond.notify_all()
+
+    def wait(self, recipient, version, timeout):
+        """
+        Block until `recipient`'s inbox moves past `version`, `timeout`
+        seconds pass or the notifier is closed. Returns True if the inbox
+        changed. Raises TooManyWaiters when every waiting slot is taken.
+        """
+        with self._cond:
+            if self._waiters >= self.max_waiters:
+                raise TooManyWaiters()
+            self._waiters += 1
+            try:
+                return self._cond.wait_for(
+                    lambda: self._closed or self._versions.get(recipient, 0) != version, timeout
+                ) and not self._closed
+            finally:
+                self._waiters -= 1
+
+    def close(self):
+        """Release every waiting request (on shutdown)."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
@@ -0,0 +1,124 @@
+import json
+import codecs
+
+# === Incremental Parsing of Legacy JSON Transfers ===
+#
+# Older clients POST a whole transfer as one JSON object:
+#
+#   {"from": ..., "to": ..., "encrypted_key": ..., "filename": ...,
+#    "chunks": [{"index": 0, "data": "<base64>"}, ...]}
+#
+# Parsing that with request.get_json() holds the body, the decoded dict and
+# every base64 string at once. This parser reads the stream in pieces and
+# hands back one top-level field or one chunk at a time, so only a single
+# value is ever buffered. A value larger than `max_value_bytes` is refused
+# as soon as the buffer passes that size.
+
+READ_SIZE = 64 * 1024
+# Characters that may follow a complete JSON number
+NUMBER_END = ",}] \t\r\n"
+
+
+class JSONStreamError(ValueError):
+    pass
+
+
+class ValueTooLarge(JSONStreamError):
+    pass
+
+
+class _Reader:
+    def __init__(self, stream, max_value_bytes, read_size=READ_SIZE):
+        self.stream = stream
+        self.max_value_bytes = max_value_bytes
+        self.read_size = read_size
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size=None):
+        if self.eof:
+            return False
+        data = self.stream.read(size or self.read_size)
+        if not data:
+            self.eof = True
+            self.text += self.decoder.decode(b"", final=True)
+            return False
+        # Drop what has been consumed so the buffer only holds the current value
+        self.text = self.text[self.pos:] + self.decoder.decode(data)
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character, or "" at the end of the stream."""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, chars):
+        char = self.peek()
+        if char == "" or char not in chars:
+            raise JSONStreamError(f"Expected one of {chars!r} in transfer body")
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = json.JSONDecoder().raw_decode(self.text, self.pos)
+                # A number is only complete once a delimiter follows it: "1." or
+                # "1e" at the end of a read decode as a shorter number
+                is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+                if self.eof or (end < len(self.text) and (not is_number or self.text[end] in NUMBER_END)):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise JSONStreamError("Malformed JSON in transfer body")
+            pending = len(self.text) - self.pos
+            if pending > self.max_value_bytes:
+                raise ValueTooLarge(f"A value in the transfer body exceeds {self.max_value_bytes} bytes")
+            # Grow reads with the value so a large one is retried a few times, not once per piece
+            self._fill(max(self.read_size, min(pending, self.max_value_bytes + 1 - pending)))
+
+
+def iter_json_transfer(stream, max_value_bytes, list_key="chunks"):
+    """
+    Parse a JSON object from `stream` incrementally. Yields ("field", key,
+    value) for top-level members and ("item", index, item) for each element
+    of the `list_key` array, in body order. Raises JSONStreamError (or
+    ValueTooLarge) for malformed bodies.
+    """
+    reader = _Reader(stream, max_value_bytes)
+    reader.expect("{")
+    if reader.peek() == "}":
+        reader.expect("}")
+    else:
+        while True:
+            key = reader.value()
+            if not isinstance(key, str):
+                raise JSONStreamError("Object keys must be strings")
+            reader.expect(":")
+            if key == list_key and reader.peek() == "[":
+                reader.expect("[")
+                count = 0
+                if reader.peek() == "]":
+                    reader.expect("]")
+                else:
+                    while True:
+                        yield "item", count, reader.value()
+                        count += 1
+                        if reader.expect(",]") == "]":
+                            break
+            else:
+                yield "field", key, reader.value()
+            if reader.expect(",}") == "}":
+                break
+    if reader.peek() != "":
+        raise JSONStreamError("Unexpected data after transfer body")
@@ -0,0 +1,115 @@
+import os
+import time
+import atexit
+import shutil
+import threading
+from datetime import datetime, timedelta
+
+from relay.db import unindex_transfer, list_expired_transfers
+
+# === Retention ===
+#
+# A transfer leaves the relay when its recipient acknowledges the download,
+# or when it has waited `transfer_ttl_days` unclaimed. Deleting one removes
+# its metadata record and index row and drops one reference per chunk blob;
+# a blob goes when nothing refers to it (other fan-out recipients and delta
+# re-sends share blobs). Upload sessions idle for `upload_ttl_hours` are
+# discarded as abandoned.
+#
+# A background thread sweeps every `interval` seconds. Expiry walks the
+# index by creation time and the uploads directory holds only sessions in
+# progress, so a sweep costs what is pending, not the relay's history.
+#
+# `lock` serialises blob releases with blob adoption: whoever moves chunks
+# into the store and indexes the transfer that refers to them holds it, so
+# a blob found "already stored" cannot be deleted before its new reference
+# is counted. It is a threading lock; the relay runs as one process.
+
+TRANSFER_TTL_DAYS = 14
+UPLOAD_TTL_HOURS = 72
+SWEEP_INTERVAL = 600
+SWEEP_BATCH = 500
+
+
+class RetentionSweeper:
+    def __init__(self, store, uploads_dir, transfer_ttl_days=TRANSFER_TTL_DAYS,
+                 upload_ttl_hours=UPLOAD_TTL_HOURS, interval=SWEEP_INTERVAL):
+        self.store = store
+        self.uploads_dir = uploads_dir
+        self.transfer_ttl = timedelta(days=transfer_ttl_days)
+        self.upload_ttl = upload_ttl_hours * 3600
+        self.interval = interval
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # === Deletion ===
+    def delete_transfer(self, recipient, transfer_id):
+        """Delete one recipient's copy of a transfer and any blobs only it used. Returns False if absent."""
+        with self.lock:
+            record = self.store.load_transfer(recipient, transfer_id)
+            if record is None:
+                # An index row whose record is gone: drop the row so it is
+                # not listed (or swept) again. Without the chunk list its blob
+                # references stay counted until rebuild_blob_refs
+                return unindex_transfer(transfer_id, []) is not None
+            unreferenced = unindex_transfer(transfer_id, record["chunks"])
+            self.store.delete_transfer(recipient, transfer_id)
+            for digest in unreferenced or ():
+                self.store.delete_blob(digest)
+        return True
+
+    # === Sweeping ===
+    def expire_transfers(self, now=None):
+        """Delete transfers older than the TTL. Returns how many were removed."""
+        now = now or datetime.now()
+        cutoff = (now - self.transfer_ttl).isoformat()
+        removed = 0
+        while True:
+            expired = list_expired_transfers(cutoff, SWEEP_BATCH)
+            deleted = sum(self.delete_transfer(recipient, transfer_id) for recipient, transfer_id in expired)
+            removed += deleted
+            # A batch where nothing could be deleted would only be listed again
+            if len(expired) < SWEEP_BATCH or not deleted:
+                return removed
+
+    def expire_uploads(self, now=None):
+        """Discard upload sessions with no activity within the TTL. Returns how many were removed."""
+        now = now or time.time()
+        if not os.path.isdir(self.uploads_dir):
+            return 0
+        removed = 0
+        for name in os.listdir(self.uploads_dir):
+            path = os.path.join(self.uploads_dir, name)
+            # Under the lock, so a session is never removed while it is being completed
+            with self.lock:
+                try:
+                    # Storing a chunk adds files to the session directory, which updates its mtime
+                    idle = now - os.path.getmtime(path)
+                except FileNotFoundError:
+                    continue
+                if os.path.isdir(path) and idle > self.upload_ttl:
+                    shutil.rmtree(path, ignore_errors=True)
+                    removed += 1
+        return removed
+
+    def sweep(self):
+        return self.expire_transfers(), self.expire_uploads()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"⚠️ Retention sweep failed: {e}")
+
+    def start(self):
+        """Start the background sweeper (idempotent)."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="retention-sweep", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stop.set()
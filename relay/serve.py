@@ -0,0 +1,130 @@
+import os
+import sys
+import json
+import signal
+
+from cheroot import wsgi
+from cheroot.ssl.builtin import BuiltinSSLAdapter
+
+# === Production Relay Server ===
+#
+#   python relay/serve.py
+#
+# Serves the relay app with cheroot: one process with a pool of worker
+# threads behind a TLS listener, instead of Flask's development server.
+# Everything is read from the "server" section of relay/config.json:
+#
+#   "server": {
+#       "threads": 64,               worker threads (concurrent requests)
+#       "max_threads": 64,           cap if the pool is grown (cheroot does not grow it by itself; -1 = no limit)
+#       "request_queue": 64,         connections accepted while all workers are busy
+#       "request_timeout": 60,       seconds a connection may sit idle mid-request
+#       "shutdown_timeout": 30,      seconds in-flight requests get on SIGTERM/SIGINT
+#       "certfile": "cert.pem",      relative paths are taken from relay/
+#       "keyfile": "key.pem"
+#   }
+#
+# Why threads and not processes: the relay is I/O-bound (disk and sockets;
+# hashlib and file I/O release the GIL), and some of its state lives in
+# process memory:
+#
+#   Shared safely between worker threads (and processes):
+#     - SQLite (db.py): pooled per-thread connections, WAL, busy timeout
+#     - blob store and transfer records (storage.py): content-addressed
+#       files written to unique temp names and renamed into place
+#     - upload sessions: one directory per upload, one file per chunk
+#     - transfer log appends: single O_APPEND writes
+#
+#   Shared between threads only (one copy per process):
+#     - SessionTracker (sessions.py): the online list is an in-memory table;
+#       with several processes each would see only the heartbeats it served
+#       and their snapshots would overwrite each other
+#     - TransferLog segment rotation, serialised by a threading.Lock
+#     - InboxNotifier (inbox_events.py): long-polling receivers are woken
+#       by transfers stored in the same process
+#     - RetentionSweeper lock between blob deletion and adoption
+#     - parsed RSA key cache (lru_cache)
+#
+# So scale with "threads", and run a single relay process per storage
+# directory. A receiver waiting for new transfers holds a worker thread
+# for up to "max_wait_seconds", so "threads" must cover every receiver
+# with its inbox open plus the transfers running at the same time. The
+# "events" section's "max_waiters" caps the waiting receivers; the
+# defaults (48 waiters out of 64 threads) fit a class-sized deployment,
+# raise both together for more users.
+
+RELAY_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.path.join(RELAY_DIR, "config.json")
+
+DEFAULT_SERVER_CONFIG = {
+    "threads": 64,
+    "max_threads": 64,
+    "request_queue": 64,
+    "request_timeout": 60,
+    "shutdown_timeout": 30,
+    "certfile": "cert.pem",
+    "keyfile": "key.pem"
+}
+
+
+def load_server_config(path=CONFIG_PATH):
+    if not os.path.exists(path):
+        raise FileNotFoundError("Missing config.json file for relay_host and relay_port!")
+    with open(path, "r") as f:
+        cfg = json.load(f)
+    server_cfg = dict(DEFAULT_SERVER_CONFIG, **cfg.get("server", {}))
+    server_cfg["host"] = cfg.get("relay_host", "127.0.0.1")
+    server_cfg["port"] = cfg.get("relay_port", 5000)
+    return server_cfg
+
+
+def build_server(wsgi_app, cfg):
+    server = wsgi.Server(
+        (cfg["host"], cfg["port"]),
+        wsgi_app,
+        numthreads=cfg["threads"],
+        max=cfg["max_threads"],
+        request_queue_size=cfg["request_queue"],
+        timeout=cfg["request_timeout"],
+        shutdown_timeout=cfg["shutdown_timeout"],
+        server_name="secure-file-relay"
+    )
+    server.ssl_adapter = BuiltinSSLAdapter(
+        os.path.join(RELAY_DIR, cfg["certfile"]),
+        os.path.join(RELAY_DIR, cfg["keyfile"])
+    )
+    return server
+
+
+def main():
+    cfg = load_server_config()
+
+    # The app opens its database, storage and logs at import time
+    sys.path.insert(0, RELAY_DIR)
+    from app import app, inbox_events
+
+    server = build_server(app, cfg)
+
+    # SIGTERM and Ctrl+C: stop accepting, let in-flight requests finish (up
+    # to shutdown_timeout), then exit so the session snapshot is flushed by
+    # its atexit hook. Parked long-polls are answered first, in the handler:
+    # cheroot stops (and joins its workers) as soon as SystemExit reaches it
+    def shut_down(signum, frame):
+        inbox_events.close()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, shut_down)
+    signal.signal(signal.SIGINT, shut_down)
+
+    print(f"Relay listening on https://{cfg['host']}:{cfg['port']} with {cfg['threads']} threads")
+    try:
+        server.safe_start()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        inbox_events.close()
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import atexit
+import threading
+from datetime import datetime
+
+# === Active Session Tracker ===
+#
+# Logins and client heartbeats update an in-memory table; nothing touches
+# the disk on the request path. A session that has not been seen for
+# `ttl` seconds is considered offline and dropped. A background thread
+# prunes expired sessions and, only when something changed, writes a
+# snapshot to `persist_path` every `flush_interval` seconds (and once more
+# at exit), so a relay restart keeps who is online.
+
+SESSION_TTL_SECONDS = 180
+SESSION_FLUSH_INTERVAL = 30
+
+
+class SessionTracker:
+    def __init__(self, persist_path, ttl=SESSION_TTL_SECONDS, flush_interval=SESSION_FLUSH_INTERVAL):
+        self.persist_path = persist_path
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self._sessions = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._load()
+
+    def _load(self):
+        """Restore sessions from the last snapshot, dropping those already expired."""
+        if not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r") as f:
+                snapshot = json.load(f)
+        except ValueError:
+            return
+        now = time.time()
+        for entry in snapshot:
+            try:
+                seen = datetime.fromisoformat(entry["last_active"]).timestamp()
+            except (KeyError, TypeError, ValueError):
+                continue
+            if now - seen < self.ttl:
+                self._sessions[entry["admission_id"]] = {
+                    "admission_id": entry["admission_id"],
+                    "started": entry.get("started", entry["last_active"]),
+                    "last_active": entry["last_active"],
+                    "seen": seen
+                }
+
+    # === Updates ===
+    def touch(self, admission_id):
+        """Record a login or heartbeat for `admission_id`."""
+        now = time.time()
+        timestamp = datetime.fromtimestamp(now).isoformat()
+        with self._lock:
+            session = self._sessions.get(admission_id)
+            if session is None or now - session["seen"] >= self.ttl:
+                session = {"admission_id": admission_id, "started": timestamp}
+                self._sessions[admission_id] = session
+            session["last_active"] = timestamp
+            session["seen"] = now
+            self._dirty = True
+
+    def end(self, admission_id):
+        """Forget a session on logout. Returns False if it was not active."""
+        with self._lock:
+            if self._sessions.pop(admission_id, None) is None:
+                return False
+            self._dirty = True
+            return True
+
+    def _prune(self, now):
+        expired = [aid for aid, s in self._sessions.items() if now - s["seen"] >= self.ttl]
+        for aid in expired:
+            del self._sessions[aid]
+        if expired:
+            self._dirty = True
+
+    # === Queries ===
+    def active(self):
+        """Sessions seen within the TTL, most recently active first."""
+        with self._lock:
+            self._prune(time.time())
+            sessions = [
+                {k: s[k] for k in ("admission_id", "started", "last_active")}
+                for s in self._sessions.values()
+            ]
+        return sorted(sessions, key=lambda s: s["last_active"], reverse=True)
+
+    # === Persistence ===
+    def flush(self):
+        """Write a snapshot if anything changed since the last one."""
+        with self._lock:
+            self._prune(time.time())
+            if not self._dirty:
+                return
+            snapshot = [
+                {k: s[k] for k in ("admission_id", "started", "last_active")}
+                for s in self._sessions.values()
+            ]
+            self._dirty = False
+
+        os.makedirs(os.path.dirname(self.persist_path), exist_ok=True)
+        partial = f"{self.persist_path}.{os.getpid()}.part"
+        with open(partial, "w") as f:
+            json.dump(snapshot, f, indent=2)
+        os.replace(partial, self.persist_path)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except OSError:
+                with self._lock:
+                    self._dirty = True  # Try again next round
+
+    def start(self):
+        """Start the background flusher (idempotent) and flush once more at exit."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="session-flush", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval)
+        self.flush()
@@ -0,0 +1,224 @@
+import os
+import re
+import json
+import uuid
+import base64
+import hashlib
+from datetime import datetime
+
+# === Relay Transfer Storage ===
+#
+# <root>/
+#   meta/<recipient>/<transfer_id>.json   small metadata record, no ciphertext
+#   blobs/ab/cd/abcd...                   raw chunk ciphertext, named by SHA-256
+#
+# Metadata records list their chunks by blob hash, so listing or inspecting a
+# transfer never reads ciphertext, and serving a chunk is one direct file
+# read. The two-level hex sharding keeps directories small; identical blobs
+# are stored once.
+
+# Matched with fullmatch: "$" would also accept a trailing newline
+_SAFE_NAME = re.compile(r"[A-Za-z0-9_.@-]+")
+_TRANSFER_ID = re.compile(r"[0-9a-f]{32}")
+_DIGEST = re.compile(r"[0-9a-f]{64}")
+
+# Chunk ciphers the relay will record; transfers without one are legacy CBC
+LEGACY_CIPHER = "aes-256-cbc"
+SUPPORTED_CIPHERS = ("aes-256-cbc", "aes-256-gcm")
+
+
+class StorageError(ValueError):
+    pass
+
+
+def _check(pattern, value, what):
+    if not isinstance(value, str) or not pattern.fullmatch(value) or value in (".", ".."):
+        raise StorageError(f"Invalid {what}: {value!r}")
+    return value
+
+
+def is_valid_name(value):
+    """True if `value` is usable as a recipient directory name."""
+    return isinstance(value, str) and bool(_SAFE_NAME.fullmatch(value)) and value not in (".", "..")
+
+
+class TransferStore:
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.meta_dir = os.path.join(self.root, "meta")
+        self.blob_dir = os.path.join(self.root, "blobs")
+        os.makedirs(self.meta_dir, exist_ok=True)
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+    # === Blobs ===
+    def blob_path(self, digest):
+        _check(_DIGEST, digest, "blob hash")
+        return os.path.join(self.blob_dir, digest[:2], digest[2:4], digest)
+
+    def has_blob(self, digest):
+        return os.path.exists(self.blob_path(digest))
+
+    def put_blob(self, data):
+        """Store ciphertext bytes and return their SHA-256 address."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            partial = f"{path}.{uuid.uuid4().hex}.part"
+            with open(partial, "wb") as f:
+                f.write(data)
+            os.replace(partial, path)
+        return digest
+
+    def adopt_blob_file(self, src_path, digest):
+        """Move an already-verified file on the same volume into the blob store."""
+        path = self.blob_path(digest)
+        if os.path.exists(path):
+            os.remove(src_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(src_path, path)
+        return digest
+
+    def read_blob(self, digest):
+        with open(self.blob_path(digest), "rb") as f:
+            return f.read()
+
+    def open_blob(self, digest):
+        return open(self.blob_path(digest), "rb")
+
+    def delete_blob(self, digest):
+        """Remove a blob nothing refers to any more. Missing blobs are ignored."""
+        try:
+            os.remove(self.blob_path(digest))
+        except FileNotFoundError:
+            pass
+
+    # === Metadata ===
+    def meta_path(self, recipient, transfer_id):
+        _check(_SAFE_NAME, recipient, "recipient")
+        _check(_TRANSFER_ID, transfer_id, "transfer id")
+        return os.path.join(self.meta_dir, recipient, f"{transfer_id}.json")
+
+    def save_transfer(self, sender, recipient, encrypted_key, filename, chunks, cipher=LEGACY_CIPHER,
+                      merkle_root=None, archive=None, receipt_key=None, receipt_hash=None, root_mac=None):
+        """
+        Record a transfer whose chunk blobs are already stored.
+
+        `chunks` is a list of {"index", "size", "hash"}; `archive` names the
+        packing format when the plaintext is a batch of files; the receipt
+        fields let the recipient delete the transfer; `root_mac` is the
+        sender's MAC of the Merkle root. Returns the new record.
+        """
+        if cipher not in SUPPORTED_CIPHERS:
+            raise StorageError(f"Unsupported cipher: {cipher!r}")
+        transfer_id = uuid.uuid4().hex
+        record = {
+            "id": transfer_id,
+            "from": sender,
+            "to": recipient,
+            "encrypted_key": encrypted_key,
+            "filename": os.path.basename(filename),
+            "cipher": cipher,
+            "created": datetime.now().isoformat(),
+            "size": sum(c["size"] for c in chunks),
+            "chunks": sorted(chunks, key=lambda c: c["index"])
+        }
+        if merkle_root:
+            record["merkle_root"] = merkle_root
+        if root_mac:
+            record["root_mac"] = root_mac
+        if archive:
+            record["archive"] = archive
+        if receipt_hash:
+            record["receipt_key"] = receipt_key
+            record["receipt_hash"] = receipt_hash
+        path = self.meta_path(recipient, transfer_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".part", "w") as f:
+            json.dump(record, f)
+        os.replace(path + ".part", path)
+        return record
+
+    def load_transfer(self, recipient, transfer_id):
+        try:
+            path = self.meta_path(recipient, transfer_id)
+        except StorageError:
+            return None
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            record = json.load(f)
+        record.setdefault("cipher", LEGACY_CIPHER)
+        return record
+
+    def delete_transfer(self, recipient, transfer_id):
+        """Remove a transfer's metadata record; its blobs are released separately. Returns False if absent."""
+        try:
+            os.remove(self.meta_path(recipient, transfer_id))
+        except (FileNotFoundError, StorageError):
+            return False
+        return True
+
+    def list_transfers(self, recipient):
+        if not is_valid_name(recipient):
+            return []
+        user_dir = os.path.join(self.meta_dir, recipient)
+        if not os.path.exists(user_dir):
+            return []
+
+        records = []
+        for fname in os.listdir(user_dir):
+            if fname.endswith(".json"):
+                with open(os.path.join(user_dir, fname), "r") as f:
+                    records.append(json.load(f))
+        return sorted(records, key=lambda r: r["created"])
+
+    def iter_records(self):
+        """Yield every metadata record in the store (used to rebuild indexes)."""
+        for recipient in os.listdir(self.meta_dir):
+            user_dir = os.path.join(self.meta_dir, recipient)
+            if os.path.isdir(user_dir):
+                yield from self.list_transfers(recipient)
+
+    # === Legacy import ===
+    def migrate_legacy_transfers(self, legacy_dir):
+        """
+        Move old transfers/<to>/<filename>.meta.json files (JSON base64 chunks,
+        or .meta.json + .data pairs) into this store. Returns the count moved.
+        """
+        if not os.path.isdir(legacy_dir):
+            return 0
+
+        migrated = 0
+        for recipient in os.listdir(legacy_dir):
+            user_dir = os.path.join(legacy_dir, recipient)
+            if not os.path.isdir(user_dir):
+                continue
+            for fname in os.listdir(user_dir):
+                if not fname.endswith(".meta.json"):
+                    continue
+                meta_path = os.path.join(user_dir, fname)
+                data_path = meta_path[:-len(".meta.json")] + ".data"
+                with open(meta_path, "r") as f:
+                    legacy = json.load(f)
+
+                chunks = []
+                if legacy.get("format") == "sft":
+                    with open(data_path, "rb") as data_file:
+                        for chunk in legacy["chunks"]:
+                            data_file.seek(chunk["offset"])
+                            digest = self.put_blob(data_file.read(chunk["size"]))
+                            chunks.append({"index": chunk["index"], "size": chunk["size"], "hash": digest})
+                else:
+                    for chunk in legacy["chunks"]:
+                        data = base64.b64decode(chunk["data"])
+                        chunks.append({"index": chunk["index"], "size": len(data), "hash": self.put_blob(data)})
+
+                self.save_transfer(legacy["from"], legacy["to"], legacy["encrypted_key"],
+                                   legacy["filename"], chunks)
+                os.remove(meta_path)
+                if os.path.exists(data_path):
+                    os.remove(data_path)
+                migrated += 1
+        return migrated
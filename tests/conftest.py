@@ -0,0 +1,121 @@
+import base64
+import io
+import os
+import shutil
+import sys
+import tempfile
+import types
+import uuid
+from urllib.parse import urlsplit
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+# The relay keeps its database, storage, uploads and logs next to its source
+# (relay/.., admin/), and the clients keep their state under ~. Tests run
+# against a copy of the tree in a temporary directory with its own HOME, so
+# they never touch a real deployment's files.
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+WORK_DIR = tempfile.mkdtemp(prefix="sft-tests-")
+
+for package in ("relay", "admin", "encryption", "user"):
+    shutil.copytree(os.path.join(REPO_DIR, package), os.path.join(WORK_DIR, package),
+                    ignore=shutil.ignore_patterns("__pycache__", "*.db", "transfer_logs*", "active_sessions.json"))
+os.environ["HOME"] = os.path.join(WORK_DIR, "home")
+
+# Same import layout as the relay (flat relay modules) and the clients (flat
+# encryption modules). The top-level directories are namespace packages, so
+# they are pinned to the copy: pytest puts the repo itself on sys.path too.
+sys.path[:0] = [WORK_DIR, os.path.join(WORK_DIR, "relay"), os.path.join(WORK_DIR, "encryption")]
+for package in ("relay", "admin", "encryption", "user"):
+    module = types.ModuleType(package)
+    module.__path__ = [os.path.join(WORK_DIR, package)]
+    sys.modules[package] = module
+
+
+@pytest.fixture(scope="session")
+def relay_app():
+    import app
+    return app
+
+
+@pytest.fixture
+def client(relay_app):
+    return relay_app.app.test_client()
+
+
+@pytest.fixture(scope="session")
+def key_pair():
+    from Crypto.PublicKey import RSA
+    key = RSA.generate(2048)
+    return key.export_key(), key.publickey().export_key().decode()
+
+
+@pytest.fixture
+def new_user(client, key_pair):
+    """Registers a fresh user with the test key pair and returns its admission id."""
+    def register():
+        admission_id = f"u{uuid.uuid4().hex[:10]}"
+        response = client.post("/register", json={
+            "admission_id": admission_id, "password_hash": "x",
+            "display_name": admission_id, "public_key": key_pair[1]
+        })
+        assert response.status_code == 201, response.get_json()
+        return admission_id
+    return register
+
+
+@pytest.fixture
+def send_transfer(client):
+    """Stores a one-chunk transfer through the legacy JSON upload and returns its id."""
+    def send(sender, recipient, filename, data=None):
+        data = filename.encode() if data is None else data
+        response = client.post("/transfer", json={
+            "from": sender, "to": recipient, "encrypted_key": "k", "filename": filename,
+            "chunks": [{"index": 0, "data": base64.b64encode(data).decode()}]
+        })
+        assert response.status_code == 200, response.get_json()
+        return response.get_json()["transfer_id"]
+    return send
+
+
+class FlaskAdapter(BaseAdapter):
+    """A requests transport that hands requests to a Flask test client instead of the network."""
+
+    def __init__(self, flask_client):
+        super().__init__()
+        self.flask_client = flask_client
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        url = urlsplit(request.url)
+        body = request.body
+        if body is not None and not isinstance(body, (bytes, str)):
+            body = b"".join(body)
+        answer = self.flask_client.open(url.path, method=request.method, query_string=url.query,
+                                        headers=dict(request.headers), data=body)
+        response = requests.Response()
+        response.status_code = answer.status_code
+        response.headers = CaseInsensitiveDict(answer.headers)
+        response.raw = io.BytesIO(answer.get_data())
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def relay_client(client, monkeypatch):
+    """The clients' shared RelayClient, talking to the test relay."""
+    import relay_client
+    session = requests.Session()
+    session.mount("https://", FlaskAdapter(client))
+    monkeypatch.setattr(relay_client.relay, "session", session)
+    return relay_client.relay
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
@@ -0,0 +1,55 @@
+import io
+import os
+import tarfile
+
+import pytest
+
+from archive import build_directory_archive, extract_archive
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "project"
+    (root / "sub").mkdir(parents=True)
+    (root / "a.txt").write_text("a")
+    (root / "sub" / "b.txt").write_text("bb")
+    os.symlink(root / "a.txt", root / "link")
+    return root
+
+
+def test_directory_round_trip(tree, tmp_path):
+    archive = tmp_path / "batch.tar"
+    assert build_directory_archive(str(tree), str(archive)) == (2, 3)
+
+    out = tmp_path / "out"
+    assert extract_archive(str(archive), str(out)) == 2
+    assert (out / "project" / "sub" / "b.txt").read_text() == "bb"
+    assert not (out / "project" / "link").exists()
+
+
+def test_packing_is_reproducible(tree, tmp_path):
+    build_directory_archive(str(tree), str(tmp_path / "1.tar"))
+    build_directory_archive(str(tree), str(tmp_path / "2.tar"))
+    assert (tmp_path / "1.tar").read_bytes() == (tmp_path / "2.tar").read_bytes()
+
+
+def write_archive(path, name, kind=tarfile.REGTYPE):
+    with tarfile.open(path, "w") as tar:
+        member = tarfile.TarInfo(name)
+        member.type = kind
+        if kind == tarfile.SYMTYPE:
+            member.linkname = "/etc/passwd"
+        tar.addfile(member, io.BytesIO(b"") if kind == tarfile.REGTYPE else None)
+
+
+@pytest.mark.parametrize("name, kind", [
+    ("../escape.txt", tarfile.REGTYPE),
+    ("/abs.txt", tarfile.REGTYPE),
+    ("link", tarfile.SYMTYPE),
+])
+def test_unsafe_members_are_refused(tmp_path, name, kind):
+    archive = tmp_path / "evil.tar"
+    write_archive(str(archive), name, kind)
+    with pytest.raises(ValueError):
+        extract_archive(str(archive), str(tmp_path / "out"))
+    assert not (tmp_path / "escape.txt").exists()
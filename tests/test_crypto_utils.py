@@ -0,0 +1,84 @@
+import os
+import random
+
+import pytest
+
+from crypto_utils import (
+    CHUNKING_CDC,
+    CIPHER_GCM,
+    build_chunk_plan,
+    compress_chunk,
+    decrypt_chunk_stream,
+    decrypt_chunk_with_aes,
+    encrypt_chunk_with_aes,
+    encrypt_file_stream,
+    generate_aes_key,
+    iter_planned_chunks,
+)
+
+
+@pytest.fixture
+def key():
+    return generate_aes_key()
+
+
+def test_gcm_chunk_round_trip(key):
+    encrypted = encrypt_chunk_with_aes(b"secret", key, index=3)
+    assert decrypt_chunk_with_aes(encrypted, key, 3, CIPHER_GCM) == b"secret"
+
+
+def test_gcm_rejects_tampering_and_moved_chunks(key):
+    encrypted = encrypt_chunk_with_aes(b"secret", key, index=3)
+    tampered = encrypted[:-1] + bytes([encrypted[-1] ^ 1])
+    with pytest.raises(ValueError):
+        decrypt_chunk_with_aes(tampered, key, 3, CIPHER_GCM)
+    with pytest.raises(ValueError):
+        decrypt_chunk_with_aes(encrypted, key, 4, CIPHER_GCM)
+
+
+def test_gcm_binds_the_codec(key):
+    codec, packed = compress_chunk(b"a" * 10000)
+    encrypted = encrypt_chunk_with_aes(packed, key, 0, codec=codec)
+    with pytest.raises(ValueError):
+        decrypt_chunk_with_aes(encrypted, key, 0, CIPHER_GCM)
+
+
+def test_file_stream_round_trip(tmp_path, key):
+    data = os.urandom(2 * 1024 * 1024 + 7) + b"x" * 100000
+    path = tmp_path / "file.bin"
+    path.write_bytes(data)
+    records = list(encrypt_file_stream(str(path), key, compress=True))
+    chunks = [({"index": r["index"], "hash": r["hash"], "codec": r["codec"]}, r["data"]) for r in records]
+    assert b"".join(decrypt_chunk_stream(chunks, key, CIPHER_GCM)) == data
+
+
+def test_cdc_chunks_realign_after_an_insertion(tmp_path):
+    rng = random.Random(1)
+    lines = [f"{rng.random()},{rng.random()}\n".encode() for _ in range(200000)]
+    original, edited = tmp_path / "a.csv", tmp_path / "b.csv"
+    original.write_bytes(b"".join(lines))
+    edited.write_bytes(b"".join(lines[:10] + [b"inserted line\n"] + lines[10:]))
+
+    before = build_chunk_plan(str(original), CHUNKING_CDC)
+    after = build_chunk_plan(str(edited), CHUNKING_CDC)
+    assert sum(e["size"] for e in before) == original.stat().st_size
+    unchanged = {e["signature"] for e in before} & {e["signature"] for e in after}
+    assert len(unchanged) >= len(before) - 2
+
+    planned = b"".join(data for _, data in iter_planned_chunks(str(edited), after))
+    assert planned == edited.read_bytes()
+
+
+def test_chunk_plan_can_be_stopped_part_way(tmp_path):
+    path = tmp_path / "file.bin"
+    path.write_bytes(bytes(5 * 1024 * 1024))
+    seen = []
+
+    def stop_after_two(entry):
+        seen.append(entry["index"])
+        if len(seen) == 2:
+            raise KeyboardInterrupt()
+
+    with pytest.raises(KeyboardInterrupt):
+        build_chunk_plan(str(path), on_chunk=stop_after_two)
+    assert seen == [0, 1]
@@ -0,0 +1,72 @@
+import threading
+import uuid
+
+import pytest
+
+from relay.db import ConnectionPool, MIGRATIONS, migrate, index_transfer, unindex_transfer, find_public_keys
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "test.db"), size=2)
+    yield pool
+    pool.close_all()
+
+
+def test_migrations_run_once(pool):
+    with pool.connection() as conn:
+        assert migrate(conn) == len(MIGRATIONS)
+        assert migrate(conn) == len(MIGRATIONS)
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_concurrent_migrations_agree(pool):
+    results = []
+
+    def run():
+        with pool.connection() as conn:
+            results.append(migrate(conn))
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [len(MIGRATIONS)] * 4
+
+
+def test_nested_blocks_share_a_connection_and_are_pooled(pool):
+    with pool.connection() as outer:
+        with pool.connection() as inner:
+            assert inner is outer
+    with pool.connection() as again:
+        assert again is outer
+
+
+def test_uncommitted_work_is_rolled_back_on_return(pool):
+    with pool.connection() as conn:
+        migrate(conn)
+        conn.execute("INSERT INTO users (admission_id, password_hash, display_name, public_key) "
+                     "VALUES ('a', 'x', 'a', 'k')")
+    with pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0
+
+
+def record(chunks):
+    return {"id": uuid.uuid4().hex, "to": "r", "from": "s", "filename": "f", "size": 1,
+            "chunks": chunks, "created": "2026-01-01T00:00:00"}
+
+
+def test_blob_is_released_with_its_last_reference(relay_app):
+    shared = {"hash": uuid.uuid4().hex * 2, "size": 3}
+    first, second = record([shared]), record([shared])
+    index_transfer(first)
+    index_transfer(second)
+    assert unindex_transfer(first["id"], first["chunks"]) == []
+    assert unindex_transfer(second["id"], second["chunks"]) == [shared["hash"]]
+    assert unindex_transfer(second["id"], second["chunks"]) is None
+
+
+def test_public_key_batch_lookup(new_user, key_pair):
+    known = new_user()
+    assert find_public_keys({known, "nobody"}) == {known: key_pair[1]}
@@ -0,0 +1,61 @@
+import hashlib
+
+import pytest
+
+from crypto_utils import verify_merkle_proof
+from transfer_format import CONTENT_TYPE, encode_end, encode_frame, encode_header
+
+CHUNKS = [b"first chunk", b"second", b"third chunk!"]
+
+
+@pytest.fixture
+def transfer(client, new_user):
+    """A three-chunk framed transfer; returns its base path."""
+    recipient = new_user()
+    header = {"from": new_user(), "to": recipient, "encrypted_key": "k", "filename": "f", "cipher": "aes-256-gcm"}
+    body = encode_header(header) + b"".join(encode_frame(i, c) for i, c in enumerate(CHUNKS)) + encode_end()
+    response = client.post("/transfer", data=body, headers={"Content-Type": CONTENT_TYPE})
+    return f"/transfers/{recipient}/{response.get_json()['transfer_id']}"
+
+
+def test_single_chunk_download(client, transfer):
+    response = client.get(f"{transfer}/chunks/1")
+    assert response.status_code == 200
+    assert response.get_data() == CHUNKS[1]
+    assert response.headers["X-Chunk-Hash"] == hashlib.sha256(CHUNKS[1]).hexdigest()
+    assert client.get(f"{transfer}/chunks/3").status_code == 404
+
+
+def test_chunk_download_is_conditional(client, transfer):
+    digest = hashlib.sha256(CHUNKS[0]).hexdigest()
+    assert client.get(f"{transfer}/chunks/0", headers={"If-None-Match": f'"{digest}"'}).status_code == 304
+
+
+def test_proof_links_a_chunk_to_the_root(client, transfer):
+    manifest = client.get(f"{transfer}/manifest").get_json()
+    for index in range(len(CHUNKS)):
+        proof = client.get(f"{transfer}/proof/{index}").get_json()
+        assert verify_merkle_proof(proof["hash"], proof["proof"], manifest["merkle_root"])
+    assert client.get(f"{transfer}/proof/9").status_code == 404
+
+
+@pytest.mark.parametrize("byte_range, start, stop", [
+    ("bytes=0-4", 0, 5),
+    ("bytes=8-15", 8, 16),  # Crosses the first two chunks
+    ("bytes=-5", len(b"".join(CHUNKS)) - 5, len(b"".join(CHUNKS))),
+])
+def test_ranged_download_spans_chunks(client, transfer, byte_range, start, stop):
+    response = client.get(f"{transfer}/data", headers={"Range": byte_range})
+    assert response.status_code == 206
+    assert response.get_data() == b"".join(CHUNKS)[start:stop]
+
+
+def test_whole_ciphertext_and_unsatisfiable_range(client, transfer):
+    assert client.get(f"{transfer}/data").get_data() == b"".join(CHUNKS)
+    assert client.get(f"{transfer}/data", headers={"Range": "bytes=1000-2000"}).status_code == 416
+
+
+def test_unknown_transfer_is_404(client, new_user):
+    base = f"/transfers/{new_user()}/{'0' * 32}"
+    for suffix in ("", "/manifest", "/chunks/0", "/data", "/proof/0"):
+        assert client.get(base + suffix).status_code == 404
@@ -0,0 +1,35 @@
+import os
+
+from receiver_gui import receive_transfer
+from send_gui import send_file_resumable
+from relay.db import list_indexed_transfers
+
+
+def test_one_upload_reaches_every_recipient(tmp_path, relay_client, relay_app, new_user, key_pair):
+    sender, recipients = new_user(), [new_user(), new_user(), new_user()]
+    data = os.urandom(1024 * 1024 + 10)
+    source = tmp_path / "source.bin"
+    source.write_bytes(data)
+    send_file_resumable(sender, recipients, str(source))
+
+    transfers = {r: list_indexed_transfers(r)[0][0] for r in recipients}
+    records = [relay_app.store.load_transfer(r, t["id"]) for r, t in transfers.items()]
+    # One set of blobs, one wrapped key and receipt per recipient
+    assert len({tuple(c["hash"] for c in record["chunks"]) for record in records}) == 1
+    assert len({record["encrypted_key"] for record in records}) == len(recipients)
+    assert len({record["receipt_hash"] for record in records}) == len(recipients)
+
+    for recipient, transfer in transfers.items():
+        save_path = tmp_path / f"{recipient}.bin"
+        receive_transfer(recipient, transfer, str(save_path), key_pair[0])
+        assert save_path.read_bytes() == data
+        # Acknowledged with its own receipt, so it is gone for this recipient only
+        assert list_indexed_transfers(recipient)[0] == []
+
+
+def test_fan_out_with_an_invalid_recipient_is_refused(client, new_user):
+    response = client.post("/uploads", json={
+        "from": new_user(), "filename": "f", "chunk_count": 1,
+        "recipients": [{"to": new_user(), "encrypted_key": "k"}, {"to": "../x", "encrypted_key": "k"}]
+    })
+    assert response.status_code == 400
@@ -0,0 +1,112 @@
+import threading
+import time
+import uuid
+
+import pytest
+
+from inbox_events import InboxNotifier, TooManyWaiters
+from relay.db import index_transfer
+
+
+def events(client, recipient, **params):
+    params.setdefault("timeout", 0)
+    return client.get(f"/transfers/{recipient}/events", query_string=params)
+
+
+def test_events_page_forward_by_index_sequence(client, new_user, send_transfer):
+    sender, recipient = new_user(), new_user()
+    send_transfer(sender, recipient, "first")
+    send_transfer(sender, recipient, "second")
+
+    body = events(client, recipient).get_json()
+    assert [t["filename"] for t in body["transfers"]] == ["first", "second"]
+    assert body["cursor"] == body["transfers"][-1]["seq"]
+
+    again = events(client, recipient, after=body["cursor"]).get_json()
+    assert again == {"transfers": [], "cursor": body["cursor"]}
+
+
+def test_transfer_indexed_late_is_not_skipped(client, new_user, send_transfer):
+    sender, recipient = new_user(), new_user()
+    send_transfer(sender, recipient, "new")
+    cursor = events(client, recipient).get_json()["cursor"]
+
+    # Created before the transfer already seen, but indexed after it
+    index_transfer({"id": uuid.uuid4().hex, "to": recipient, "from": sender, "filename": "late",
+                    "size": 1, "chunks": [], "created": "2000-01-01T00:00:00"})
+    body = events(client, recipient, after=cursor).get_json()
+    assert [t["filename"] for t in body["transfers"]] == ["late"]
+
+
+def test_backlog_beyond_one_page_is_returned_in_order(client, new_user, send_transfer, relay_app, monkeypatch):
+    monkeypatch.setattr(relay_app, "INBOX_MAX_PAGE_SIZE", 2)
+    sender, recipient = new_user(), new_user()
+    for name in ("a", "b", "c"):
+        send_transfer(sender, recipient, name)
+
+    seen, cursor = [], 0
+    for _ in range(3):
+        body = events(client, recipient, after=cursor).get_json()
+        seen += [t["filename"] for t in body["transfers"]]
+        cursor = body["cursor"]
+    assert seen == ["a", "b", "c"]
+
+
+@pytest.mark.parametrize("params", [
+    {"after": "x"}, {"after": -1}, {"timeout": "nan"}, {"timeout": "inf"}, {"timeout": "soon"}
+])
+def test_invalid_event_parameters_are_rejected(client, new_user, params):
+    assert events(client, new_user(), **params).status_code == 400
+
+
+def test_negative_timeout_answers_at_once(client, new_user):
+    started = time.monotonic()
+    response = events(client, new_user(), timeout=-5)
+    assert response.status_code == 200
+    assert time.monotonic() - started < 1
+
+
+def test_waiting_request_is_woken_by_a_new_transfer(client, new_user, send_transfer, relay_app):
+    sender, recipient = new_user(), new_user()
+    result = {}
+
+    def poll():
+        result["body"] = relay_app.app.test_client().get(
+            f"/transfers/{recipient}/events", query_string={"timeout": 10}).get_json()
+
+    waiter = threading.Thread(target=poll)
+    started = time.monotonic()
+    waiter.start()
+    time.sleep(0.2)
+    send_transfer(sender, recipient, "pushed")
+    waiter.join(5)
+    assert time.monotonic() - started < 5
+    assert [t["filename"] for t in result["body"]["transfers"]] == ["pushed"]
+
+
+def test_notifier_caps_waiters_and_releases_them_on_close():
+    notifier = InboxNotifier(max_waiters=1)
+    result = {}
+    waiter = threading.Thread(target=lambda: result.update(changed=notifier.wait("a", 0, 10)))
+    waiter.start()
+    time.sleep(0.1)
+    with pytest.raises(TooManyWaiters):
+        notifier.wait("b", 0, 1)
+    notifier.close()
+    waiter.join(2)
+    assert result == {"changed": False}
+
+
+def test_notify_wakes_only_on_a_new_version():
+    notifier = InboxNotifier()
+    version = notifier.version("a")
+    notifier.notify("a")
+    assert notifier.wait("a", version, 0)
+    assert not notifier.wait("a", notifier.version("a"), 0)
+
+
+def test_event_polls_keep_the_session_active(client, new_user, relay_app):
+    recipient = new_user()
+    relay_app.sessions.end(recipient)
+    events(client, recipient)
+    assert recipient in {s["admission_id"] for s in relay_app.sessions.active()}
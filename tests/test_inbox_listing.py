@@ -0,0 +1,46 @@
+import pytest
+
+
+def list_inbox(client, recipient, **params):
+    return client.get(f"/transfers/{recipient}", query_string=params)
+
+
+def test_inbox_pages_newest_first(client, new_user, send_transfer):
+    sender, recipient = new_user(), new_user()
+    for name in ("a", "b", "c"):
+        send_transfer(sender, recipient, name)
+
+    first = list_inbox(client, recipient, limit=2)
+    assert [t["filename"] for t in first.get_json()] == ["c", "b"]
+    cursor = first.headers["X-Next-Cursor"]
+
+    second = list_inbox(client, recipient, limit=2, cursor=cursor)
+    assert [t["filename"] for t in second.get_json()] == ["a"]
+    assert "X-Next-Cursor" not in second.headers
+
+
+def test_inbox_entries_are_metadata_only(client, new_user, send_transfer):
+    sender, recipient = new_user(), new_user()
+    send_transfer(sender, recipient, "f", data=b"12345")
+    [entry] = list_inbox(client, recipient).get_json()
+    assert entry["from"] == sender
+    assert entry["size"] == 5
+    assert entry["chunk_count"] == 1
+    assert "chunks" not in entry and "encrypted_key" not in entry
+
+
+def test_inbox_since_filters_by_creation_time(client, new_user, send_transfer):
+    sender, recipient = new_user(), new_user()
+    send_transfer(sender, recipient, "old")
+    [old] = list_inbox(client, recipient).get_json()
+    send_transfer(sender, recipient, "new")
+    assert [t["filename"] for t in list_inbox(client, recipient, since=old["created"]).get_json()] == ["new"]
+
+
+def test_inbox_of_unknown_user_is_empty(client):
+    assert list_inbox(client, "nobody").get_json() == []
+
+
+@pytest.mark.parametrize("limit", ["0", "-1", "many"])
+def test_invalid_page_size_is_400(client, new_user, limit):
+    assert list_inbox(client, new_user(), limit=limit).status_code == 400
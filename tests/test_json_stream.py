@@ -0,0 +1,77 @@
+import io
+import json
+import random
+
+import pytest
+
+from relay.json_stream import iter_json_transfer, JSONStreamError, ValueTooLarge
+
+
+class TrickleStream(io.RawIOBase):
+    """Returns at most `step` bytes per read, like a slow request body."""
+
+    def __init__(self, data, step):
+        self.data = data
+        self.pos = 0
+        self.step = step
+
+    def read(self, size=-1):
+        size = self.step if size is None or size < 0 else min(size, self.step)
+        chunk = self.data[self.pos:self.pos + size]
+        self.pos += len(chunk)
+        return chunk
+
+
+def parse(text, step, max_value_bytes=1024 * 1024):
+    fields, items = {}, []
+    for kind, key, value in iter_json_transfer(TrickleStream(text.encode(), step), max_value_bytes):
+        if kind == "field":
+            fields[key] = value
+        else:
+            items.append(value)
+    return fields, items
+
+
+@pytest.mark.parametrize("step", range(1, 12))
+def test_numbers_split_across_reads(step):
+    fields, items = parse('{"ts": 1.5, "n": -12e-3, "big": 12345678, "chunks": [1.25, 2, 3e2]}', step)
+    assert fields == {"ts": 1.5, "n": -12e-3, "big": 12345678}
+    assert items == [1.25, 2, 3e2]
+
+
+def test_matches_json_loads_for_random_bodies():
+    rng = random.Random(1234)
+
+    def value(depth=0):
+        kind = rng.randrange(7 if depth < 2 else 5)
+        if kind == 0:
+            return rng.randint(-10 ** 6, 10 ** 6)
+        if kind == 1:
+            return rng.uniform(-1e6, 1e6)
+        if kind == 2:
+            return "".join(rng.choice('ab"\\é ,}]') for _ in range(rng.randrange(8)))
+        if kind == 3:
+            return rng.choice([True, False, None])
+        if kind == 4:
+            return rng.random() * 10 ** rng.randint(-8, 8)
+        if kind == 5:
+            return [value(depth + 1) for _ in range(rng.randrange(4))]
+        return {str(i): value(depth + 1) for i in range(rng.randrange(4))}
+
+    for _ in range(300):
+        body = {f"k{i}": value() for i in range(rng.randrange(5))}
+        body["chunks"] = [value() for _ in range(rng.randrange(5))]
+        text = json.dumps(body, separators=rng.choice([(",", ":"), (", ", ": ")]))
+        fields, items = parse(text, rng.randint(1, 9))
+        expected = json.loads(text)
+        assert items == expected.pop("chunks")
+        assert fields == expected
+
+
+def test_malformed_and_oversized_bodies():
+    with pytest.raises(JSONStreamError):
+        parse('{"ts": 1.5 "chunks": []}', 3)
+    with pytest.raises(JSONStreamError):
+        parse('{"chunks": []} trailing', 4)
+    with pytest.raises(ValueTooLarge):
+        parse('{"data": "%s"}' % ("x" * 200), 16, max_value_bytes=64)
@@ -0,0 +1,51 @@
+import uuid
+
+import pytest
+
+from relay.db import create_user
+
+
+@pytest.fixture
+def broken_user():
+    """A user stored before keys were validated at registration, with an unusable PEM."""
+    admission_id = f"u{uuid.uuid4().hex[:10]}"
+    assert create_user(admission_id, "x", admission_id, "-----BEGIN PUBLIC KEY-----\nnot a key\n")
+    return admission_id
+
+
+def test_public_key_is_served_with_fingerprint_and_etag(client, new_user):
+    admission_id = new_user()
+    response = client.get(f"/users/{admission_id}/public_key")
+    assert response.status_code == 200
+    entry = response.get_json()
+    assert entry["admission_id"] == admission_id
+    assert len(entry["fingerprint"]) == 64
+
+    again = client.get(f"/users/{admission_id}/public_key", headers={"If-None-Match": f'"{entry["etag"]}"'})
+    assert again.status_code == 304
+
+
+def test_unparsable_stored_key_is_422(client, broken_user):
+    assert client.get(f"/users/{broken_user}/public_key").status_code == 422
+
+
+def test_batch_lists_unparsable_keys_as_invalid(client, new_user, broken_user):
+    good = new_user()
+    response = client.post("/users/public_keys", json={"admission_ids": [good, broken_user, "nobody"]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert list(body["keys"]) == [good]
+    assert body["invalid"] == [broken_user]
+    assert body["missing"] == ["nobody"]
+
+
+@pytest.mark.parametrize("public_key", ["not a key", 42, "private"])
+def test_register_rejects_unusable_keys(client, key_pair, public_key):
+    if public_key == "private":
+        public_key = key_pair[0].decode()
+    admission_id = f"u{uuid.uuid4().hex[:10]}"
+    response = client.post("/register", json={
+        "admission_id": admission_id, "password_hash": "x", "display_name": "x", "public_key": public_key
+    })
+    assert response.status_code == 400
+    assert client.get(f"/users/{admission_id}").status_code == 404
@@ -0,0 +1,160 @@
+import base64
+import hashlib
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from relay.db import index_transfer, list_indexed_transfers
+from retention import RetentionSweeper
+from transfer_format import encode_frame
+
+TOKEN = os.urandom(32)
+
+
+def send_with_receipt(client, sender, recipients, data):
+    response = client.post("/uploads", json={
+        "from": sender, "filename": "file.bin", "chunk_count": 1, "cipher": "aes-256-gcm",
+        "recipients": [{"to": r, "encrypted_key": "k", "receipt_key": "wrapped",
+                        "receipt_hash": hashlib.sha256(TOKEN).hexdigest()} for r in recipients]
+    })
+    assert response.status_code == 201, response.get_json()
+    upload_path = f"/uploads/{response.get_json()['upload_id']}"
+    assert client.put(f"{upload_path}/chunks/0", data=encode_frame(0, data)).status_code == 200
+    response = client.post(f"{upload_path}/complete", json={})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()["transfer_ids"]
+
+
+def acknowledge(client, recipient, transfer_id, token=TOKEN):
+    return client.delete(f"/transfers/{recipient}/{transfer_id}",
+                         headers={"X-Receipt-Token": base64.b64encode(token).decode()})
+
+
+def test_acknowledgement_needs_the_receipt_token(client, new_user):
+    sender, recipient = new_user(), new_user()
+    transfer_id = send_with_receipt(client, sender, [recipient], os.urandom(64))[recipient]
+
+    assert acknowledge(client, recipient, transfer_id, os.urandom(32)).status_code == 403
+    assert client.delete(f"/transfers/{recipient}/{transfer_id}").status_code == 403
+    assert acknowledge(client, recipient, transfer_id).status_code == 200
+    assert acknowledge(client, recipient, transfer_id).status_code == 404
+
+
+def test_admin_may_delete_without_a_receipt(client, new_user, send_transfer):
+    sender, recipient = new_user(), new_user()
+    transfer_id = send_transfer(sender, recipient, "f")
+    response = client.delete(f"/transfers/{recipient}/{transfer_id}", auth=("admin", "admin123"))
+    assert response.status_code == 200
+
+
+def test_shared_blob_is_kept_until_the_last_recipient_acknowledges(client, new_user, relay_app):
+    sender, first, second = new_user(), new_user(), new_user()
+    data = os.urandom(64)
+    digest = hashlib.sha256(data).hexdigest()
+    transfer_ids = send_with_receipt(client, sender, [first, second], data)
+
+    acknowledge(client, first, transfer_ids[first])
+    assert relay_app.store.has_blob(digest)
+    acknowledge(client, second, transfer_ids[second])
+    assert not relay_app.store.has_blob(digest)
+
+
+@pytest.fixture
+def sweeper(relay_app, tmp_path):
+    return RetentionSweeper(relay_app.store, str(tmp_path / "uploads"), transfer_ttl_days=1, upload_ttl_hours=1)
+
+
+def test_expired_transfers_are_removed(sweeper, new_user, send_transfer):
+    sender, recipient = new_user(), new_user()
+    send_transfer(sender, recipient, "old")
+    sweeper.expire_transfers(now=datetime.now() + timedelta(days=2))
+    assert list_indexed_transfers(recipient)[0] == []
+
+
+def test_index_row_without_a_record_is_swept_once(sweeper, new_user, monkeypatch):
+    recipient = new_user()
+    index_transfer({"id": uuid.uuid4().hex, "to": recipient, "from": "x", "filename": "gone",
+                    "size": 1, "chunks": [], "created": "2000-01-01T00:00:00"})
+    monkeypatch.setattr("retention.SWEEP_BATCH", 1)
+    assert sweeper.expire_transfers(now=datetime(2000, 1, 3)) == 1
+    assert list_indexed_transfers(recipient)[0] == []
+
+
+def test_idle_upload_sessions_are_discarded(sweeper):
+    idle = os.path.join(sweeper.uploads_dir, "idle")
+    active = os.path.join(sweeper.uploads_dir, "active")
+    os.makedirs(idle)
+    os.makedirs(active)
+    past = time.time() - 2 * 3600
+    os.utime(idle, (past, past))
+
+    assert sweeper.expire_uploads() == 1
+    assert not os.path.exists(idle)
+    assert os.path.exists(active)
+
+
+def test_upload_expiry_waits_for_the_lock(sweeper):
+    idle = os.path.join(sweeper.uploads_dir, "idle")
+    os.makedirs(idle)
+    past = time.time() - 2 * 3600
+    os.utime(idle, (past, past))
+
+    with sweeper.lock:
+        expiry = threading.Thread(target=sweeper.expire_uploads)
+        expiry.start()
+        time.sleep(0.1)
+        assert os.path.exists(idle)
+    expiry.join(2)
+    assert not os.path.exists(idle)
+
+
+def test_completing_a_discarded_session_is_not_found(client, relay_app, new_user, monkeypatch):
+    sender, recipient = new_user(), new_user()
+    response = client.post("/uploads", json={
+        "from": sender, "to": recipient, "encrypted_key": "k", "filename": "f", "chunk_count": 1
+    })
+    upload_id = response.get_json()["upload_id"]
+    assert client.put(f"/uploads/{upload_id}/chunks/0", data=encode_frame(0, b"chunk")).status_code == 200
+
+    # The session is swept between being loaded and the lock being taken
+    load_upload_session = relay_app.load_upload_session
+
+    def load_then_sweep(upload_id):
+        loaded = load_upload_session(upload_id)
+        relay_app.shutil.rmtree(loaded[0])
+        return loaded
+    monkeypatch.setattr(relay_app, "load_upload_session", load_then_sweep)
+
+    assert client.post(f"/uploads/{upload_id}/complete", json={}).status_code == 404
+    assert list_indexed_transfers(recipient)[0] == []
+
+
+def test_full_inbox_refuses_new_transfers(client, new_user, send_transfer, relay_app, monkeypatch):
+    sender, recipient = new_user(), new_user()
+    send_transfer(sender, recipient, "first", data=b"x" * 10)
+    monkeypatch.setattr(relay_app, "INBOX_QUOTA", 15)
+
+    response = client.post("/transfer", json={
+        "from": sender, "to": recipient, "encrypted_key": "k", "filename": "second",
+        "chunks": [{"index": 0, "data": base64.b64encode(b"y" * 10).decode()}]
+    })
+    assert response.status_code == 507
+    assert response.get_json()["recipients"] == [recipient]
+
+    upload = client.post("/uploads", json={
+        "from": sender, "to": recipient, "encrypted_key": "k", "filename": "f", "chunk_count": 1
+    })
+    assert upload.status_code == 201
+    monkeypatch.setattr(relay_app, "INBOX_QUOTA", 10)
+    assert client.post("/uploads", json={
+        "from": sender, "to": recipient, "encrypted_key": "k", "filename": "f", "chunk_count": 1
+    }).status_code == 507
+
+
+def test_usage_report_needs_admin(client):
+    assert client.get("/admin/usage").status_code == 401
+    assert client.get("/admin/usage", auth=("admin", "admin123")).status_code == 200
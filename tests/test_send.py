@@ -0,0 +1,22 @@
+import pytest
+
+from send_gui import send_file_resumable
+from transfer_manager import TransferCancelled
+
+
+def test_send_cancelled_while_planning_makes_no_requests(tmp_path, relay_client, monkeypatch):
+    path = tmp_path / "big.bin"
+    path.write_bytes(bytes(5 * 1024 * 1024))
+    requests_made = []
+    monkeypatch.setattr(relay_client, "request", lambda *args, **kwargs: requests_made.append(args))
+    calls = []
+
+    def on_progress(done, total):
+        calls.append(done)
+        if len(calls) == 2:
+            raise TransferCancelled()
+
+    with pytest.raises(TransferCancelled):
+        send_file_resumable("alice", "bob", str(path), on_progress=on_progress)
+    assert calls == [0, 0]
+    assert requests_made == []
@@ -0,0 +1,20 @@
+import json
+
+from serve import DEFAULT_SERVER_CONFIG, build_server, load_server_config
+
+
+def test_config_merges_defaults_with_the_server_section(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"relay_host": "0.0.0.0", "relay_port": 8443, "server": {"threads": 8}}))
+    cfg = load_server_config(str(path))
+    assert cfg["threads"] == 8
+    assert cfg["request_queue"] == DEFAULT_SERVER_CONFIG["request_queue"]
+    assert (cfg["host"], cfg["port"]) == ("0.0.0.0", 8443)
+
+
+def test_server_is_built_from_the_config(relay_app):
+    cfg = dict(DEFAULT_SERVER_CONFIG, host="127.0.0.1", port=0, threads=4, max_threads=4)
+    server = build_server(relay_app.app, cfg)
+    assert server.requests.min == 4
+    assert server.requests.max == 4
+    assert server.ssl_adapter is not None
@@ -0,0 +1,67 @@
+import json
+import time
+
+import pytest
+
+from sessions import SessionTracker
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "active_sessions.json")
+
+
+def ids(tracker):
+    return [s["admission_id"] for s in tracker.active()]
+
+
+def test_touch_and_end(path):
+    tracker = SessionTracker(path)
+    tracker.touch("alice")
+    tracker.touch("bob")
+    assert ids(tracker) == ["bob", "alice"]
+    assert tracker.end("alice")
+    assert not tracker.end("alice")
+    assert ids(tracker) == ["bob"]
+
+
+def test_heartbeat_keeps_the_start_time(path):
+    tracker = SessionTracker(path)
+    tracker.touch("alice")
+    started = tracker.active()[0]["started"]
+    time.sleep(0.01)
+    tracker.touch("alice")
+    session = tracker.active()[0]
+    assert session["started"] == started
+    assert session["last_active"] > started
+
+
+def test_sessions_expire_after_the_ttl(path):
+    tracker = SessionTracker(path, ttl=0.05)
+    tracker.touch("alice")
+    time.sleep(0.1)
+    assert ids(tracker) == []
+
+
+def test_snapshot_survives_a_restart(path):
+    tracker = SessionTracker(path)
+    tracker.touch("alice")
+    tracker.flush()
+    with open(path) as f:
+        assert [s["admission_id"] for s in json.load(f)] == ["alice"]
+    assert ids(SessionTracker(path)) == ["alice"]
+
+
+def test_expired_snapshot_entries_are_dropped_on_load(path):
+    with open(path, "w") as f:
+        json.dump([{"admission_id": "old", "last_active": "2000-01-01T00:00:00"}, {"bad": 1}], f)
+    assert ids(SessionTracker(path)) == []
+
+
+def test_heartbeat_endpoints(client, relay_app, new_user):
+    admission_id = new_user()
+    assert client.post("/admin/active_sessions", json={}).status_code == 400
+    assert client.post("/admin/active_sessions", json={"admission_id": admission_id}).status_code == 200
+    assert admission_id in ids(relay_app.sessions)
+    assert client.delete(f"/admin/active_sessions/{admission_id}").status_code == 200
+    assert client.delete(f"/admin/active_sessions/{admission_id}").status_code == 404
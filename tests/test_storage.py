@@ -0,0 +1,80 @@
+import base64
+import hashlib
+
+import pytest
+
+from storage import TransferStore, StorageError, is_valid_name
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TransferStore(str(tmp_path / "storage"))
+
+
+def test_blobs_are_addressed_by_hash_and_stored_once(store):
+    digest = store.put_blob(b"ciphertext")
+    assert digest == hashlib.sha256(b"ciphertext").hexdigest()
+    assert store.put_blob(b"ciphertext") == digest
+    assert store.read_blob(digest) == b"ciphertext"
+    store.delete_blob(digest)
+    assert not store.has_blob(digest)
+
+
+def test_transfer_record_round_trip(store):
+    digest = store.put_blob(b"chunk")
+    record = store.save_transfer("alice", "bob", "k", "dir/name.txt", [{"index": 0, "size": 5, "hash": digest}])
+    assert record["filename"] == "name.txt"
+    assert store.load_transfer("bob", record["id"]) == record
+    assert store.delete_transfer("bob", record["id"])
+    assert store.load_transfer("bob", record["id"]) is None
+
+
+@pytest.mark.parametrize("name", ["bob", "a.b@c-d_e"])
+def test_valid_names(name):
+    assert is_valid_name(name)
+
+
+@pytest.mark.parametrize("name", ["bob\n", "", ".", "..", "a/b", "a b", 5, None])
+def test_invalid_names(name):
+    assert not is_valid_name(name)
+
+
+@pytest.mark.parametrize("recipient, transfer_id", [
+    ("bob\n", "0" * 32), ("bob", "0" * 32 + "\n"), ("../x", "0" * 32), ("bob", "xyz")
+])
+def test_paths_reject_invalid_names(store, recipient, transfer_id):
+    with pytest.raises(StorageError):
+        store.meta_path(recipient, transfer_id)
+
+
+def test_blob_path_rejects_trailing_newline(store):
+    with pytest.raises(StorageError):
+        store.blob_path("0" * 64 + "\n")
+
+
+def json_transfer(sender, recipient, **changes):
+    body = {"from": sender, "to": recipient, "encrypted_key": "k", "filename": "f",
+            "chunks": [{"index": 0, "data": base64.b64encode(b"x").decode()}]}
+    body.update(changes)
+    return body
+
+
+@pytest.mark.parametrize("changes", [
+    {"filename": 5},
+    {"filename": ["a"]},
+    {"to": "bob\n"},
+    {"chunks": [{"index": "0", "data": "eA=="}]},
+    {"chunks": [{"index": -1, "data": "eA=="}]},
+    {"chunks": [{"index": True, "data": "eA=="}]},
+    {"chunks": [{"index": 0, "data": 5}]},
+])
+def test_json_transfer_with_invalid_types_is_400(client, new_user, changes):
+    response = client.post("/transfer", json=json_transfer(new_user(), new_user(), **changes))
+    assert response.status_code == 400
+
+
+def test_upload_with_non_string_filename_is_400(client, new_user):
+    response = client.post("/uploads", json={
+        "from": new_user(), "to": new_user(), "encrypted_key": "k", "filename": {"a": 1}, "chunk_count": 1
+    })
+    assert response.status_code == 400
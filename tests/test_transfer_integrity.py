@@ -0,0 +1,110 @@
+import json
+import os
+
+import pytest
+
+from crypto_utils import (
+    build_manifest,
+    generate_aes_key,
+    merkle_root_mac,
+    verify_manifest,
+    verify_merkle_root_mac,
+    verify_merkle_proof,
+    merkle_proof,
+    compute_sha256,
+)
+from receiver_gui import receive_transfer
+from send_gui import send_file_resumable
+
+
+@pytest.fixture
+def sent(tmp_path, relay_client, relay_app, new_user):
+    """A three-chunk file sent through an upload session; returns (recipient, transfer, data)."""
+    sender, recipient = new_user(), new_user()
+    data = os.urandom(3 * 1024 * 1024 + 100)
+    source = tmp_path / "source.bin"
+    source.write_bytes(data)
+    send_file_resumable(sender, recipient, str(source))
+    transfers, _ = relay_app.list_indexed_transfers(recipient)
+    return recipient, transfers[0], data
+
+
+def edit_record(relay_app, recipient, transfer_id, change):
+    path = relay_app.store.meta_path(recipient, transfer_id)
+    with open(path) as f:
+        record = json.load(f)
+    change(record)
+    with open(path, "w") as f:
+        json.dump(record, f)
+
+
+def test_round_trip(tmp_path, sent, key_pair):
+    recipient, transfer, data = sent
+    save_path = tmp_path / "saved.bin"
+    receive_transfer(recipient, transfer, str(save_path), key_pair[0])
+    assert save_path.read_bytes() == data
+
+
+def test_truncated_manifest_is_refused(tmp_path, sent, key_pair, relay_app):
+    recipient, transfer, _ = sent
+
+    def drop_last_chunk(record):
+        record["chunks"].pop()
+        record["merkle_root"] = build_manifest(c["hash"] for c in record["chunks"])["root"]
+    edit_record(relay_app, recipient, transfer["id"], drop_last_chunk)
+
+    save_path = tmp_path / "saved.bin"
+    with pytest.raises(ValueError, match="not authenticated"):
+        receive_transfer(recipient, transfer, str(save_path), key_pair[0])
+    assert not save_path.exists()
+
+
+def test_missing_root_mac_is_refused(tmp_path, sent, key_pair, relay_app):
+    recipient, transfer, _ = sent
+    edit_record(relay_app, recipient, transfer["id"], lambda record: record.pop("root_mac"))
+    with pytest.raises(ValueError, match="not authenticated"):
+        receive_transfer(recipient, transfer, str(tmp_path / "saved.bin"), key_pair[0])
+
+
+def test_chunk_not_matching_its_leaf_is_refused(tmp_path, sent, key_pair, relay_app):
+    recipient, transfer, _ = sent
+    record = relay_app.store.load_transfer(recipient, transfer["id"])
+    first, second = record["chunks"][0]["hash"], record["chunks"][1]["hash"]
+    # Serve chunk 1's ciphertext under chunk 0's address
+    with open(relay_app.store.blob_path(second), "rb") as f:
+        swapped = f.read()
+    with open(relay_app.store.blob_path(first), "wb") as f:
+        f.write(swapped)
+
+    save_path = tmp_path / "saved.bin"
+    with pytest.raises(ValueError, match="Hash mismatch"):
+        receive_transfer(recipient, transfer, str(save_path), key_pair[0])
+    assert not save_path.exists()
+
+
+def test_invalid_root_mac_is_rejected_by_the_relay(client, new_user):
+    response = client.post("/transfer", json={
+        "from": new_user(), "to": new_user(), "encrypted_key": "k", "filename": "f",
+        "root_mac": "not hex", "chunks": [{"index": 0, "data": "AA=="}]
+    })
+    assert response.status_code == 400
+
+
+def test_root_mac_depends_on_key_and_root():
+    key = generate_aes_key()
+    root = build_manifest([compute_sha256(b"a"), compute_sha256(b"b")])["root"]
+    mac = merkle_root_mac(key, root)
+    assert verify_merkle_root_mac(key, root, mac)
+    assert not verify_merkle_root_mac(generate_aes_key(), root, mac)
+    assert not verify_merkle_root_mac(key, compute_sha256(b"other"), mac)
+    assert not verify_merkle_root_mac(key, root, None)
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 7])
+def test_merkle_proofs_verify_every_leaf(count):
+    leaves = [compute_sha256(bytes([i])) for i in range(count)]
+    manifest = build_manifest(leaves)
+    assert verify_manifest(manifest)
+    for index, leaf in enumerate(leaves):
+        assert verify_merkle_proof(leaf, merkle_proof(leaves, index), manifest["root"])
+    assert not verify_manifest(dict(manifest, leaves=leaves[:-1] or [compute_sha256(b"x")]))
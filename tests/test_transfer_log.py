@@ -0,0 +1,77 @@
+import json
+import threading
+
+import pytest
+
+from admin.transfer_log import TransferLog
+
+
+def entry(n, sender="alice", recipient="bob"):
+    return {"timestamp": f"2026-01-01T00:00:{n:02d}", "from": sender, "to": recipient, "filename": f"f{n}"}
+
+
+@pytest.fixture
+def log(tmp_path):
+    return TransferLog(str(tmp_path / "logs"), max_segment_bytes=300, max_segments=100)
+
+
+def names(entries):
+    return [e["filename"] for e in entries]
+
+
+def test_pages_newest_first_across_segments(log):
+    for n in range(10):
+        log.append(entry(n))
+    assert len(log.segments()) > 1
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = log.query(cursor=cursor, limit=3)
+        seen += names(page)
+        if cursor is None:
+            break
+    assert seen == [f"f{n}" for n in reversed(range(10))]
+
+
+def test_filters_by_time_and_user(log):
+    for n in range(10):
+        log.append(entry(n, recipient="carol" if n % 2 else "bob"))
+    page, _ = log.query(since=entry(3)["timestamp"], until=entry(8)["timestamp"], user="carol")
+    assert names(page) == ["f7", "f5"]
+
+
+def test_old_segments_are_dropped(tmp_path):
+    log = TransferLog(str(tmp_path / "logs"), max_segment_bytes=100, max_segments=2)
+    for n in range(20):
+        log.append(entry(n))
+    assert len(log.segments()) == 2
+    assert names(log.query(limit=1)[0]) == ["f19"]
+
+
+def test_concurrent_appends_are_all_kept(log):
+    threads = [threading.Thread(target=lambda n=n: log.append(entry(n % 60))) for n in range(50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(log.query(limit=1000)[0]) == 50
+
+
+def test_legacy_log_is_imported_once(log, tmp_path):
+    legacy = tmp_path / "transfer_logs.json"
+    legacy.write_text(json.dumps([entry(1), entry(2)]))
+    assert log.import_legacy(str(legacy)) == 2
+    assert not legacy.exists()
+    assert log.import_legacy(str(legacy)) == 0
+    assert names(log.query()[0]) == ["f2", "f1"]
+
+
+def test_malformed_cursor_is_rejected(log):
+    with pytest.raises(ValueError):
+        log.query(cursor="abc")
+
+
+def test_admin_logs_need_credentials(client):
+    assert client.get("/admin/logs").status_code == 401
+    assert client.get("/admin/logs", auth=("admin", "admin123")).status_code == 200
+    assert client.get("/admin/logs", auth=("admin", "admin123"), query_string={"since": "yesterday"}).status_code == 400
@@ -0,0 +1,87 @@
+import hashlib
+
+import pytest
+
+from transfer_format import encode_frame
+
+
+def open_upload(client, sender, recipient, chunk_count=2, **extra):
+    body = {"from": sender, "to": recipient, "encrypted_key": "k", "filename": "f.bin",
+            "chunk_count": chunk_count, "cipher": "aes-256-gcm"}
+    body.update(extra)
+    return client.post("/uploads", json=body)
+
+
+def put_chunk(client, upload_id, index, data, digest=None):
+    return client.put(f"/uploads/{upload_id}/chunks/{index}", data=encode_frame(index, data, digest))
+
+
+@pytest.mark.parametrize("body", [[1], "text", 5, None])
+def test_upload_body_that_is_not_an_object_is_400(client, body):
+    assert client.post("/uploads", json=body).status_code == 400
+
+
+def test_upload_without_json_is_400(client):
+    assert client.post("/uploads", data=b"not json", content_type="text/plain").status_code == 400
+
+
+def test_resumed_upload_reports_received_chunks(client, new_user):
+    upload_id = open_upload(client, new_user(), new_user()).get_json()["upload_id"]
+    assert put_chunk(client, upload_id, 1, b"second").status_code == 200
+
+    status = client.get(f"/uploads/{upload_id}").get_json()
+    assert status["received"] == [1]
+    assert status["missing"] == [0]
+    assert status["received_hashes"] == {"1": hashlib.sha256(b"second").hexdigest()}
+
+
+def test_complete_needs_every_chunk(client, new_user):
+    upload_id = open_upload(client, new_user(), new_user()).get_json()["upload_id"]
+    put_chunk(client, upload_id, 0, b"first")
+    response = client.post(f"/uploads/{upload_id}/complete", json={})
+    assert response.status_code == 409
+    assert response.get_json()["missing"] == [1]
+
+
+def test_complete_checks_the_merkle_root(client, new_user):
+    upload_id = open_upload(client, new_user(), new_user()).get_json()["upload_id"]
+    put_chunk(client, upload_id, 0, b"first")
+    put_chunk(client, upload_id, 1, b"second")
+    response = client.post(f"/uploads/{upload_id}/complete", json={"merkle_root": "0" * 64})
+    assert response.status_code == 409
+    assert client.post(f"/uploads/{upload_id}/complete", json={}).status_code == 200
+
+
+def test_chunk_must_match_its_digest_and_index(client, new_user):
+    upload_id = open_upload(client, new_user(), new_user()).get_json()["upload_id"]
+    assert put_chunk(client, upload_id, 0, b"data", "11" * 32).status_code == 400
+    assert client.put(f"/uploads/{upload_id}/chunks/1", data=encode_frame(0, b"data")).status_code == 400
+    assert put_chunk(client, upload_id, 2, b"data").status_code == 400
+
+
+def test_referenced_chunk_is_reused(client, new_user, relay_app):
+    sender, recipient = new_user(), new_user()
+    digest = relay_app.store.put_blob(b"kept")
+    response = open_upload(client, sender, recipient,
+                           references={"0": {"hash": digest, "aad_index": 0}})
+    assert response.get_json()["accepted_references"] == [0]
+    upload_id = response.get_json()["upload_id"]
+
+    put_chunk(client, upload_id, 1, b"new")
+    response = client.post(f"/uploads/{upload_id}/complete", json={})
+    assert response.status_code == 200
+    record = relay_app.store.load_transfer(recipient, response.get_json()["transfer_id"])
+    assert record["chunks"][0] == {"index": 0, "size": 4, "hash": digest, "aad_index": 0}
+
+
+@pytest.mark.parametrize("references", [
+    ["not", "a", "dict"],
+    {"0": "not a dict"},
+    {"0": {"hash": "../../etc/passwd", "aad_index": 0}},
+    {"0": {"hash": "a" * 64, "aad_index": -1}},
+    {"0": {"hash": "a" * 64, "aad_index": 0, "codec": "lzma"}},
+    {"5": {"hash": "a" * 64, "aad_index": 0}},
+    {"x": {"hash": "a" * 64, "aad_index": 0}},
+])
+def test_malformed_references_are_400(client, new_user, references):
+    assert open_upload(client, new_user(), new_user(), references=references).status_code == 400
@@ -0,0 +1,68 @@
+import io
+
+import pytest
+
+from transfer_format import (
+    CONTENT_TYPE,
+    TransferFormatError,
+    encode_end,
+    encode_frame,
+    encode_header,
+    read_frame_header,
+    read_header,
+)
+
+
+def framed_body(header, chunks):
+    parts = [encode_header(header)]
+    parts += [encode_frame(index, data) for index, data in enumerate(chunks)]
+    parts.append(encode_end())
+    return b"".join(parts)
+
+
+def post_framed(client, body):
+    return client.post("/transfer", data=body, headers={"Content-Type": CONTENT_TYPE})
+
+
+def test_framed_transfer_is_stored_and_served_back(client, new_user):
+    sender, recipient = new_user(), new_user()
+    header = {"from": sender, "to": recipient, "encrypted_key": "k", "filename": "f.bin",
+              "cipher": "aes-256-gcm"}
+    response = post_framed(client, framed_body(header, [b"one", b"two"]))
+    assert response.status_code == 200, response.get_json()
+    transfer_id = response.get_json()["transfer_id"]
+
+    stream = io.BytesIO(client.get(f"/transfers/{recipient}/{transfer_id}").get_data())
+    assert read_header(stream)["filename"] == "f.bin"
+    served = []
+    while (frame := read_frame_header(stream)) is not None:
+        served.append(stream.read(frame[3]))
+    assert served == [b"one", b"two"]
+
+
+@pytest.mark.parametrize("header", [[1, 2], "text", 3, None])
+def test_header_that_is_not_an_object_is_rejected(client, header):
+    body = encode_header(header) + encode_frame(0, b"data") + encode_end()
+    assert post_framed(client, body).status_code == 400
+
+
+@pytest.mark.parametrize("change", [
+    {"to": "../escape"}, {"cipher": "rot13"}, {"archive": "zip-bomb"}, {"receipt_hash": "nope"}
+])
+def test_invalid_header_fields_are_rejected(client, new_user, change):
+    header = dict({"from": new_user(), "to": new_user(), "encrypted_key": "k", "filename": "f"}, **change)
+    assert post_framed(client, framed_body(header, [b"data"])).status_code == 400
+
+
+def test_frame_digest_must_match(client, new_user):
+    header = {"from": new_user(), "to": new_user(), "encrypted_key": "k", "filename": "f"}
+    body = encode_header(header) + encode_frame(0, b"data", "11" * 32) + encode_end()
+    assert post_framed(client, body).status_code == 400
+
+
+def test_read_header_rejects_other_streams():
+    with pytest.raises(TransferFormatError):
+        read_header(io.BytesIO(b"XXXX" + bytes(16)))
+    with pytest.raises(TransferFormatError):
+        read_header(io.BytesIO(encode_header({"a": "x" * 100})), max_size=10)
+    assert read_header(io.BytesIO(encode_header({"a": 1}))) == {"a": 1}
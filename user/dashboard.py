@@ -1,38 +1,26 @@
-import json
 import tkinter as tk
 from tkinter import messagebox
 import requests
-import urllib3
 import os
+import sys
+import threading
 
 from encryption.send_gui import launch_send_gui
 from encryption.receiver_gui import launch_receive_gui
 
-# === CONFIG ===
-# Load server config from relay/config.json
-config_path = os.path.join(os.path.dirname(__file__), "..", "relay", "config.json")
-
-if not os.path.exists(config_path):
-    raise FileNotFoundError("Missing config.json file in relay/ directory.")
-
-with open(config_path, "r") as f:
-    config = json.load(f)
+# Same flat import as the encryption modules, so the whole client shares one relay connection pool
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "encryption"))
+from relay_client import relay
 
-relay_host = config.get("relay_host", "127.0.0.1")
-relay_port = config.get("relay_port", 5000)
-
-# Construct the full server URL
-RELAY_SERVER = f"https://{relay_host}:{relay_port}"
+# === CONFIG ===
 WINDOW_WIDTH = 450
 WINDOW_HEIGHT = 400
-
-# Suppress HTTPS warnings (for self-signed certs)
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+HEARTBEAT_INTERVAL_MS = 60 * 1000  # Relay drops sessions not seen for 3 minutes
 
 def launch_dashboard(admission_id, display_name):
     def refresh_user_list():
         try:
-            response = requests.get(f"{RELAY_SERVER}/users", verify=False)
+            response = relay.get("/users")
             if response.status_code == 200:
                 user_listbox.delete(0, tk.END)
                 users = response.json()
@@ -53,14 +41,16 @@ def launch_dashboard(admission_id, display_name):
             messagebox.showwarning("No recipient", "Please select a recipient.")
             return
 
-        selected_text = user_listbox.get(selected[0])
-
         try:
-            if "(" not in selected_text or ")" not in selected_text:
-                raise ValueError("Recipient ID format is invalid.")
-
-            recipient_admission_id = selected_text.split("(")[-1].replace(")", "").strip()
-            launch_send_gui(admission_id, recipient_admission_id)
+            # Several selected users get one fan-out transfer
+            recipient_ids = []
+            for i in selected:
+                selected_text = user_listbox.get(i)
+                if "(" not in selected_text or ")" not in selected_text:
+                    raise ValueError("Recipient ID format is invalid.")
+                recipient_ids.append(selected_text.split("(")[-1].replace(")", "").strip())
+
+            launch_send_gui(admission_id, recipient_ids)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to parse recipient ID.\nDetails: {str(e)}")
 
@@ -80,10 +70,27 @@ def launch_dashboard(admission_id, display_name):
             messagebox.showerror("Inbox Error", f"Failed to open inbox:\n{e}")
 
 
+    def send_heartbeat():
+        # Keeps this user listed as online; posted off the Tk thread so a
+        # slow relay never freezes the window. The inbox replaces this window
+        # and its new-transfer polls count as activity instead
+        def post():
+            try:
+                relay.post("/admin/active_sessions", json={"admission_id": admission_id}, timeout=10)
+            except requests.exceptions.RequestException:
+                pass
+
+        threading.Thread(target=post, daemon=True).start()
+        root.after(HEARTBEAT_INTERVAL_MS, send_heartbeat)
+
     def logout():
         print("Logout clicked")
         confirm = messagebox.askyesno("Logout", "Are you sure you want to logout?")
         if confirm:
+            try:
+                relay.delete(f"/admin/active_sessions/{admission_id}", timeout=10)
+            except requests.exceptions.RequestException:
+                pass  # The session expires on its own
             root.destroy()
 
 
@@ -106,7 +113,7 @@ def launch_dashboard(admission_id, display_name):
     user_frame = tk.LabelFrame(root, text="Available Users", padx=10, pady=10)
     user_frame.pack(padx=15, pady=10, fill="x")
 
-    user_listbox = tk.Listbox(user_frame, width=40, height=8)
+    user_listbox = tk.Listbox(user_frame, width=40, height=8, selectmode=tk.EXTENDED)
     user_listbox.pack(pady=5)
 
     button_frame = tk.Frame(root)
@@ -118,4 +125,5 @@ def launch_dashboard(admission_id, display_name):
     tk.Button(button_frame, text="🚪 Logout", width=20, command=logout).pack(pady=5)
 
     refresh_user_list()
+    root.after(HEARTBEAT_INTERVAL_MS, send_heartbeat)
     root.mainloop()
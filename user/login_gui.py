@@ -1,4 +1,3 @@
-import json
 import tkinter as tk
 from tkinter import messagebox
 import requests
@@ -8,21 +7,10 @@ import sys
 import subprocess
 from dashboard import launch_dashboard
 
-
 # === Server Address ===
-config_path = os.path.join(os.path.dirname(__file__), "..", "relay", "config.json")
-
-if not os.path.exists(config_path):
-    raise FileNotFoundError("Missing config.json file in relay/ directory.")
-
-with open(config_path, "r") as f:
-    config = json.load(f)
-
-relay_host = config.get("relay_host", "127.0.0.1")
-relay_port = config.get("relay_port", 5000)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "encryption"))
+from relay_client import relay
 
-# Construct the full server URL
-RELAY_SERVER = f"https://{relay_host}:{relay_port}"
 # === Centered Fixed Size ===
 WINDOW_WIDTH = 500
 WINDOW_HEIGHT = 350
@@ -43,7 +31,7 @@ def login_user():
         return
 
     try:
-        response = requests.get(f"{RELAY_SERVER}/users/{admission_id}", verify=False)
+        response = relay.get(f"/users/{admission_id}")
 
         if response.status_code == 404:
             messagebox.showerror("Login Failed", "User not found.")
@@ -65,11 +53,7 @@ def login_user():
 
             # ✅ Report session activity to admin
             try:
-                requests.post(
-                    f"{RELAY_SERVER}/admin/active_sessions",
-                    json={"admission_id": admission_id},
-                    verify=False
-                )
+                relay.post("/admin/active_sessions", json={"admission_id": admission_id})
             except Exception as e:
                 print(f"⚠️ Session logging failed: {e}")
 
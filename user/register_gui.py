@@ -1,37 +1,20 @@
-import json
 import tkinter as tk
 from tkinter import messagebox
-import requests
 import os
 import bcrypt
 import subprocess
 import sys
-import urllib3
 
 from cryptography.hazmat.primitives.asymmetric import rsa
 from cryptography.hazmat.primitives import serialization
 
-# === CONFIGURATION ===
-# Load server config from relay/config.json
-config_path = os.path.join(os.path.dirname(__file__), "..", "relay", "config.json")
-
-if not os.path.exists(config_path):
-    raise FileNotFoundError("Missing config.json file in relay/ directory.")
-
-with open(config_path, "r") as f:
-    config = json.load(f)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "encryption"))
+from relay_client import relay
 
-relay_host = config.get("relay_host", "127.0.0.1")
-relay_port = config.get("relay_port", 5000)
-
-# Construct the full server URL
-RELAY_SERVER = f"https://{relay_host}:{relay_port}"
+# === CONFIGURATION ===
 WINDOW_WIDTH = 400
 WINDOW_HEIGHT = 300
 
-# ✅ Suppress SSL warnings (only in development with self-signed certs)
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
 # === RSA Key Pair Generation ===
 def generate_rsa_key_pair(admission_id):
     private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
@@ -76,7 +59,7 @@ def register_user():
     }
 
     try:
-        response = requests.post(f"{RELAY_SERVER}/register", json=payload, verify=False)
+        response = relay.post("/register", json=payload)
         if response.status_code == 201:
             messagebox.showinfo("Success", f"User registered successfully!\nAdmission ID: {admission_id}")
             root.destroy()